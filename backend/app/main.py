@@ -1,17 +1,38 @@
-from fastapi import FastAPI, WebSocket
+from fastapi import Depends, FastAPI, Request, WebSocket
 from fastapi.middleware.cors import CORSMiddleware
-from fastapi.responses import JSONResponse
-from .routers import audio, spam_reports
-from .database import engine
+from fastapi.responses import JSONResponse, Response
+from sqlalchemy.orm import Session
+from .routers import audio, jobs, spam_reports, uploads
+from .database import engine, get_db
 from . import models
 from .services.transcribe_service import TranscriptionHandler
+from .services.s3_service import ArtifactJanitor, apply_lifecycle_rules
+from .services.aws_clients import warm_up
+from .services.transcription_jobs import transcription_jobs
+from .services.asr import shutdown_providers
+from .services.cpu_pool import cpu_pool
+from .services.gemini_service import gemini_service
+from .services.job_queue import queue_stats
+from .services.logging_config import configure_logging
+from .services.metrics import MetricsMiddleware, render_metrics
+from .services.profiling import PROFILING, ProfilingMiddleware
+from .services.tracing import TracingMiddleware, setup_tracing, shutdown_tracing
+from .services.temp_reaper import TEMP_REAPER_ENABLED, temp_reaper
+from .services.resilience import DeadlineExceeded, DeadlineMiddleware, DependencyUnavailable, dependency_stats
 from app.routers import video
 
+import logging
+import os
 import uuid
 
+configure_logging()
+logger = logging.getLogger(__name__)
+
 # Create all tables
 models.Base.metadata.create_all(bind=engine)
 
+setup_tracing()
+
 app = FastAPI(title="Spam Call API")
 
 origins = ["*"]
@@ -24,10 +45,63 @@ app.add_middleware(
     allow_headers=["*"],
     expose_headers=["*"]
 )
+app.add_middleware(
+    DeadlineMiddleware,
+    route_seconds={f"{video.router.prefix}/detect-deepfake": video.LIVENESS_DEADLINE_SECONDS}
+)
+app.add_middleware(MetricsMiddleware)
+if PROFILING != 'off':
+    app.add_middleware(ProfilingMiddleware)
+app.add_middleware(TracingMiddleware)
 
-app.include_router(audio.router, prefix="/audio", tags=["audio"])
+app.include_router(audio.router)
 app.include_router(video.router)
 app.include_router(spam_reports.router)
+app.include_router(jobs.router)
+app.include_router(uploads.router)
+
+artifact_janitor = None
+
+@app.exception_handler(DependencyUnavailable)
+async def dependency_unavailable_handler(request: Request, exc: DependencyUnavailable):
+    logger.warning(f"{request.url.path}: {str(exc)}")
+    headers = {"Retry-After": str(max(int(exc.retry_after), 1))}
+    return JSONResponse(
+        content={"detail": str(exc), "dependency": exc.dependency},
+        status_code=504 if isinstance(exc, DeadlineExceeded) else 503,
+        headers=headers
+    )
+
+@app.on_event("startup")
+async def start_background_tasks():
+    global artifact_janitor
+    try:
+        warm_up('s3', 'rekognition', 'transcribe')
+    except Exception as e:
+        logger.error(f"Failed to warm up AWS clients: {str(e)}")
+    if TEMP_REAPER_ENABLED:
+        temp_reaper.start()
+    bucket = os.getenv('S3_BUCKET')
+    if not bucket:
+        return
+    if os.getenv('S3_APPLY_LIFECYCLE_RULES', 'false').lower() == 'true':
+        try:
+            apply_lifecycle_rules(video.s3_client, bucket)
+        except Exception as e:
+            logger.error(f"Failed to apply S3 lifecycle rules: {str(e)}")
+    if os.getenv('S3_JANITOR_ENABLED', 'true').lower() == 'true':
+        artifact_janitor = ArtifactJanitor(video.s3_client, bucket)
+        artifact_janitor.start()
+
+@app.on_event("shutdown")
+async def stop_background_tasks():
+    if artifact_janitor:
+        await artifact_janitor.stop()
+    await transcription_jobs.stop()
+    await temp_reaper.stop()
+    shutdown_providers()
+    cpu_pool.shutdown()
+    shutdown_tracing()
 
 
 
@@ -37,3 +111,32 @@ async def health_check():
         content={"status": "healthy"},
         status_code=200
     )
+
+@app.get("/health/cpu-pool")
+async def cpu_pool_stats():
+    return cpu_pool.stats()
+
+@app.get("/health/llm-cache")
+async def llm_cache_stats():
+    return gemini_service.cache.stats()
+
+@app.get("/health/llm-batcher")
+async def llm_batcher_stats():
+    return gemini_service.batcher.stats() if gemini_service.batcher else {"enabled": False}
+
+@app.get("/health/jobs")
+def jobs_health(db: Session = Depends(get_db)):
+    return queue_stats(db)
+
+@app.get("/health/temp-reaper")
+async def temp_reaper_stats():
+    return temp_reaper.stats()
+
+@app.get("/health/dependencies")
+async def dependencies_health():
+    return dependency_stats()
+
+@app.get("/metrics", include_in_schema=False)
+async def prometheus_metrics():
+    body, content_type = render_metrics()
+    return Response(content=body, media_type=content_type)
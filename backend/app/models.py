@@ -1,9 +1,10 @@
-from sqlalchemy import Column, Integer, String, DateTime, Boolean, LargeBinary, ForeignKey, Text
+from sqlalchemy import Column, Integer, Float, String, DateTime, Boolean, LargeBinary, ForeignKey, Text, Index
 from sqlalchemy.orm import relationship
 from sqlalchemy.sql import func
 from .database import Base
-from pydantic import BaseModel
+from pydantic import BaseModel, Field
 from datetime import datetime
+from enum import Enum
 from typing import Optional
 
 # SQLAlchemy Models
@@ -44,6 +45,21 @@ class Transcription(Base):
     created_at = Column(DateTime(timezone=True), server_default=func.now())
     
     audio_file = relationship("AudioFile", back_populates="transcriptions")
+    segments = relationship("TranscriptSegment", back_populates="transcription", order_by="TranscriptSegment.position")
+
+class TranscriptSegment(Base):
+    """One result of a transcription's timeline, with its word timings as JSON."""
+    __tablename__ = "transcript_segments"
+
+    id = Column(Integer, primary_key=True, index=True)
+    transcription_id = Column(Integer, ForeignKey("transcriptions.id"), nullable=False, index=True)
+    position = Column(Integer, nullable=False)
+    start_time = Column(Float, nullable=False)
+    end_time = Column(Float, nullable=False)
+    text = Column(Text, nullable=False)
+    words = Column(Text, nullable=False, default="[]")
+
+    transcription = relationship("Transcription", back_populates="segments")
 
 class SpamReport(Base):
     __tablename__ = "spam_reports"
@@ -64,6 +80,42 @@ class AudioHash(Base):
     created_at = Column(DateTime(timezone=True), server_default=func.now())
     matched_count = Column(Integer, default=0)
 
+class Job(Base):
+    __tablename__ = "jobs"
+    __table_args__ = (Index("ix_jobs_status_run_after", "status", "run_after"),)
+
+    id = Column(Integer, primary_key=True, index=True)
+    kind = Column(String, nullable=False)
+    idempotency_key = Column(String, unique=True)
+    payload = Column(Text, nullable=False)
+    status = Column(String, nullable=False, default="queued")
+    stage = Column(String)
+    result = Column(Text)
+    error = Column(Text)
+    attempts = Column(Integer, nullable=False, default=0)
+    max_attempts = Column(Integer, nullable=False, default=5)
+    run_after = Column(DateTime, nullable=False)
+    locked_by = Column(String)
+    locked_until = Column(DateTime)
+    created_at = Column(DateTime(timezone=True), server_default=func.now())
+    finished_at = Column(DateTime)
+
+class ResumableUpload(Base):
+    __tablename__ = "resumable_uploads"
+
+    id = Column(String, primary_key=True)
+    target = Column(String, nullable=False)
+    filename = Column(String, nullable=False)
+    content_type = Column(String, nullable=False)
+    length = Column(Integer, nullable=False)
+    offset = Column(Integer, nullable=False, default=0)
+    fields = Column(Text, nullable=False)
+    status = Column(String, nullable=False, default="open")
+    sha256 = Column(String)
+    result = Column(Text)
+    created_at = Column(DateTime(timezone=True), server_default=func.now())
+    expires_at = Column(DateTime, nullable=False, index=True)
+
 # Pydantic Models for API
 class AudioCreate(BaseModel):
     filename: str
@@ -118,3 +170,14 @@ class AudioHashResponse(BaseModel):
 
     class Config:
         from_attributes = True
+
+class FraudClassification(str, Enum):
+    FRAUD = "FRAUD"
+    LEGITIMATE = "LEGITIMATE"
+
+class FraudAnalysis(BaseModel):
+    classification: FraudClassification
+    confidence: float = Field(ge=0, le=1)
+
+class FraudAnalysisItem(FraudAnalysis):
+    id: str
@@ -1,22 +1,19 @@
-from fastapi import APIRouter, UploadFile, File, Depends, HTTPException, Form
+from fastapi import APIRouter, UploadFile, File, Depends, HTTPException, Form, Header, Query
 from fastapi.responses import StreamingResponse, JSONResponse
-from sqlalchemy.orm import Session
-from ..models import AudioFile, AudioCreate, AudioResponse, DemoAudio, DemoCreate, DemoResponse, Transcription, AudioHash
+from sqlalchemy.orm import Session, defer
+from starlette.background import BackgroundTask
+from ..models import AudioFile, AudioCreate, AudioResponse, DemoAudio, DemoCreate, DemoResponse, AudioHash
 from ..database import get_db
 import io
 from sqlalchemy import func
 from datetime import datetime, timedelta
-from ..services.transcribe_service import process_audio_stream, process_audio_file
-from typing import Callable, Dict
+from ..services.transcribe_service import process_audio_stream, process_audio_file, transcribe_service
+from ..services.transcription_jobs import transcription_jobs
+from typing import Callable, Dict, Literal, Optional
 import logging
 import os
 import uuid
 import asyncio
-import aiofile
-from amazon_transcribe.client import TranscribeStreamingClient
-from amazon_transcribe.handlers import TranscriptResultStreamHandler
-from amazon_transcribe.model import TranscriptEvent
-from pydub import AudioSegment
 import shutil
 import subprocess
 import re
@@ -25,10 +22,35 @@ from sse_starlette.sse import EventSourceResponse
 from fastapi import WebSocket, WebSocketDisconnect
 from typing import Dict
 from ..services.gemini_service import gemini_service
-import hashlib
+from ..services.audio_feeder import PacingMode
+from ..services.audio_pipeline import (
+    AudioDecodeError,
+    decode_stored_audio,
+    delete_stored_audio,
+    new_transcription,
+    open_stored_audio_session
+)
+from ..services.parallel_transcribe import transcribe_parallel
+from ..services.asr import AsrProvider, AsrProviderError, get_provider
+from ..services.audio_tasks import sha256_fileobj
+from ..services.scratch import remove_scratch_file, scratch_path
+from ..services.uploads import file_size, store_audio_file, store_demo_file
+from ..services import metrics, tracing
+from ..services.cpu_pool import CpuPoolBusy, cpu_pool
+from ..services.resilience import DependencyUnavailable
+from ..services.transcript_stream import (
+    DeltaEncoder,
+    SSE_COALESCE_MS,
+    SSE_MAX_COALESCE_MS,
+    SSE_PING_SECONDS,
+    SSE_SEND_TIMEOUT_SECONDS
+)
 from pydantic import BaseModel
 
-router = APIRouter()
+router = APIRouter(
+    prefix="/audio",
+    tags=["audio"]
+)
 logger = logging.getLogger(__name__)
 
 class AudioHashResponse(BaseModel):
@@ -48,28 +70,23 @@ async def upload_audio(
     category: str = "spam",
     description: str = "",
     duration: int = 0,
+    idempotency_key: Optional[str] = Header(None, alias="Idempotency-Key"),
     db: Session = Depends(get_db)
 ):
     try:
-        contents = await file.read()
+        size = file.size if file.size is not None else file_size(file.file)
+        metrics.observe(metrics.UPLOAD_BYTES, size, "db")
         
         is_temporary = category == 'temp_recording'
         
-        audio_file = AudioFile(
-            filename=file.filename,
-            content_type=file.content_type,
-            category=category,
-            description=description,
-            duration=duration,
-            audio_data=contents,
-            is_temporary=is_temporary
+        audio_id, job = await asyncio.to_thread(
+            store_audio_file, db, file.file, size, file.filename, file.content_type,
+            category, description, duration, is_temporary,
+            f"upload:{idempotency_key}" if idempotency_key else None
         )
-        
-        db.add(audio_file)
         db.commit()
-        db.refresh(audio_file)
         
-        return {"id": audio_file.id}
+        return {"id": audio_id, "job_id": job.id if job else None}
     except Exception as e:
         db.rollback()
         raise HTTPException(status_code=500, detail=str(e))
@@ -84,19 +101,13 @@ async def upload_demo(
     db: Session = Depends(get_db)
 ):
     try:
-        contents = await file.read()
+        size = file.size if file.size is not None else file_size(file.file)
+        metrics.observe(metrics.UPLOAD_BYTES, size, "db")
         
-        demo_audio = DemoAudio(
-            title=title,
-            filename=file.filename,
-            content_type=file.content_type,
-            category=category,
-            description=description,
-            duration=duration,
-            audio_data=contents
+        demo_audio = await asyncio.to_thread(
+            store_demo_file, db, file.file, size, file.filename, file.content_type,
+            title, category, description, duration
         )
-        
-        db.add(demo_audio)
         db.commit()
         db.refresh(demo_audio)
         
@@ -211,8 +222,29 @@ def get_audio_stats(db: Session = Depends(get_db)):
         }
     }
 
+def resolve_asr_provider(name: Optional[str]) -> AsrProvider:
+    try:
+        return get_provider(name)
+    except AsrProviderError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+def save_upload(file: UploadFile, path: str):
+    file.file.seek(0)
+    with open(path, "wb") as f:
+        shutil.copyfileobj(file.file, f, 1024 * 1024)
+
+async def upload_sha256(file: UploadFile) -> str:
+    """
+    Hashes an upload's spooled file in chunks on a thread; hashlib releases
+    the GIL, so the loop keeps running and the file is never loaded whole.
+    """
+    size = file.size if file.size is not None else file_size(file.file)
+    metrics.observe(metrics.UPLOAD_BYTES, size, "hash")
+    return await asyncio.to_thread(sha256_fileobj, file.file)
+
 @router.post("/test")
-async def test_transcribe(file: UploadFile = File(...)):
+async def test_transcribe(file: UploadFile = File(...), provider: Optional[str] = None):
+    asr_provider = resolve_asr_provider(provider)
     temp_file_path = None
     wav_file_path = None
     
@@ -227,197 +259,212 @@ async def test_transcribe(file: UploadFile = File(...)):
             )
         
         # Generate unique temp file names
-        temp_file_path = f"temp_{uuid.uuid4()}_{file.filename}"
-        wav_file_path = f"temp_{uuid.uuid4()}.wav"
+        temp_file_path = scratch_path(file.filename)
+        wav_file_path = scratch_path(suffix=".wav")
         
         # Save uploaded file
-        contents = await file.read()
-        with open(temp_file_path, "wb") as f:
-            f.write(contents)
+        await asyncio.to_thread(save_upload, file, temp_file_path)
+        metrics.observe(metrics.UPLOAD_BYTES, file.size or os.path.getsize(temp_file_path), asr_provider.name)
         
         try:
-            # Convert to WAV using ffmpeg directly
-            subprocess.run([
-                'ffmpeg', '-i', temp_file_path,
-                '-acodec', 'pcm_s16le',
-                '-ac', '1',
-                '-ar', '16000',
-                wav_file_path
-            ], check=True, capture_output=True)
+            # Convert to WAV with ffmpeg, off the event loop
+            with metrics.timed(metrics.AUDIO_DECODE_SECONDS, asr_provider.name):
+                await cpu_pool.run_subprocess([
+                    'ffmpeg', '-nostdin', '-i', temp_file_path,
+                    '-acodec', 'pcm_s16le',
+                    '-ac', '1',
+                    '-ar', '16000',
+                    wav_file_path
+                ])
             
             logger.info(f"Successfully converted audio to WAV format")
             
-            class MyEventHandler(TranscriptResultStreamHandler):
-                def __init__(self, stream):
-                    self.full_transcript = ""
-                    super().__init__(stream)
-
-                async def handle_transcript_event(self, transcript_event: TranscriptEvent):
-                    results = transcript_event.transcript.results
-                    for result in results:
-                        for alt in result.alternatives:
-                            transcript = alt.transcript
-                            if result.is_partial:
-                                print(f"[LIVE] {transcript}")
-                            else:
-                                print(f"[FINAL] {transcript}")
-                                self.full_transcript += transcript + " "
-
-            async def transcribe_audio(file_path: str):
-                client = TranscribeStreamingClient(region=os.getenv('AWS_REGION'))
-                stream = await client.start_stream_transcription(
-                    language_code="en-US",
-                    media_sample_rate_hz=16000,
-                    media_encoding="pcm",
-                )
-
-                async def write_chunks():
-                    async with aiofile.AIOFile(file_path, 'rb') as afp:
-                        reader = aiofile.Reader(afp, chunk_size=1024 * 16)
-                        async for chunk in reader:
-                            await stream.input_stream.send_audio_event(audio_chunk=chunk)
-                    await stream.input_stream.end_stream()
-
-                handler = MyEventHandler(stream.output_stream)
-                await asyncio.gather(write_chunks(), handler.handle_events())
-                return {"transcript": handler.full_transcript}
-
-            print("\n=== Starting Transcription ===")
-            print("(Partial results will update in place, final results on new lines)\n")
-            
-            result = await transcribe_audio(wav_file_path)
+            result = await process_audio_file(wav_file_path, pace=PacingMode.UNTHROTTLED, provider=asr_provider)
             
             return JSONResponse(content={
                 "message": "Test transcription completed",
-                "transcription": result["transcript"]
+                "transcription": result["transcription"]
             })
 
         except subprocess.CalledProcessError as e:
             logger.error(f"FFmpeg error: {e.stderr.decode()}")
             raise HTTPException(status_code=500, detail=f"Error converting audio: {e.stderr.decode()}")
             
+    except (HTTPException, DependencyUnavailable):
+        raise
+    except CpuPoolBusy as e:
+        raise HTTPException(status_code=503, detail=str(e))
     except Exception as e:
         logger.error(f"Test transcription error: {str(e)}")
         raise HTTPException(status_code=500, detail=str(e))
         
     finally:
-        # Cleanup temp files
+        # ffmpeg has exited by now; anything that cannot be removed yet is
+        # left to the scratch sweep
         for file_path in [temp_file_path, wav_file_path]:
-            if file_path and os.path.exists(file_path):
-                try:
-                    await asyncio.sleep(0.1)  # Small delay to ensure file handle is released
-                    os.remove(file_path)
-                    logger.info(f"Cleaned up temp file: {file_path}")
-                except Exception as e:
-                    logger.warning(f"Failed to cleanup temp file: {e}")
+            remove_scratch_file(file_path)
 
-@router.get("/realtimetranscribe/{demo_id}")
-async def realtime_demo_transcription(demo_id: int, db: Session = Depends(get_db)):
-    async def event_generator():
-        temp_file_path = None
-        wav_file_path = None
-        try:
-            # Get demo audio from database
-            demo = db.query(DemoAudio).filter(DemoAudio.id == demo_id).first()
-            if not demo:
-                yield {
-                    "event": "error",
-                    "data": "Demo not found"
-                }
-                return
-
-            # Store category for later use
-            demo_category = demo.category
-            
-            # Create temporary files with unique names
-            temp_file_path = f"temp_{uuid.uuid4()}_{demo.filename}"
-            wav_file_path = f"temp_{uuid.uuid4()}.wav"
-            
-            # Save the audio data to a temporary file
-            with open(temp_file_path, "wb") as f:
-                f.write(demo.audio_data)
-            
-            try:
-                # Convert to WAV using ffmpeg
-                subprocess.run([
-                    'ffmpeg', '-i', temp_file_path,
-                    '-acodec', 'pcm_s16le',
-                    '-ac', '1',
-                    '-ar', '16000',
-                    wav_file_path
-                ], check=True, capture_output=True)
-                
-                logger.info(f"Successfully converted demo audio to WAV format")
-                
-                client = TranscribeStreamingClient(region=os.getenv('AWS_REGION'))
-                stream = await client.start_stream_transcription(
-                    language_code="en-US",
-                    media_sample_rate_hz=16000,
-                    media_encoding="pcm"
-                )
-
-                async def write_chunks():
-                    async with aiofile.AIOFile(wav_file_path, 'rb') as afp:
-                        reader = aiofile.Reader(afp, chunk_size=1024 * 16)
-                        async for chunk in reader:
-                            await stream.input_stream.send_audio_event(audio_chunk=chunk)
-                    await stream.input_stream.end_stream()
-
-                # Start writing chunks in the background
-                asyncio.create_task(write_chunks())
-
-                # Handle the transcription results
-                async for event in stream.output_stream:
-                    results = event.transcript.results
-                    for result in results:
-                        for alt in result.alternatives:
-                            transcript = alt.transcript
-                            yield {
-                                "event": "message",
-                                "data": json.dumps({
-                                    "live": result.is_partial,
-                                    "transcription": transcript
-                                })
-                            }
-
-            except Exception as e:
-                logger.error(f"Transcription error: {str(e)}")
-                yield {
-                    "event": "error",
-                    "data": str(e)
-                }
+def format_transcript_event(update, encoder: Optional[DeltaEncoder] = None) -> Dict:
+    if encoder is None:
+        return {
+            "event": "message",
+            "data": json.dumps({
+                "live": update.is_partial,
+                "transcription": update.text
+            })
+        }
+    return {
+        "event": "delta",
+        "data": json.dumps(encoder.encode(update), separators=(',', ':'))
+    }
 
-        except Exception as e:
-            logger.error(f"Demo transcription error: {str(e)}")
+async def stored_audio_events(
+    model,
+    row_id: int,
+    filename: str,
+    encoder: Optional[DeltaEncoder],
+    coalesce_ms: int,
+    provider: Optional[AsrProvider] = None
+):
+    try:
+        async with open_stored_audio_session(model, row_id, filename, provider) as session:
+            first = True
+            async for update in session.updates(coalesce_ms):
+                if first:
+                    first = False
+                    tracing.add_event("sse.first_event")
+                yield format_transcript_event(update, encoder)
             yield {
-                "event": "error",
-                "data": str(e)
+                "event": "stats",
+                "data": json.dumps(session.stats())
             }
-        
-        finally:
-            # Cleanup temp files
-            for file_path in [temp_file_path, wav_file_path]:
-                if file_path and os.path.exists(file_path):
-                    try:
-                        await asyncio.sleep(0.1)  # Small delay to ensure file handle is released
-                        os.remove(file_path)
-                        logger.info(f"Cleaned up temp file: {file_path}")
-                    except Exception as e:
-                        logger.warning(f"Failed to cleanup temp file: {e}")
-            
-            # Delete user recording after transcription if category is user_recording
-            try:
-                if demo and demo_category == 'user_recording':
-                    logger.info(f"Deleting user recording with ID: {demo_id}")
-                    db.delete(demo)
-                    db.commit()
-                    logger.info(f"Successfully deleted user recording: {demo_id}")
-            except Exception as e:
-                logger.error(f"Failed to delete user recording {demo_id}: {str(e)}")
-                db.rollback()
+    except Exception as e:
+        logger.error(f"Transcription error for {model.__name__} {row_id}: {str(e)}")
+        yield {
+            "event": "error",
+            "data": str(e)
+        }
+
+async def error_events(message: str):
+    yield {
+        "event": "error",
+        "data": message
+    }
+
+def transcription_response(events, background: Optional[BackgroundTask] = None) -> EventSourceResponse:
+    return EventSourceResponse(
+        events,
+        background=background,
+        ping=SSE_PING_SECONDS,
+        send_timeout=SSE_SEND_TIMEOUT_SECONDS
+    )
+
+@router.get("/realtimetranscribe/{demo_id}")
+async def realtime_demo_transcription(
+    demo_id: int,
+    protocol: Literal["full", "delta"] = "full",
+    coalesce_ms: int = Query(SSE_COALESCE_MS, ge=0, le=SSE_MAX_COALESCE_MS),
+    provider: Optional[str] = None,
+    db: Session = Depends(get_db)
+):
+    """
+    Streams a live transcription of a demo recording over SSE.
+
+    ``protocol=full`` (the default) sends the whole current text of a
+    segment in every ``message`` event. ``protocol=delta`` sends ``delta``
+    events of the form ``{"seg", "off", "text", "live"}`` where the client
+    keeps ``text[:off]`` of the segment and appends the new text.
+
+    ``provider`` selects the ASR backend (``transcribe`` or ``vosk``) and
+    defaults to ``ASR_PROVIDER``.
+    """
+    asr_provider = resolve_asr_provider(provider)
+    demo = db.query(DemoAudio).options(defer(DemoAudio.audio_data)).filter(
+        DemoAudio.id == demo_id
+    ).first()
+    if not demo:
+        return transcription_response(error_events("Demo not found"))
+
+    # Recordings uploaded by the app through /upload-demo are one-off
+    background = None
+    if demo.category == 'user_recording':
+        background = BackgroundTask(delete_stored_audio, DemoAudio, demo_id)
+
+    encoder = DeltaEncoder() if protocol == "delta" else None
+    return transcription_response(
+        stored_audio_events(DemoAudio, demo.id, demo.filename, encoder, coalesce_ms, asr_provider),
+        background=background
+    )
+
+@router.get("/realtimetranscribe-recording/{recording_id}")
+async def realtime_recording_transcription(
+    recording_id: int,
+    protocol: Literal["full", "delta"] = "full",
+    coalesce_ms: int = Query(SSE_COALESCE_MS, ge=0, le=SSE_MAX_COALESCE_MS),
+    provider: Optional[str] = None,
+    db: Session = Depends(get_db)
+):
+    """
+    Streams a live transcription of a user recording (``AudioFile``) over
+    SSE, using the same events as ``/realtimetranscribe/{demo_id}``.
+    Temporary recordings are deleted once the response has finished.
+    """
+    asr_provider = resolve_asr_provider(provider)
+    recording = db.query(AudioFile).options(defer(AudioFile.audio_data)).filter(
+        AudioFile.id == recording_id
+    ).first()
+    if not recording:
+        return transcription_response(error_events("Recording not found"))
 
-    return EventSourceResponse(event_generator())
+    background = None
+    if recording.is_temporary:
+        background = BackgroundTask(delete_stored_audio, AudioFile, recording_id)
+
+    encoder = DeltaEncoder() if protocol == "delta" else None
+    return transcription_response(
+        stored_audio_events(AudioFile, recording.id, recording.filename, encoder, coalesce_ms, asr_provider),
+        background=background
+    )
+
+@router.post("/{audio_id}/transcribe-parallel")
+async def transcribe_recording_parallel(
+    audio_id: int,
+    provider: Optional[str] = None,
+    db: Session = Depends(get_db)
+):
+    """
+    Transcribes a long recording by streaming overlapping segments to
+    Transcribe concurrently and stores the stitched text as a
+    ``Transcription``, with its segment and word timeline as
+    ``TranscriptSegment`` rows. Returns the text with the timeline.
+    """
+    asr_provider = resolve_asr_provider(provider)
+    audio_file = db.query(AudioFile).options(defer(AudioFile.audio_data)).filter(
+        AudioFile.id == audio_id
+    ).first()
+    if not audio_file:
+        raise HTTPException(status_code=404, detail="Audio not found")
+
+    try:
+        with metrics.timed(metrics.AUDIO_DECODE_SECONDS, asr_provider.name):
+            pcm = await decode_stored_audio(AudioFile, audio_id, audio_file.filename)
+        result = await transcribe_parallel(pcm, provider=asr_provider)
+    except AudioDecodeError as e:
+        raise HTTPException(status_code=422, detail=str(e))
+    except DependencyUnavailable:
+        raise
+    except CpuPoolBusy as e:
+        raise HTTPException(status_code=503, detail=str(e))
+    except Exception as e:
+        logger.error(f"Parallel transcription of audio {audio_id} failed: {str(e)}")
+        raise HTTPException(status_code=500, detail=str(e))
 
+    transcription = new_transcription(audio_id, result)
+    db.add(transcription)
+    db.commit()
+    db.refresh(transcription)
+    logger.info(f"Stored transcription {transcription.id} for audio {audio_id}: {result['stats']}")
+    return {"transcription_id": transcription.id, **result}
 
 
 class TextAnalysisRequest(BaseModel):
@@ -430,6 +477,59 @@ async def analyze_fraud(request: TextAnalysisRequest) -> Dict:
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
+@router.post("/analyze_fraud/stream")
+async def analyze_fraud_stream(request: TextAnalysisRequest):
+    """
+    Streams a fraud analysis over SSE: a ``verdict`` event with the
+    classification as soon as the model has produced it, then a ``result``
+    event with the validated ``{"classification", "confidence"}``.
+    """
+    async def events():
+        try:
+            async for update in gemini_service.analyze_fraud_stream(request.text):
+                event = update.pop("type")
+                yield {
+                    "event": event,
+                    "data": json.dumps(update)
+                }
+        except Exception as e:
+            logger.error(f"Streaming fraud analysis failed: {str(e)}")
+            yield {
+                "event": "error",
+                "data": str(e)
+            }
+
+    return transcription_response(events())
+
+BATCH_MEDIA_FORMATS = {'mp3', 'mp4', 'wav', 'flac', 'ogg', 'amr', 'webm', 'm4a'}
+
+@router.post("/transcription-jobs")
+async def create_transcription_job(file: UploadFile = File(...)):
+    media_format = os.path.splitext(file.filename or '')[1].lstrip('.').lower() or 'mp3'
+    if media_format not in BATCH_MEDIA_FORMATS:
+        raise HTTPException(status_code=400, detail=f"Unsupported media format: {media_format}")
+    try:
+        contents = await file.read()
+        metrics.observe(metrics.UPLOAD_BYTES, len(contents), "s3")
+        job = await transcribe_service.submit_transcription(contents, media_format=media_format)
+        return job.to_dict()
+    except DependencyUnavailable:
+        raise
+    except Exception as e:
+        logger.error(f"Failed to submit transcription job: {str(e)}")
+        raise HTTPException(status_code=500, detail=str(e))
+
+@router.get("/transcription-jobs")
+async def list_transcription_jobs():
+    return [job.to_dict() for job in transcription_jobs.list()]
+
+@router.get("/transcription-jobs/{job_name}")
+async def get_transcription_job(job_name: str):
+    job = transcription_jobs.get(job_name)
+    if not job:
+        raise HTTPException(status_code=404, detail="Transcription job not found")
+    return job.to_dict()
+
 @router.post("/upload-temp")
 async def upload_temp_audio(
     file: UploadFile = File(...),
@@ -439,24 +539,17 @@ async def upload_temp_audio(
     db: Session = Depends(get_db)
 ):
     try:
-        contents = await file.read()
+        size = file.size if file.size is not None else file_size(file.file)
+        metrics.observe(metrics.UPLOAD_BYTES, size, "db")
         
-        audio_file = AudioFile(
-            filename=file.filename,
-            content_type=file.content_type,
-            category=category,
-            description=description,
-            duration=duration,
-            audio_data=contents,
-            is_temporary=True  # New field to mark temporary files
+        audio_id, _ = await asyncio.to_thread(
+            store_audio_file, db, file.file, size, file.filename, file.content_type,
+            category, description, duration, True
         )
-        
-        db.add(audio_file)
         db.commit()
-        db.refresh(audio_file)
         
         return {
-            "id": audio_file.id,
+            "id": audio_id,
             "message": "Temporary recording uploaded successfully"
         }
     except Exception as e:
@@ -509,15 +602,7 @@ async def calculate_sha256(file: UploadFile = File(...)):
     Calculate SHA256 hash of an uploaded audio/video file.
     """
     try:
-        # Initialize SHA256 hash object
-        sha256_hash = hashlib.sha256()
-        
-        # Read and update hash in chunks to handle large files efficiently
-        while chunk := await file.read(8192):  # 8KB chunks
-            sha256_hash.update(chunk)
-            
-        # Get the final hash
-        file_hash = sha256_hash.hexdigest()
+        file_hash = await upload_sha256(file)
         
         return {
             "filename": file.filename,
@@ -546,10 +631,7 @@ async def check_audio_hash(
 ):
     try:
         # Calculate SHA256 of uploaded file
-        sha256_hash = hashlib.sha256()
-        while chunk := await file.read(8192):
-            sha256_hash.update(chunk)
-        file_hash = sha256_hash.hexdigest()
+        file_hash = await upload_sha256(file)
         
         # Check for matches
         matches = db.query(AudioHash).filter(
@@ -587,10 +669,7 @@ async def store_audio_hash(
 ):
     try:
         # Calculate SHA256
-        sha256_hash = hashlib.sha256()
-        file_contents = await file.read()
-        sha256_hash.update(file_contents)
-        file_hash = sha256_hash.hexdigest()
+        file_hash = await upload_sha256(file)
         
         # Store in database
         audio_hash = AudioHash(
@@ -0,0 +1,131 @@
+from fastapi import APIRouter, Depends, Header, HTTPException, Request, Response
+from pydantic import BaseModel, Field
+from sqlalchemy.orm import Session
+from starlette.requests import ClientDisconnect
+from typing import Literal, Optional
+import logging
+from ..database import get_db
+from ..models import ResumableUpload
+from ..services.resilience import DependencyUnavailable
+from ..services.resumable_uploads import (
+    UploadError,
+    append,
+    create_upload,
+    delete_upload,
+    finalize,
+    get_upload,
+    upload_to_dict
+)
+
+router = APIRouter(
+    prefix="/uploads",
+    tags=["uploads"]
+)
+logger = logging.getLogger(__name__)
+
+class UploadCreate(BaseModel):
+    target: Literal["audio", "temp_audio", "demo", "video"]
+    filename: str
+    content_type: str = "application/octet-stream"
+    length: int = Field(gt=0)
+    # Fields of the matching one-shot endpoint
+    title: Optional[str] = None
+    category: Optional[str] = None
+    description: str = ""
+    duration: int = 0
+
+def offset_headers(upload: ResumableUpload) -> dict:
+    return {
+        "Upload-Offset": str(upload.offset),
+        "Upload-Length": str(upload.length),
+        "Cache-Control": "no-store"
+    }
+
+def upload_http_error(e: UploadError) -> HTTPException:
+    headers = {"Upload-Offset": str(e.offset)} if e.offset is not None else None
+    return HTTPException(status_code=e.status_code, detail=str(e), headers=headers)
+
+def load_upload(db: Session, upload_id: str) -> ResumableUpload:
+    try:
+        return get_upload(db, upload_id)
+    except UploadError as e:
+        raise upload_http_error(e)
+
+@router.post("/", status_code=201)
+async def create_resumable_upload(request: UploadCreate, response: Response, db: Session = Depends(get_db)):
+    """
+    Starts a resumable upload. Send the bytes with ``PATCH /uploads/{id}``
+    and an ``Upload-Offset`` header, as many times as needed, then call
+    ``POST /uploads/{id}/finalize``. After a dropped connection,
+    ``HEAD /uploads/{id}`` returns the offset to resume from.
+    """
+    try:
+        upload = create_upload(
+            db,
+            request.target,
+            request.filename,
+            request.content_type,
+            request.length,
+            request.model_dump(include={"title", "category", "description", "duration"})
+        )
+    except UploadError as e:
+        raise upload_http_error(e)
+    response.headers.update(offset_headers(upload))
+    response.headers["Location"] = f"/uploads/{upload.id}"
+    return upload_to_dict(upload)
+
+@router.head("/{upload_id}")
+async def get_upload_offset(upload_id: str, db: Session = Depends(get_db)):
+    return Response(status_code=200, headers=offset_headers(load_upload(db, upload_id)))
+
+@router.get("/{upload_id}")
+async def get_resumable_upload(upload_id: str, response: Response, db: Session = Depends(get_db)):
+    upload = load_upload(db, upload_id)
+    response.headers.update(offset_headers(upload))
+    return upload_to_dict(upload)
+
+@router.patch("/{upload_id}")
+async def append_to_upload(
+    upload_id: str,
+    request: Request,
+    upload_offset: int = Header(..., alias="Upload-Offset", ge=0)
+):
+    """Appends the raw request body at ``Upload-Offset``."""
+    try:
+        offset = await append(upload_id, upload_offset, request.stream())
+    except ClientDisconnect:
+        # What arrived was saved; the client asks for the offset when it retries
+        logger.info(f"Upload {upload_id}: client disconnected during append")
+        return Response(status_code=400)
+    except UploadError as e:
+        raise upload_http_error(e)
+    return Response(status_code=204, headers={"Upload-Offset": str(offset), "Cache-Control": "no-store"})
+
+@router.post("/{upload_id}/finalize")
+async def finalize_upload(upload_id: str, sha256: Optional[str] = None, db: Session = Depends(get_db)):
+    """
+    Stores a fully received upload. ``sha256``, if given, must match the
+    received bytes.
+    """
+    upload = load_upload(db, upload_id)
+    try:
+        result = await finalize(db, upload, sha256)
+    except UploadError as e:
+        db.rollback()
+        raise upload_http_error(e)
+    except DependencyUnavailable:
+        db.rollback()
+        raise
+    except Exception as e:
+        db.rollback()
+        logger.error(f"Failed to finalize upload {upload_id}: {str(e)}")
+        raise HTTPException(status_code=500, detail=str(e))
+    return {"upload_id": upload_id, "sha256": upload.sha256, **result}
+
+@router.delete("/{upload_id}", status_code=204)
+async def delete_resumable_upload(upload_id: str, db: Session = Depends(get_db)):
+    try:
+        await delete_upload(db, load_upload(db, upload_id))
+    except UploadError as e:
+        raise upload_http_error(e)
+    return Response(status_code=204)
@@ -1,18 +1,20 @@
-from fastapi import APIRouter, UploadFile, File, HTTPException, Depends
+from fastapi import APIRouter, HTTPException, Depends, Request
 from fastapi.responses import JSONResponse
 from typing import Dict, Any, Optional
-import boto3
 import uuid
 import os
 import logging
+import asyncio
 from enum import Enum
-import time
 from sqlalchemy.orm import Session
 from ..database import get_db
+from ..services import metrics, resilience, tracing
+from ..services.aws_clients import get_client
+from ..services.resilience import DependencyUnavailable
+from ..services.resumable_uploads import UploadError, finalized_video_key
+from ..services.s3_service import stream_upload_to_s3, delete_object, delete_prefix, UploadFieldMissing
 from pydantic import BaseModel
 
-# Configure logging
-logging.basicConfig(level=logging.DEBUG)
 logger = logging.getLogger(__name__)
 
 router = APIRouter(
@@ -23,25 +25,22 @@ router = APIRouter(
 
 # Initialize AWS clients
 try:
-    s3_client = boto3.client(
-        's3',
-        aws_access_key_id=os.getenv('AWS_ACCESS_KEY_ID'),
-        aws_secret_access_key=os.getenv('AWS_SECRET_ACCESS_KEY'),
-        region_name=os.getenv('AWS_REGION', 'us-east-1')
-    )
+    s3_client = get_client('s3')
     logger.debug("✅ S3 client initialized successfully")
     
-    rekognition_client = boto3.client(
-        'rekognition',
-        aws_access_key_id=os.getenv('AWS_ACCESS_KEY_ID'),
-        aws_secret_access_key=os.getenv('AWS_SECRET_ACCESS_KEY'),
-        region_name=os.getenv('AWS_REGION', 'us-east-1')
-    )
+    rekognition_client = get_client('rekognition')
     logger.debug("✅ Rekognition client initialized successfully")
 except Exception as e:
     logger.error(f"❌ Failed to initialize AWS clients: {str(e)}")
     raise
 
+# detect-deepfake polls Face Liveness results for up to LIVENESS_MAX_POLLS *
+# LIVENESS_POLL_SECONDS after its upload, so it gets a longer request deadline
+# than REQUEST_DEADLINE_SECONDS; 0 disables it
+LIVENESS_MAX_POLLS = 60
+LIVENESS_POLL_SECONDS = 2
+LIVENESS_DEADLINE_SECONDS = float(os.getenv('LIVENESS_DEADLINE_SECONDS', '300'))
+
 class SessionStatus(str, Enum):
     CREATED = "CREATED"
     IN_PROGRESS = "IN_PROGRESS"
@@ -53,36 +52,53 @@ class LivenessSessionCreate(BaseModel):
     client_request_token: str = "default_session"
     audit_images_limit: int = 1
 
+async def upload_video_to_s3(request: Request, key_prefix: str) -> Dict[str, Any]:
+    """
+    Streams the ``video`` form field of the request body straight into an
+    S3 multipart upload under ``key_prefix`` and returns the upload details.
+    """
+    def key_factory(filename: str) -> str:
+        video_key = f"{key_prefix}/{uuid.uuid4()}{os.path.splitext(filename or '')[1]}"
+        logger.debug(f"🔑 Generated S3 key: {video_key}")
+        return video_key
+
+    try:
+        logger.debug(f"📤 Uploading to S3 bucket: {os.getenv('S3_BUCKET')}")
+        with tracing.span("s3.upload", **{"s3.bucket": os.getenv('S3_BUCKET') or ""}):
+            upload = await stream_upload_to_s3(
+                request,
+                s3_client,
+                os.getenv('S3_BUCKET'),
+                key_factory,
+                field_name="video"
+            )
+        logger.debug(f"✅ Upload successful: {upload['size']} bytes in {upload['parts']} part(s)")
+        metrics.observe(metrics.UPLOAD_BYTES, upload['size'], "s3")
+        return upload
+    except UploadFieldMissing as e:
+        raise HTTPException(status_code=422, detail=str(e))
+    except Exception as e:
+        logger.error(f"❌ S3 upload failed: {str(e)}")
+        raise HTTPException(status_code=500, detail=f"Failed to upload to S3: {str(e)}")
+
 @router.post("/create-liveness-session")
 async def create_liveness_session(
-    video: UploadFile = File(...),
+    request: Request,
     db: Session = Depends(get_db)
 ) -> Dict[str, Any]:
+    video_key = None
+    session_created = False
     try:
-        logger.debug(f"📥 Received video file: {video.filename}")
-        
-        # Generate unique filename
-        video_key = f"liveness-videos/{uuid.uuid4()}{os.path.splitext(video.filename)[1]}"
-        logger.debug(f"🔑 Generated S3 key: {video_key}")
-        
         # Upload to S3
-        try:
-            logger.debug(f"📤 Uploading to S3 bucket: {os.getenv('S3_BUCKET')}")
-            s3_client.upload_fileobj(
-                video.file,
-                os.getenv('S3_BUCKET'),
-                video_key,
-                ExtraArgs={'ContentType': video.content_type}
-            )
-            logger.debug("✅ Upload successful")
-        except Exception as e:
-            logger.error(f"❌ S3 upload failed: {str(e)}")
-            raise HTTPException(status_code=500, detail=f"Failed to upload to S3: {str(e)}")
+        upload = await upload_video_to_s3(request, "liveness-videos")
+        video_key = upload['key']
+        logger.debug(f"📥 Received video file: {upload['filename']}")
         
         # Create Face Liveness session
         try:
             logger.debug("🔍 Creating Face Liveness session")
-            session_response = rekognition_client.create_face_liveness_session(
+            session_response = await resilience.rekognition.call_blocking(
+                rekognition_client.create_face_liveness_session,
                 Source={
                     'S3Object': {
                         'Bucket': os.getenv('S3_BUCKET'),
@@ -97,6 +113,7 @@ async def create_liveness_session(
             )
             
             session_id = session_response['SessionId']
+            session_created = True
             logger.debug(f"✅ Face Liveness session created: {session_id}")
             
             return {
@@ -114,6 +131,8 @@ async def create_liveness_session(
         except rekognition_client.exceptions.ThrottlingException:
             logger.error("❌ AWS throttling")
             raise HTTPException(status_code=429, detail="AWS request limit exceeded")
+        except DependencyUnavailable:
+            raise
         except Exception as e:
             logger.error(f"❌ Face Liveness session creation failed: {str(e)}")
             raise HTTPException(
@@ -121,26 +140,26 @@ async def create_liveness_session(
                 detail=f"Failed to create Face Liveness session: {str(e)}"
             )
             
-    except HTTPException as he:
-        # Clean up S3 file if session creation failed
-        try:
-            s3_client.delete_object(
-                Bucket=os.getenv('S3_BUCKET'),
-                Key=video_key
-            )
-            logger.debug(f"🗑️ Cleaned up S3 file after error: {video_key}")
-        except Exception as cleanup_error:
-            logger.error(f"⚠️ Failed to clean up S3 file: {str(cleanup_error)}")
-        raise he
+    except (HTTPException, DependencyUnavailable):
+        raise
     except Exception as e:
         logger.error(f"❌ Unexpected error: {str(e)}")
         raise HTTPException(status_code=500, detail=f"Unexpected error: {str(e)}")
+    finally:
+        # Clean up S3 file if session creation failed, whatever the error
+        if video_key and not session_created:
+            try:
+                await delete_object(s3_client, os.getenv('S3_BUCKET'), video_key)
+                logger.debug(f"🗑️ Cleaned up S3 file after error: {video_key}")
+            except Exception as cleanup_error:
+                logger.error(f"⚠️ Failed to clean up S3 file: {str(cleanup_error)}")
 
 @router.get("/get-liveness-results/{session_id}")
 async def get_liveness_results(session_id: str) -> Dict[str, Any]:
     try:
         logger.debug(f"🔍 Getting results for session: {session_id}")
-        response = rekognition_client.get_face_liveness_session_results(
+        response = await resilience.rekognition.call_blocking(
+            rekognition_client.get_face_liveness_session_results,
             SessionId=session_id
         )
         
@@ -184,6 +203,8 @@ async def get_liveness_results(session_id: str) -> Dict[str, Any]:
     except rekognition_client.exceptions.SessionNotFoundException:
         logger.error(f"❌ Session not found: {session_id}")
         raise HTTPException(status_code=404, detail="Session not found")
+    except DependencyUnavailable:
+        raise
     except Exception as e:
         logger.error(f"❌ Error getting session results: {str(e)}")
         raise HTTPException(status_code=500, detail=str(e))
@@ -193,32 +214,22 @@ async def cleanup_session(session_id: str) -> Dict[str, str]:
     try:
         logger.debug(f"🗑️ Starting cleanup for session: {session_id}")
         
-        # Delete video
-        try:
-            s3_client.delete_object(
-                Bucket=os.getenv('S3_BUCKET'),
-                Key=f"videos/{session_id}.mp4"
-            )
+        # Delete video and output folder concurrently
+        video_result, output_result = await asyncio.gather(
+            delete_object(s3_client, os.getenv('S3_BUCKET'), f"videos/{session_id}.mp4"),
+            delete_prefix(s3_client, os.getenv('S3_BUCKET'), f"output/{session_id}"),
+            return_exceptions=True
+        )
+        
+        if isinstance(video_result, Exception):
+            logger.error(f"⚠️ Failed to delete video: {str(video_result)}")
+        else:
             logger.debug("✅ Deleted video file")
-        except Exception as e:
-            logger.error(f"⚠️ Failed to delete video: {str(e)}")
         
-        # Delete output folder
-        try:
-            objects = s3_client.list_objects_v2(
-                Bucket=os.getenv('S3_BUCKET'),
-                Prefix=f"output/{session_id}"
-            )
-            
-            if 'Contents' in objects:
-                for obj in objects['Contents']:
-                    s3_client.delete_object(
-                        Bucket=os.getenv('S3_BUCKET'),
-                        Key=obj['Key']
-                    )
-            logger.debug("✅ Deleted output files")
-        except Exception as e:
-            logger.error(f"⚠️ Failed to delete output files: {str(e)}")
+        if isinstance(output_result, Exception):
+            logger.error(f"⚠️ Failed to delete output files: {str(output_result)}")
+        else:
+            logger.debug(f"✅ Deleted {output_result} output files")
         
         return {"message": "Session cleaned up successfully"}
         
@@ -227,34 +238,35 @@ async def cleanup_session(session_id: str) -> Dict[str, str]:
         raise HTTPException(status_code=500, detail=str(e))
 
 @router.post("/detect-deepfake")
-async def detect_deepfake(video: UploadFile = File(...)) -> Dict[str, Any]:
+async def detect_deepfake(
+    request: Request,
+    upload_id: Optional[str] = None,
+    db: Session = Depends(get_db)
+) -> Dict[str, Any]:
+    """
+    Analyses the ``video`` form field of the body, or a video sent earlier
+    through a resumable upload finalized as ``upload_id``.
+    """
     try:
-        logger.debug(f"📥 Received video file: {video.filename}")
-        
-        # Generate unique filename
-        video_key = f"videos/{uuid.uuid4()}{os.path.splitext(video.filename)[1]}"
-        logger.debug(f"🔑 Generated S3 key: {video_key}")
-        
-        # Upload to S3
-        try:
-            logger.debug(f"📤 Uploading to S3 bucket: {os.getenv('S3_BUCKET')}")
-            s3_client.upload_fileobj(
-                video.file,
-                os.getenv('S3_BUCKET'),
-                video_key,
-                ExtraArgs={'ContentType': video.content_type}
-            )
-            logger.debug("✅ Upload successful")
-        except Exception as e:
-            logger.error(f"❌ S3 upload failed: {str(e)}")
-            raise HTTPException(status_code=500, detail=f"Failed to upload to S3: {str(e)}")
+        if upload_id:
+            try:
+                video_key = finalized_video_key(db, upload_id)
+            except UploadError as e:
+                raise HTTPException(status_code=e.status_code, detail=str(e))
+            logger.debug(f"📥 Using resumable upload {upload_id}: {video_key}")
+        else:
+            # Upload to S3
+            upload = await upload_video_to_s3(request, "videos")
+            video_key = upload['key']
+            logger.debug(f"📥 Received video file: {upload['filename']}")
         
         # Start Face Liveness detection
         try:
             logger.debug("🔍 Creating Face Liveness session")
             
             # Create Face Liveness session with correct parameters
-            session_response = rekognition_client.create_face_liveness_session(
+            session_response = await resilience.rekognition.call_blocking(
+                rekognition_client.create_face_liveness_session,
                 Source={  # Changed from Settings to Source
                     'S3Object': {
                         'Bucket': os.getenv('S3_BUCKET'),
@@ -272,12 +284,13 @@ async def detect_deepfake(video: UploadFile = File(...)) -> Dict[str, Any]:
             logger.debug(f"✅ Face Liveness session created: {session_id}")
             
             # Poll for results
-            max_attempts = 60
+            max_attempts = LIVENESS_MAX_POLLS
             attempt = 0
             while attempt < max_attempts:
                 try:
                     logger.debug(f"⏳ Checking session status (attempt {attempt + 1}/{max_attempts})")
-                    result = rekognition_client.get_face_liveness_session_results(
+                    result = await resilience.rekognition.call_blocking(
+                        rekognition_client.get_face_liveness_session_results,
                         SessionId=session_id
                     )
                     
@@ -291,10 +304,7 @@ async def detect_deepfake(video: UploadFile = File(...)) -> Dict[str, Any]:
                         # Clean up - delete video from S3
                         try:
                             logger.debug(f"🗑️ Cleaning up S3 file: {video_key}")
-                            s3_client.delete_object(
-                                Bucket=os.getenv('S3_BUCKET'),
-                                Key=video_key
-                            )
+                            await delete_object(s3_client, os.getenv('S3_BUCKET'), video_key)
                             logger.debug("✅ Cleanup successful")
                         except Exception as e:
                             logger.error(f"⚠️ Cleanup failed: {str(e)}")
@@ -319,8 +329,17 @@ async def detect_deepfake(video: UploadFile = File(...)) -> Dict[str, Any]:
                         )
                     
                     attempt += 1
-                    time.sleep(2)  # Wait before next check
+                    remaining = resilience.remaining_time()
+                    if remaining is not None and remaining < LIVENESS_POLL_SECONDS:
+                        # Another check would start past the request deadline
+                        raise HTTPException(
+                            status_code=504,
+                            detail="Request deadline reached waiting for Face Liveness analysis"
+                        )
+                    await asyncio.sleep(LIVENESS_POLL_SECONDS)  # Wait before next check
                     
+                except (HTTPException, DependencyUnavailable):
+                    raise
                 except Exception as e:
                     logger.error(f"❌ Error checking session status: {str(e)}")
                     raise HTTPException(
@@ -333,12 +352,16 @@ async def detect_deepfake(video: UploadFile = File(...)) -> Dict[str, Any]:
                 detail="Timeout waiting for Face Liveness analysis"
             )
             
+        except (HTTPException, DependencyUnavailable):
+            raise
         except Exception as e:
             logger.error(f"❌ Face Liveness analysis failed: {str(e)}")
             raise HTTPException(status_code=500, detail=f"Face Liveness detection failed: {str(e)}")
             
     except HTTPException as he:
         raise he
+    except DependencyUnavailable:
+        raise
     except Exception as e:
         logger.error(f"❌ Unexpected error: {str(e)}")
         raise HTTPException(status_code=500, detail=f"Process failed: {str(e)}")
@@ -354,7 +377,8 @@ async def create_session(
         # Generate unique S3 prefix
         s3_prefix = f"liveness-sessions/{uuid.uuid4()}"
         
-        response = rekognition_client.create_face_liveness_session(
+        response = await resilience.rekognition.call_blocking(
+            rekognition_client.create_face_liveness_session,
             ClientRequestToken=request.client_request_token,
             Settings={
                 'OutputConfig': {
@@ -377,6 +401,8 @@ async def create_session(
     except rekognition_client.exceptions.ThrottlingException:
         logger.error("❌ AWS throttling")
         raise HTTPException(status_code=429, detail="AWS request limit exceeded")
+    except DependencyUnavailable:
+        raise
     except Exception as e:
         logger.error(f"❌ Failed to create session: {str(e)}")
         raise HTTPException(status_code=500, detail=str(e))
@@ -389,7 +415,8 @@ async def get_session_results(
     try:
         logger.debug(f"Getting results for session: {session_id}")
         
-        response = rekognition_client.get_face_liveness_session_results(
+        response = await resilience.rekognition.call_blocking(
+            rekognition_client.get_face_liveness_session_results,
             SessionId=session_id
         )
         
@@ -428,6 +455,8 @@ async def get_session_results(
     except rekognition_client.exceptions.ThrottlingException:
         logger.error("❌ AWS throttling")
         raise HTTPException(status_code=429, detail="AWS request limit exceeded")
+    except DependencyUnavailable:
+        raise
     except Exception as e:
         logger.error(f"❌ Failed to get session results: {str(e)}")
         raise HTTPException(status_code=500, detail=str(e))
\ No newline at end of file
@@ -0,0 +1,337 @@
+import asyncio
+import json
+import logging
+import multiprocessing
+import os
+import queue
+from concurrent.futures import ProcessPoolExecutor
+from dataclasses import dataclass
+from typing import AsyncIterator, List, Optional, Tuple
+
+from . import resilience
+from .aws_clients import get_transcribe_streaming_client
+
+try:
+    import vosk
+except ImportError:  # optional dependency
+    vosk = None
+
+logger = logging.getLogger(__name__)
+
+ASR_PROVIDER = os.getenv('ASR_PROVIDER', 'transcribe')
+# Local provider used while a cloud provider's circuit is open
+ASR_FALLBACK_PROVIDER = os.getenv('ASR_FALLBACK_PROVIDER', 'vosk')
+VOSK_MODEL_PATH = os.getenv('VOSK_MODEL_PATH', 'models/vosk')
+# Each active local stream occupies one worker process for its duration
+ASR_LOCAL_WORKERS = int(os.getenv('ASR_LOCAL_WORKERS', str(os.cpu_count() or 1)))
+
+LOCAL_RESULT_POLL_SECONDS = 0.5
+
+
+class AsrProviderError(Exception):
+    pass
+
+
+@dataclass(frozen=True)
+class TranscriptWord:
+    text: str
+    start_time: float
+    end_time: float
+
+
+@dataclass
+class TranscriptUpdate:
+    segment_id: str
+    text: str
+    is_partial: bool
+    start_time: float = 0.0
+    end_time: float = 0.0
+    # Word timings of final results, when the provider reports them
+    words: Tuple[TranscriptWord, ...] = ()
+
+
+def transcribe_words(items) -> Tuple[TranscriptWord, ...]:
+    """Word timings from Transcribe result items; punctuation is attached to the word before it."""
+    words = []
+    for item in items or ():
+        if item.item_type == "punctuation":
+            if words:
+                words[-1] = TranscriptWord(words[-1].text + item.content, words[-1].start_time, words[-1].end_time)
+            continue
+        words.append(TranscriptWord(item.content, item.start_time or 0.0, item.end_time or 0.0))
+    return tuple(words)
+
+
+class AsrStream:
+    """
+    One recognition stream. PCM goes in through ``send_audio`` until
+    ``end_input``; ``results`` yields ``TranscriptUpdate`` values until the
+    engine has processed all input.
+    """
+
+    async def send_audio(self, chunk: bytes):
+        raise NotImplementedError
+
+    async def end_input(self):
+        raise NotImplementedError
+
+    def results(self) -> AsyncIterator[TranscriptUpdate]:
+        raise NotImplementedError
+
+
+class AsrProvider:
+    name = ""
+
+    def available(self) -> bool:
+        return True
+
+    async def start_stream(
+        self,
+        sample_rate: int,
+        language_code: str,
+        partial_results_stability: Optional[str] = None
+    ) -> AsrStream:
+        raise NotImplementedError
+
+    def shutdown(self):
+        pass
+
+
+class TranscribeStream(AsrStream):
+    def __init__(self, stream):
+        self._stream = stream
+
+    async def send_audio(self, chunk: bytes):
+        await self._stream.input_stream.send_audio_event(audio_chunk=chunk)
+
+    async def end_input(self):
+        await self._stream.input_stream.end_stream()
+
+    async def results(self) -> AsyncIterator[TranscriptUpdate]:
+        try:
+            async for event in self._stream.output_stream:
+                for result in event.transcript.results:
+                    for alt in result.alternatives:
+                        yield TranscriptUpdate(
+                            segment_id=result.result_id,
+                            text=alt.transcript,
+                            is_partial=result.is_partial,
+                            start_time=result.start_time or 0.0,
+                            end_time=result.end_time or 0.0,
+                            words=() if result.is_partial else transcribe_words(getattr(alt, 'items', None))
+                        )
+        except Exception as e:
+            # Streams that drop mid-way count against the breaker too
+            resilience.transcribe.record_failure(e)
+            raise
+
+
+class TranscribeStreamingProvider(AsrProvider):
+    """Amazon Transcribe streaming."""
+
+    name = "transcribe"
+
+    async def start_stream(
+        self,
+        sample_rate: int,
+        language_code: str,
+        partial_results_stability: Optional[str] = None
+    ) -> AsrStream:
+        options = {}
+        if partial_results_stability:
+            options.update(
+                enable_partial_results_stabilization=True,
+                partial_results_stability=partial_results_stability
+            )
+        stream = await resilience.transcribe.call(
+            get_transcribe_streaming_client().start_stream_transcription,
+            language_code=language_code,
+            media_sample_rate_hz=sample_rate,
+            media_encoding="pcm",
+            **options
+        )
+        return TranscribeStream(stream)
+
+
+_vosk_model = None
+
+
+def _load_vosk_model(model_path: str):
+    global _vosk_model
+    vosk.SetLogLevel(-1)
+    _vosk_model = vosk.Model(model_path)
+
+
+def _vosk_recognize(audio_queue, result_queue, sample_rate: int):
+    """
+    Runs in a worker process: feeds PCM from ``audio_queue`` to a Kaldi
+    recognizer until ``None`` arrives and puts
+    ``(segment, text, is_partial, start, end, words)`` tuples on
+    ``result_queue``, followed by ``None``.
+    """
+    recognizer = vosk.KaldiRecognizer(_vosk_model, sample_rate)
+    recognizer.SetWords(True)
+    segment = 0
+    last_partial = ""
+
+    def put_final(raw: str):
+        nonlocal segment, last_partial
+        result = json.loads(raw)
+        words = result.get("result") or []
+        if result.get("text"):
+            result_queue.put((
+                segment,
+                result["text"],
+                False,
+                words[0]["start"] if words else 0.0,
+                words[-1]["end"] if words else 0.0,
+                tuple((word["word"], word["start"], word["end"]) for word in words)
+            ))
+            segment += 1
+        last_partial = ""
+
+    try:
+        while (chunk := audio_queue.get()) is not None:
+            if recognizer.AcceptWaveform(chunk):
+                put_final(recognizer.Result())
+            else:
+                partial = json.loads(recognizer.PartialResult()).get("partial", "")
+                if partial and partial != last_partial:
+                    last_partial = partial
+                    result_queue.put((segment, partial, True, 0.0, 0.0, ()))
+        put_final(recognizer.FinalResult())
+    finally:
+        result_queue.put(None)
+
+
+class VoskStream(AsrStream):
+    def __init__(self, audio_queue, result_queue, worker: asyncio.Future, stream_id: int):
+        self._audio = audio_queue
+        self._results = result_queue
+        self._worker = worker
+        self._stream_id = stream_id
+        self._ended = False
+
+    async def send_audio(self, chunk: bytes):
+        await asyncio.to_thread(self._audio.put, bytes(chunk))
+
+    async def end_input(self):
+        if not self._ended:
+            self._ended = True
+            await asyncio.to_thread(self._audio.put, None)
+
+    async def results(self) -> AsyncIterator[TranscriptUpdate]:
+        while True:
+            try:
+                item = await asyncio.to_thread(self._results.get, True, LOCAL_RESULT_POLL_SECONDS)
+            except queue.Empty:
+                if self._worker.done():
+                    # Surfaces a crashed worker instead of waiting forever
+                    self._worker.result()
+                    return
+                continue
+            if item is None:
+                return
+            segment, text, is_partial, start_time, end_time, words = item
+            yield TranscriptUpdate(
+                segment_id=f"vosk-{self._stream_id}-{segment}",
+                text=text,
+                is_partial=is_partial,
+                start_time=start_time,
+                end_time=end_time,
+                words=tuple(TranscriptWord(*word) for word in words)
+            )
+
+
+class VoskProvider(AsrProvider):
+    """
+    Local Kaldi recognition through Vosk, run in a pool of worker processes
+    that each load the model once. Audio and results cross the process
+    boundary through manager queues, so partial results stream back while
+    audio is still being sent.
+    """
+
+    name = "vosk"
+
+    def __init__(self, model_path: str = VOSK_MODEL_PATH, workers: int = ASR_LOCAL_WORKERS):
+        self.model_path = model_path
+        self.workers = workers
+        self._pool: Optional[ProcessPoolExecutor] = None
+        self._manager = None
+        self._next_stream_id = 0
+
+    def available(self) -> bool:
+        return vosk is not None and os.path.isdir(self.model_path)
+
+    def _ensure_pool(self):
+        if self._pool is None:
+            self._manager = multiprocessing.Manager()
+            self._pool = ProcessPoolExecutor(
+                max_workers=self.workers,
+                initializer=_load_vosk_model,
+                initargs=(self.model_path,)
+            )
+            logger.info(f"Started {self.workers} Vosk workers with model {self.model_path}")
+
+    async def start_stream(
+        self,
+        sample_rate: int,
+        language_code: str,
+        partial_results_stability: Optional[str] = None
+    ) -> AsrStream:
+        self._ensure_pool()
+        audio_queue = self._manager.Queue()
+        result_queue = self._manager.Queue()
+        worker = asyncio.get_running_loop().run_in_executor(
+            self._pool, _vosk_recognize, audio_queue, result_queue, sample_rate
+        )
+        self._next_stream_id += 1
+        return VoskStream(audio_queue, result_queue, worker, self._next_stream_id)
+
+    def shutdown(self):
+        if self._pool is not None:
+            self._pool.shutdown(wait=False, cancel_futures=True)
+            self._manager.shutdown()
+            self._pool = None
+            self._manager = None
+
+
+_providers = {
+    provider.name: provider
+    for provider in (TranscribeStreamingProvider(), VoskProvider())
+}
+
+
+def available_providers() -> List[str]:
+    return [name for name, provider in _providers.items() if provider.available()]
+
+
+def get_provider(name: Optional[str] = None) -> AsrProvider:
+    """
+    Returns the ASR provider called ``name``, or the ``ASR_PROVIDER``
+    default. Raises ``AsrProviderError`` if it is unknown or not usable in
+    this deployment.
+    """
+    name = name or ASR_PROVIDER
+    provider = _providers.get(name)
+    if provider is None:
+        raise AsrProviderError(f"Unknown ASR provider: {name}")
+    if not provider.available():
+        raise AsrProviderError(f"ASR provider '{name}' is not available")
+    return provider
+
+
+def fallback_provider(provider: AsrProvider) -> Optional[AsrProvider]:
+    """
+    Returns the local provider to use while ``provider`` is unavailable, or
+    None if there is none in this deployment.
+    """
+    fallback = _providers.get(ASR_FALLBACK_PROVIDER)
+    if fallback is None or fallback is provider or not fallback.available():
+        return None
+    return fallback
+
+
+def shutdown_providers():
+    for provider in _providers.values():
+        provider.shutdown()
@@ -0,0 +1,160 @@
+import asyncio
+import logging
+import math
+import os
+from enum import Enum
+from typing import AsyncIterator, Awaitable, Callable, List, Optional, Union
+
+from .logging_config import RateLimitedLogger
+from .vad import VoiceActivityDetector, vad_filter
+
+logger = logging.getLogger(__name__)
+chunk_logger = RateLimitedLogger(logger, per_second=1)
+
+MIN_CHUNK_MS = 50
+MAX_CHUNK_MS = 200
+# In-memory buffers are handed to the VAD in slices of this many seconds
+BUFFER_SLICE_SECONDS = 10
+
+PcmSource = Union[bytes, bytearray, memoryview, AsyncIterator[bytes]]
+
+
+class PacingMode(str, Enum):
+    REALTIME = "realtime"
+    FAST = "fast"
+    UNTHROTTLED = "unthrottled"
+
+
+AUDIO_FEED_CHUNK_MS = int(os.getenv('AUDIO_FEED_CHUNK_MS', '100'))
+AUDIO_FEED_PACE = PacingMode(os.getenv('AUDIO_FEED_PACE', PacingMode.REALTIME.value))
+AUDIO_FEED_SPEEDUP = float(os.getenv('AUDIO_FEED_SPEEDUP', '2.0'))
+
+
+class FeederStats:
+    def __init__(self):
+        self.chunks = 0
+        self.bytes = 0
+        self.send_latencies: List[float] = []
+
+    def record(self, size: int, latency: float):
+        self.chunks += 1
+        self.bytes += size
+        self.send_latencies.append(latency)
+
+    def to_dict(self) -> dict:
+        latencies = sorted(self.send_latencies)
+
+        def percentile(p: float) -> float:
+            if not latencies:
+                return 0.0
+            return round(latencies[min(int(p * len(latencies)), len(latencies) - 1)] * 1000, 2)
+
+        return {
+            "chunks": self.chunks,
+            "bytes": self.bytes,
+            "send_latency_ms": {
+                "p50": percentile(0.50),
+                "p95": percentile(0.95),
+                "max": percentile(1.0)
+            }
+        }
+
+
+class PcmFeeder:
+    """
+    Frames 16-bit mono PCM into fixed ``chunk_ms`` chunks and sends them.
+
+    ``pace`` controls how fast chunks go out: ``realtime`` matches the audio
+    clock, ``fast`` runs ``speedup`` times faster, and ``unthrottled``
+    sends as fast as the connection accepts. Pacing follows the audio
+    actually sent, after the optional VAD has dropped silence, so skipped
+    audio never leaves a gap in the stream. Each send is timed into
+    ``stats``.
+    """
+
+    def __init__(
+        self,
+        sample_rate: int = 16000,
+        chunk_ms: int = AUDIO_FEED_CHUNK_MS,
+        pace: PacingMode = AUDIO_FEED_PACE,
+        speedup: float = AUDIO_FEED_SPEEDUP,
+        vad: Optional[VoiceActivityDetector] = None
+    ):
+        self.sample_rate = sample_rate
+        self.chunk_ms = min(max(chunk_ms, MIN_CHUNK_MS), MAX_CHUNK_MS)
+        self.chunk_bytes = sample_rate * self.chunk_ms // 1000 * 2
+        self.pace = PacingMode(pace)
+        self.speedup = speedup if self.pace == PacingMode.FAST else 1.0
+        self.vad = vad
+        self.stats = FeederStats()
+
+    async def frames(self, source: AsyncIterator[bytes]) -> AsyncIterator[memoryview]:
+        """
+        Re-slices arbitrary PCM chunks into ``chunk_bytes`` frames. Frames
+        that lie inside one incoming chunk are zero-copy views over it; only
+        frames straddling two chunks are assembled in a small carry buffer.
+        Only the last frame can be shorter.
+        """
+        carry = bytearray()
+        async for chunk in source:
+            view = memoryview(chunk).cast('B')
+            if carry:
+                needed = self.chunk_bytes - len(carry)
+                carry += view[:needed]
+                view = view[needed:]
+                if len(carry) < self.chunk_bytes:
+                    continue
+                yield memoryview(bytes(carry))
+                carry.clear()
+
+            usable = len(view) - len(view) % self.chunk_bytes
+            for start in range(0, usable, self.chunk_bytes):
+                yield view[start:start + self.chunk_bytes]
+            carry += view[usable:]
+        if carry:
+            yield memoryview(bytes(carry))
+
+    async def buffer_chunks(self, buffer) -> AsyncIterator[memoryview]:
+        """
+        Walks an in-memory PCM buffer as views of about
+        ``BUFFER_SLICE_SECONDS``. The slice size is a multiple of both the
+        feed chunk and the VAD frame, so neither has to copy at slice edges.
+        """
+        step = self.chunk_bytes
+        if self.vad is not None:
+            step = math.lcm(step, self.vad.frame_bytes)
+        step *= max(self.sample_rate * 2 * BUFFER_SLICE_SECONDS // step, 1)
+
+        view = memoryview(buffer).cast('B')
+        for start in range(0, len(view), step):
+            yield view[start:start + step]
+
+    async def feed(
+        self,
+        source: PcmSource,
+        send: Callable[[bytes], Awaitable[None]]
+    ):
+        """
+        Sends ``source`` through ``send``. ``source`` is either an async
+        iterator of PCM chunks or an in-memory buffer (``bytes``,
+        ``bytearray`` or ``memoryview``), which is sent without being copied.
+        """
+        if isinstance(source, (bytes, bytearray, memoryview)):
+            source = self.buffer_chunks(source)
+
+        loop = asyncio.get_running_loop()
+        started = loop.time()
+        audio_seconds = 0.0
+        bytes_per_second = self.sample_rate * 2
+
+        async for frame in self.frames(vad_filter(source, self.vad)):
+            if self.pace != PacingMode.UNTHROTTLED:
+                delay = started + audio_seconds / self.speedup - loop.time()
+                if delay > 0:
+                    await asyncio.sleep(delay)
+
+            sent_at = loop.time()
+            await send(frame)
+            self.stats.record(len(frame), loop.time() - sent_at)
+            audio_seconds += len(frame) / bytes_per_second
+            chunk_logger.debug("Sent %d byte audio chunk", len(frame))
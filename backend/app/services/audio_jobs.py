@@ -0,0 +1,130 @@
+import asyncio
+import logging
+from typing import Optional
+
+from sqlalchemy.orm import Session, defer
+
+from . import job_queue, metrics
+from .asr import AsrProviderError, get_provider
+from .audio_pipeline import AudioDecodeError, PCM_SAMPLE_RATE, decode_pcm_stream, exported_stored_audio, new_transcription
+from .audio_tasks import audio_fingerprint, sha256_file
+from .cpu_pool import cpu_pool
+from .gemini_service import gemini_service
+from .parallel_transcribe import transcribe_parallel
+from ..database import SessionLocal
+from ..models import AudioFile
+
+logger = logging.getLogger(__name__)
+
+AUDIO_PIPELINE = 'audio_pipeline'
+AUDIO_PIPELINE_STAGES = ('decode', 'hash', 'fingerprint', 'transcribe', 'classify')
+
+
+def enqueue_audio_pipeline(
+    db: Session,
+    audio_id: int,
+    idempotency_key: Optional[str] = None,
+    provider: Optional[str] = None,
+    sha256: Optional[str] = None
+):
+    """
+    Queues the post-processing of an uploaded, non-temporary ``AudioFile``
+    in the caller's transaction. ``sha256``, if the upload was already
+    hashed on the way in, saves hashing it again.
+    """
+    return job_queue.enqueue(
+        db,
+        AUDIO_PIPELINE,
+        {"audio_id": audio_id, "provider": provider, "sha256": sha256},
+        idempotency_key=idempotency_key or f"{AUDIO_PIPELINE}:{audio_id}"
+    )
+
+
+def _load_audio(audio_id: int) -> Optional[AudioFile]:
+    db = SessionLocal()
+    try:
+        return db.query(AudioFile).options(defer(AudioFile.audio_data)).filter(AudioFile.id == audio_id).first()
+    finally:
+        db.close()
+
+
+@job_queue.handler(AUDIO_PIPELINE)
+async def process_audio(run: job_queue.JobRun):
+    """
+    Decodes an upload, hashes it, computes an acoustic fingerprint,
+    transcribes it into a ``Transcription`` and classifies the transcript.
+    Each stage's result is kept on the job. The SHA-256 is not added to
+    ``audio_hashes``, which only holds hashes of known scam recordings
+    registered through /audio/store-hash.
+    """
+    if all(stage in run.results for stage in AUDIO_PIPELINE_STAGES):
+        return
+    audio_id = run.payload["audio_id"]
+    audio = await asyncio.to_thread(_load_audio, audio_id)
+    if audio is None:
+        raise job_queue.PermanentJobError(f"Audio {audio_id} no longer exists")
+    if audio.is_temporary:
+        # Only jobs queued before temporary recordings stopped getting one;
+        # realtimetranscribe-recording transcribes those itself
+        logger.info(f"Skipping job {run.id} for temporary recording {audio_id}")
+        return
+    try:
+        provider = get_provider(run.payload.get("provider"))
+    except AsrProviderError as e:
+        raise job_queue.PermanentJobError(str(e))
+
+    async with exported_stored_audio(AudioFile, audio_id, audio.filename) as source_path:
+        pcm = None
+
+        async def decoded() -> bytearray:
+            nonlocal pcm
+            if pcm is None:
+                buffer = bytearray()
+                try:
+                    with metrics.timed(metrics.AUDIO_DECODE_SECONDS, provider.name):
+                        async for chunk in decode_pcm_stream(source_path):
+                            buffer += chunk
+                except AudioDecodeError as e:
+                    raise job_queue.PermanentJobError(str(e))
+                pcm = buffer
+            return pcm
+
+        async def decode():
+            data = await decoded()
+            return {"pcm_bytes": len(data), "seconds": round(len(data) / (2 * PCM_SAMPLE_RATE), 2)}
+
+        async def sha256():
+            if run.payload.get("sha256"):
+                return {"sha256": run.payload["sha256"]}
+            return {"sha256": await asyncio.to_thread(sha256_file, source_path)}
+
+        async def fingerprint():
+            data = await decoded()
+            return {"fingerprint": await cpu_pool.run(audio_fingerprint, bytes(data))}
+
+        timeline = None
+
+        async def transcribe():
+            nonlocal timeline
+            result = await transcribe_parallel(await decoded(), provider=provider)
+            # The timeline goes into TranscriptSegment rows, not the job's result
+            timeline = result
+            return {"text": result["transcription"], "stats": result["stats"]}
+
+        def store_transcription(db: Session, value: dict):
+            transcription = new_transcription(audio_id, timeline)
+            db.add(transcription)
+            db.flush()
+            value["transcription_id"] = transcription.id
+
+        await run.stage("decode", decode)
+        await run.stage("hash", sha256)
+        await run.stage("fingerprint", fingerprint)
+        transcript = await run.stage("transcribe", transcribe, persist=store_transcription)
+
+    async def classify():
+        if not transcript["text"].strip():
+            return {"classification": None, "confidence": None}
+        return await gemini_service.analyze_fraud(transcript["text"])
+
+    await run.stage("classify", classify)
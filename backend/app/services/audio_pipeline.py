@@ -0,0 +1,185 @@
+import asyncio
+import json
+import logging
+from contextlib import asynccontextmanager
+from typing import AsyncIterator, Dict, Iterable, Optional
+
+from ..database import SessionLocal
+from ..models import AudioFile, Transcription, TranscriptSegment
+from . import tracing
+from .cpu_pool import CpuPoolBusy, cpu_pool
+from .asr import AsrProvider
+from .blob_store import export_blob_to_file
+from .scratch import remove_scratch_file, scratch_path
+from .transcript_stream import TranscribeStreamSession
+
+logger = logging.getLogger(__name__)
+
+PCM_SAMPLE_RATE = 16000
+PCM_CHUNK_SIZE = 1024 * 16
+
+
+class AudioDecodeError(Exception):
+    pass
+
+
+async def decode_pcm_stream(
+    source_path: str,
+    sample_rate: int = PCM_SAMPLE_RATE,
+    chunk_size: int = PCM_CHUNK_SIZE
+) -> AsyncIterator[bytes]:
+    """
+    Decodes any ffmpeg-readable file to 16-bit mono PCM and yields it in
+    ``chunk_size`` pieces as ffmpeg produces them, without an intermediate
+    WAV file. ffmpeg runs under ``cpu_pool``'s subprocess limit for as long
+    as the stream is read, and is killed if the consumer stops early.
+    """
+    # Not a current span: the generator is suspended between chunks
+    decode_span = tracing.start_span("ffmpeg.decode", **{"audio.sample_rate": sample_rate})
+    decoded = 0
+    error = None
+    try:
+        async with cpu_pool.stream_subprocess([
+            'ffmpeg', '-nostdin', '-loglevel', 'error',
+            '-i', source_path,
+            '-f', 's16le',
+            '-acodec', 'pcm_s16le',
+            '-ac', '1',
+            '-ar', str(sample_rate),
+            'pipe:1'
+        ]) as process:
+            while True:
+                try:
+                    chunk = await process.stdout.readexactly(chunk_size)
+                except asyncio.IncompleteReadError as e:
+                    if e.partial:
+                        decoded += len(e.partial)
+                        yield e.partial
+                    break
+                decoded += len(chunk)
+                yield chunk
+
+            stderr = await process.stderr.read()
+            if await process.wait() != 0:
+                error = AudioDecodeError(f"Error converting audio: {stderr.decode(errors='replace')}")
+                raise error
+    except CpuPoolBusy as e:
+        error = e
+        raise
+    finally:
+        if decode_span is not None:
+            decode_span.set_attribute("audio.decoded_bytes", decoded)
+        tracing.end_span(decode_span, error)
+
+
+def _export_stored_audio(model, row_id: int, file_path: str) -> int:
+    db = SessionLocal()
+    try:
+        return export_blob_to_file(db, model, row_id, file_path)
+    finally:
+        db.close()
+
+
+@asynccontextmanager
+async def exported_stored_audio(model, row_id: int, filename: str) -> AsyncIterator[str]:
+    """
+    Copies a stored ``DemoAudio`` or ``AudioFile`` blob to a temp file in
+    chunks and yields its path. Container formats such as m4a need a
+    seekable input, so ffmpeg cannot read them from a pipe. The file is
+    removed when the block exits.
+    """
+    source_path = scratch_path(filename or 'audio')
+    try:
+        with tracing.span("audio.export", **{"audio.model": model.__name__, "audio.row_id": row_id}):
+            size = await asyncio.to_thread(_export_stored_audio, model, row_id, source_path)
+        logger.info(f"Exported {size} bytes of {model.__name__} {row_id} for transcription")
+        yield source_path
+    finally:
+        remove_scratch_file(source_path)
+
+
+@asynccontextmanager
+async def open_stored_audio_session(
+    model,
+    row_id: int,
+    filename: str,
+    provider: Optional[AsrProvider] = None
+) -> AsyncIterator[TranscribeStreamSession]:
+    """
+    Opens a live transcription session for a stored ``DemoAudio`` or
+    ``AudioFile`` row. The exported blob is decoded by ffmpeg straight into
+    the Transcribe stream.
+    """
+    async with exported_stored_audio(model, row_id, filename) as source_path:
+        async with TranscribeStreamSession(decode_pcm_stream(source_path), provider=provider) as session:
+            yield session
+
+
+async def decode_stored_audio(
+    model,
+    row_id: int,
+    filename: str,
+    sample_rate: int = PCM_SAMPLE_RATE
+) -> bytearray:
+    """
+    Decodes a stored recording to one in-memory 16-bit mono PCM buffer, for
+    callers that need random access to the whole timeline.
+    """
+    pcm = bytearray()
+    async with exported_stored_audio(model, row_id, filename) as source_path:
+        async for chunk in decode_pcm_stream(source_path, sample_rate=sample_rate):
+            pcm += chunk
+    return pcm
+
+
+def new_transcription(audio_id: int, result: Dict) -> Transcription:
+    """
+    A ``Transcription`` of a ``transcribe_parallel`` result, with its
+    timeline as ``TranscriptSegment`` rows, for the caller to add.
+    """
+    return Transcription(
+        audio_file_id=audio_id,
+        text=result["transcription"],
+        segments=[
+            TranscriptSegment(
+                position=position,
+                start_time=segment["start"],
+                end_time=segment["end"],
+                text=segment["text"],
+                words=json.dumps(segment.get("words", []))
+            )
+            for position, segment in enumerate(result["segments"])
+        ]
+    )
+
+
+def delete_transcriptions(db, audio_ids: Iterable[int]):
+    """Bulk-deletes the transcriptions of recordings, with their timelines, without committing."""
+    audio_ids = list(audio_ids)
+    transcription_ids = db.query(Transcription.id).filter(Transcription.audio_file_id.in_(audio_ids))
+    db.query(TranscriptSegment).filter(
+        TranscriptSegment.transcription_id.in_(transcription_ids.scalar_subquery())
+    ).delete(synchronize_session=False)
+    db.query(Transcription).filter(
+        Transcription.audio_file_id.in_(audio_ids)
+    ).delete(synchronize_session=False)
+
+
+def delete_stored_audio(model, row_id: int):
+    """
+    Deletes a stored recording once it has been transcribed. Runs as a
+    response background task with its own session.
+    """
+    db = SessionLocal()
+    try:
+        with tracing.span("audio.cleanup", **{"audio.model": model.__name__, "audio.row_id": row_id}):
+            if model is AudioFile:
+                delete_transcriptions(db, [row_id])
+            db.query(model).filter(model.id == row_id).delete(synchronize_session=False)
+            db.commit()
+        logger.info(f"Deleted {model.__name__} {row_id} after transcription")
+    except Exception as e:
+        logger.error(f"Failed to delete {model.__name__} {row_id}: {str(e)}")
+        db.rollback()
+    finally:
+        db.close()
@@ -0,0 +1,88 @@
+import logging
+import os
+import threading
+
+import boto3
+from botocore.config import Config
+from amazon_transcribe.client import TranscribeStreamingClient
+from dotenv import load_dotenv
+
+load_dotenv()
+
+logger = logging.getLogger(__name__)
+
+AWS_REGION = os.getenv('AWS_REGION', 'us-east-1')
+
+# One tuned config shared by every boto3 client in the process
+AWS_CLIENT_CONFIG = Config(
+    region_name=AWS_REGION,
+    max_pool_connections=int(os.getenv('AWS_MAX_POOL_CONNECTIONS', '50')),
+    connect_timeout=float(os.getenv('AWS_CONNECT_TIMEOUT_SECONDS', '5')),
+    read_timeout=float(os.getenv('AWS_READ_TIMEOUT_SECONDS', '30')),
+    tcp_keepalive=True,
+    retries={
+        'mode': 'adaptive',
+        'max_attempts': int(os.getenv('AWS_MAX_ATTEMPTS', '5'))
+    }
+)
+
+_lock = threading.Lock()
+_session = None
+_clients = {}
+_transcribe_streaming_client = None
+
+
+def get_session() -> boto3.Session:
+    global _session
+    if _session is None:
+        with _lock:
+            if _session is None:
+                _session = boto3.Session(
+                    aws_access_key_id=os.getenv('AWS_ACCESS_KEY_ID'),
+                    aws_secret_access_key=os.getenv('AWS_SECRET_ACCESS_KEY'),
+                    region_name=AWS_REGION
+                )
+    return _session
+
+
+def get_client(service_name: str):
+    """
+    Returns the process-wide boto3 client for ``service_name``.
+
+    Clients are created once, on first use, and then reused so their
+    connection pools and TLS sessions survive across requests. boto3 clients
+    are thread-safe, so the same instance can be used from worker threads.
+    """
+    client = _clients.get(service_name)
+    if client is None:
+        session = get_session()
+        with _lock:
+            client = _clients.get(service_name)
+            if client is None:
+                client = session.client(service_name, config=AWS_CLIENT_CONFIG)
+                _clients[service_name] = client
+                logger.debug(f"Created shared {service_name} client")
+    return client
+
+
+def get_transcribe_streaming_client() -> TranscribeStreamingClient:
+    """
+    Returns the shared Transcribe streaming client. A single instance keeps
+    one CRT bootstrap and TLS context for every stream the process opens.
+    """
+    global _transcribe_streaming_client
+    if _transcribe_streaming_client is None:
+        with _lock:
+            if _transcribe_streaming_client is None:
+                _transcribe_streaming_client = TranscribeStreamingClient(region=AWS_REGION)
+    return _transcribe_streaming_client
+
+
+def warm_up(*service_names: str):
+    """
+    Builds the given clients ahead of time so the first request does not
+    pay for endpoint resolution and credential loading.
+    """
+    for service_name in service_names:
+        get_client(service_name)
+    get_transcribe_streaming_client()
@@ -1,12 +1,14 @@
-from amazon_transcribe.client import TranscribeStreamingClient
 from amazon_transcribe.handlers import TranscriptResultStreamHandler
 from amazon_transcribe.model import TranscriptEvent
-from boto3 import Session
 import time
 from datetime import datetime
 from dotenv import load_dotenv
 import os
 import logging
+from . import resilience
+from .aws_clients import get_client, get_transcribe_streaming_client
+from .fraud_heuristics import heuristic_fraud_analysis
+from .resilience import DependencyUnavailable
 
 load_dotenv()
 
@@ -14,13 +16,8 @@ logger = logging.getLogger(__name__)
 
 class TranscribeStreamHandler(TranscriptResultStreamHandler):
     def __init__(self):
-        session = Session(
-            aws_access_key_id=os.getenv('AWS_ACCESS_KEY_ID'),
-            aws_secret_access_key=os.getenv('AWS_SECRET_ACCESS_KEY'),
-            region_name=os.getenv('AWS_REGION')
-        )
-        self.fraud_detector = session.client('frauddetector')
-        self.transcribe_client = TranscribeStreamingClient(session)
+        self.fraud_detector = get_client('frauddetector')
+        self.transcribe_client = get_transcribe_streaming_client()
         super().__init__(self.transcribe_client)
         self.transcription = ""
         self._is_cancelled = False
@@ -55,7 +52,8 @@ class TranscribeStreamHandler(TranscriptResultStreamHandler):
             return 0.0
             
         try:
-            response = self.fraud_detector.get_event_prediction(
+            response = await resilience.frauddetector.call_blocking(
+                self.fraud_detector.get_event_prediction,
                 detectorId='spam_call_detector',
                 eventId=f'call_{int(time.time())}',
                 eventTypeName='spam_call_detection',
@@ -69,6 +67,10 @@ class TranscribeStreamHandler(TranscriptResultStreamHandler):
                 }
             )
             return float(response['modelScores'][0]['score'])
+        except DependencyUnavailable as e:
+            logger.warning(f"{str(e)}, scoring with the fraud heuristic")
+            analysis = heuristic_fraud_analysis(text)
+            return analysis["confidence"] if analysis["classification"] == "FRAUD" else 0.0
         except Exception as e:
             logger.error(f"Fraud detection error: {e}")
             return 0.0
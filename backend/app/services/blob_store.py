@@ -0,0 +1,83 @@
+import logging
+import sqlite3
+from typing import BinaryIO, Iterator, Optional
+
+from sqlalchemy import func
+from sqlalchemy.orm import Session
+
+logger = logging.getLogger(__name__)
+
+BLOB_CHUNK_SIZE = 256 * 1024
+
+
+def _sqlite_connection(db: Session) -> Optional[sqlite3.Connection]:
+    driver_connection = db.connection().connection.driver_connection
+    if isinstance(driver_connection, sqlite3.Connection) and hasattr(driver_connection, 'blobopen'):
+        return driver_connection
+    return None
+
+
+def iter_blob(db: Session, model, row_id: int, chunk_size: int = BLOB_CHUNK_SIZE) -> Iterator[bytes]:
+    """
+    Yields the ``audio_data`` column of ``model`` row ``row_id`` in chunks
+    without materialising the whole value.
+
+    On SQLite (Python 3.11+) this uses incremental blob I/O; other databases
+    fall back to ``substr`` range queries.
+    """
+    connection = _sqlite_connection(db)
+    if connection is not None:
+        with connection.blobopen(model.__tablename__, 'audio_data', row_id, readonly=True) as blob:
+            while chunk := blob.read(chunk_size):
+                yield chunk
+        return
+
+    offset = 1
+    while True:
+        chunk = db.query(
+            func.substr(model.audio_data, offset, chunk_size)
+        ).filter(model.id == row_id).scalar()
+        if not chunk:
+            break
+        yield bytes(chunk)
+        offset += len(chunk)
+
+
+def export_blob_to_file(db: Session, model, row_id: int, file_path: str) -> int:
+    """
+    Copies a stored audio blob to ``file_path`` chunk by chunk and returns
+    the number of bytes written.
+    """
+    written = 0
+    with open(file_path, 'wb') as f:
+        for chunk in iter_blob(db, model, row_id):
+            f.write(chunk)
+            written += len(chunk)
+    return written
+
+
+def import_blob_from_file(db: Session, model, row_id: int, fileobj: BinaryIO, size: int, chunk_size: int = BLOB_CHUNK_SIZE) -> int:
+    """
+    Copies ``size`` bytes from ``fileobj`` into the ``audio_data`` column of
+    ``model`` row ``row_id``, which must have been inserted with
+    ``func.zeroblob(size)``, and returns the number of bytes written.
+
+    On SQLite this writes through incremental blob I/O in the session's
+    transaction, so memory use does not grow with the file. Other databases
+    fall back to a single update with the whole value.
+    """
+    connection = _sqlite_connection(db)
+    if connection is None:
+        data = fileobj.read(size)
+        db.query(model).filter(model.id == row_id).update({model.audio_data: data}, synchronize_session=False)
+        return len(data)
+
+    written = 0
+    with connection.blobopen(model.__tablename__, 'audio_data', row_id) as blob:
+        while written < size:
+            chunk = fileobj.read(min(chunk_size, size - written))
+            if not chunk:
+                raise ValueError(f"Expected {size} bytes but the file ended after {written}")
+            blob.write(chunk)
+            written += len(chunk)
+    return written
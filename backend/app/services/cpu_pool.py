@@ -0,0 +1,267 @@
+import asyncio
+import logging
+import multiprocessing
+import os
+import subprocess
+import time
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from contextlib import asynccontextmanager
+from typing import AsyncIterator, Callable, Optional, Sequence
+
+from . import tracing
+
+logger = logging.getLogger(__name__)
+
+CPU_POOL_WORKERS = int(os.getenv('CPU_POOL_WORKERS', str(os.cpu_count() or 1)))
+# Tasks waiting or running beyond this are rejected instead of queued
+CPU_POOL_MAX_PENDING = int(os.getenv('CPU_POOL_MAX_PENDING', str(CPU_POOL_WORKERS * 8)))
+CPU_POOL_TASK_TIMEOUT_SECONDS = float(os.getenv('CPU_POOL_TASK_TIMEOUT_SECONDS', '120'))
+# Workers are spawned rather than forked so they never inherit the event
+# loop, boto3 connection pools or other threads of the server process
+CPU_POOL_START_METHOD = os.getenv('CPU_POOL_START_METHOD', 'spawn')
+
+TIMING_WINDOW = 1000
+
+
+class CpuPoolBusy(Exception):
+    pass
+
+
+class CpuTaskTimeout(Exception):
+    pass
+
+
+def _timed_call(func: Callable, args: tuple, kwargs: dict):
+    started = time.time()
+    result = func(*args, **kwargs)
+    return result, started, time.time() - started
+
+
+def _percentiles(samples) -> dict:
+    ordered = sorted(samples)
+
+    def percentile(p: float) -> float:
+        if not ordered:
+            return 0.0
+        return round(ordered[min(int(p * len(ordered)), len(ordered) - 1)] * 1000, 2)
+
+    return {"p50": percentile(0.50), "p95": percentile(0.95), "max": percentile(1.0)}
+
+
+class CpuPool:
+    """
+    Runs CPU-heavy audio work off the event loop.
+
+    ``run`` executes a picklable function in a process pool sized to the
+    machine, so hashing and DSP scale across cores. ``run_subprocess``
+    runs external tools such as ffmpeg under the same concurrency limit,
+    and ``stream_subprocess`` does so for tools read while they run. All
+    of them reject new work once ``max_pending`` tasks are waiting or
+    running; the first two also enforce a per-task timeout.
+
+    Cancelling the awaiting coroutine or hitting the timeout drops a pool
+    task that has not started yet and kills a running subprocess. A pool
+    task that is already running cannot be interrupted without breaking
+    the pool, so it keeps counting against ``max_pending`` until its worker
+    is really free again, and its result is discarded. Stuck inputs thus
+    make the pool reject work instead of queueing it behind busy workers.
+    """
+
+    def __init__(
+        self,
+        workers: int = CPU_POOL_WORKERS,
+        max_pending: int = CPU_POOL_MAX_PENDING,
+        timeout: float = CPU_POOL_TASK_TIMEOUT_SECONDS
+    ):
+        self.workers = max(workers, 1)
+        self.max_pending = max_pending
+        self.timeout = timeout
+        self._executor: Optional[ProcessPoolExecutor] = None
+        self._subprocess_slots = asyncio.Semaphore(self.workers)
+        self._in_flight = 0
+        # Timed-out or cancelled tasks still running in a worker
+        self._abandoned = 0
+        self._counts = dict.fromkeys(
+            ("submitted", "completed", "failed", "cancelled", "timed_out", "rejected"), 0
+        )
+        self._queue_waits = deque(maxlen=TIMING_WINDOW)
+        self._run_times = deque(maxlen=TIMING_WINDOW)
+
+    def _get_executor(self) -> ProcessPoolExecutor:
+        if self._executor is None:
+            self._executor = ProcessPoolExecutor(
+                max_workers=self.workers,
+                mp_context=multiprocessing.get_context(CPU_POOL_START_METHOD)
+            )
+            logger.info(f"Started CPU pool with {self.workers} workers")
+        return self._executor
+
+    def _admit(self):
+        if self._in_flight >= self.max_pending:
+            self._counts["rejected"] += 1
+            raise CpuPoolBusy(f"CPU pool is busy ({self._in_flight} tasks pending)")
+        self._in_flight += 1
+        self._counts["submitted"] += 1
+
+    @tracing.traced("cpu_pool.run")
+    async def run(self, func: Callable, *args, timeout: Optional[float] = None, **kwargs):
+        tracing.set_attributes(**{"code.function": func.__name__})
+        self._admit()
+        submitted = time.time()
+        future = self._get_executor().submit(_timed_call, func, args, kwargs)
+        release = True
+        try:
+            result, started, duration = await asyncio.wait_for(
+                asyncio.wrap_future(future), timeout or self.timeout
+            )
+        except asyncio.TimeoutError:
+            self._counts["timed_out"] += 1
+            release = self._abandon(future)
+            raise CpuTaskTimeout(f"{func.__name__} did not finish within {timeout or self.timeout}s")
+        except asyncio.CancelledError:
+            self._counts["cancelled"] += 1
+            release = self._abandon(future)
+            raise
+        except Exception:
+            self._counts["failed"] += 1
+            raise
+        finally:
+            if release:
+                self._in_flight -= 1
+
+        self._counts["completed"] += 1
+        self._queue_waits.append(max(started - submitted, 0.0))
+        self._run_times.append(duration)
+        return result
+
+    def _abandon(self, future) -> bool:
+        """
+        Drops a task nobody waits for any more. Returns True if it never
+        started, so its slot is free at once; otherwise the slot is only
+        released when the worker finishes it.
+        """
+        if future.cancel():
+            return True
+        loop = asyncio.get_running_loop()
+        self._abandoned += 1
+
+        def release():
+            self._abandoned -= 1
+            self._in_flight -= 1
+
+        def on_done(_):
+            # Runs on the executor's management thread
+            try:
+                loop.call_soon_threadsafe(release)
+            except RuntimeError:
+                pass  # the loop has already been closed
+
+        future.add_done_callback(on_done)
+        return False
+
+    @tracing.traced("cpu_pool.subprocess")
+    async def run_subprocess(
+        self,
+        args: Sequence[str],
+        check: bool = True,
+        timeout: Optional[float] = None
+    ) -> subprocess.CompletedProcess:
+        """
+        Async counterpart of ``subprocess.run(args, capture_output=True)``.
+        Raises ``subprocess.CalledProcessError`` on a non-zero exit when
+        ``check`` is set.
+        """
+        tracing.set_attributes(**{"process.executable.name": args[0]})
+        self._admit()
+        submitted = time.time()
+        process = None
+        try:
+            async with self._subprocess_slots:
+                started = time.time()
+                process = await asyncio.create_subprocess_exec(
+                    *args,
+                    stdin=asyncio.subprocess.DEVNULL,
+                    stdout=asyncio.subprocess.PIPE,
+                    stderr=asyncio.subprocess.PIPE
+                )
+                stdout, stderr = await asyncio.wait_for(process.communicate(), timeout or self.timeout)
+        except asyncio.TimeoutError:
+            self._counts["timed_out"] += 1
+            raise CpuTaskTimeout(f"{args[0]} did not finish within {timeout or self.timeout}s")
+        except asyncio.CancelledError:
+            self._counts["cancelled"] += 1
+            raise
+        except Exception:
+            self._counts["failed"] += 1
+            raise
+        finally:
+            self._in_flight -= 1
+            if process is not None and process.returncode is None:
+                process.kill()
+                await process.wait()
+
+        self._queue_waits.append(started - submitted)
+        self._run_times.append(time.time() - started)
+        if check and process.returncode != 0:
+            self._counts["failed"] += 1
+            raise subprocess.CalledProcessError(process.returncode, list(args), stdout, stderr)
+        self._counts["completed"] += 1
+        return subprocess.CompletedProcess(list(args), process.returncode, stdout, stderr)
+
+    @asynccontextmanager
+    async def stream_subprocess(self, args: Sequence[str]) -> AsyncIterator[asyncio.subprocess.Process]:
+        """
+        Starts an external tool whose stdout is consumed as it is produced,
+        such as ffmpeg decoding into a live stream, and yields the process.
+        It holds a subprocess slot until the block exits, when it is killed
+        if still running. No timeout applies: it lives as long as its reader.
+        """
+        self._admit()
+        submitted = time.time()
+        try:
+            async with self._subprocess_slots:
+                started = time.time()
+                self._queue_waits.append(started - submitted)
+                process = await asyncio.create_subprocess_exec(
+                    *args,
+                    stdin=asyncio.subprocess.DEVNULL,
+                    stdout=asyncio.subprocess.PIPE,
+                    stderr=asyncio.subprocess.PIPE
+                )
+                try:
+                    yield process
+                finally:
+                    if process.returncode is None:
+                        process.kill()
+                        await process.wait()
+                    self._run_times.append(time.time() - started)
+        except (asyncio.CancelledError, GeneratorExit):
+            self._counts["cancelled"] += 1
+            raise
+        except Exception:
+            self._counts["failed"] += 1
+            raise
+        else:
+            self._counts["completed" if process.returncode == 0 else "failed"] += 1
+        finally:
+            self._in_flight -= 1
+
+    def stats(self) -> dict:
+        return {
+            "workers": self.workers,
+            "in_flight": self._in_flight,
+            "queued": max(self._in_flight - self.workers, 0),
+            "abandoned_running": self._abandoned,
+            **self._counts,
+            "queue_wait_ms": _percentiles(self._queue_waits),
+            "run_ms": _percentiles(self._run_times)
+        }
+
+    def shutdown(self):
+        if self._executor is not None:
+            self._executor.shutdown(wait=False, cancel_futures=True)
+            self._executor = None
+
+
+cpu_pool = CpuPool()
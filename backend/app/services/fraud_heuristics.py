@@ -0,0 +1,42 @@
+import re
+from typing import Dict
+
+OTP_PATTERNS = [
+    re.compile(r'\b\d{4,6}\b'),  # 4-6 digit numbers
+    re.compile(r'verification code'),
+    re.compile(r'security code'),
+    re.compile(r'one.?time.?password'),
+    re.compile(r'otp')
+]
+
+# Phrases common in scam calls, used only when the model is unavailable
+SCAM_PATTERNS = [
+    re.compile(r'gift ?cards?'),
+    re.compile(r'wire transfer|send (the )?money'),
+    re.compile(r'bank (account|details)|card number|cvv|pin number'),
+    re.compile(r'(your )?account (has been|is|will be) (blocked|suspended|locked|frozen)'),
+    re.compile(r'arrest|warrant|police|legal action'),
+    re.compile(r'remote access|anydesk|teamviewer'),
+    re.compile(r'urgent(ly)?|immediately|right now'),
+    re.compile(r'(you have )?won|lottery|prize|refund')
+]
+
+
+def check_for_otp(text: str) -> bool:
+    text = text.lower()
+    return any(pattern.search(text) for pattern in OTP_PATTERNS)
+
+
+def heuristic_fraud_analysis(text: str) -> Dict:
+    """
+    Rough stand-in for the model's fraud analysis when it cannot be reached:
+    an OTP mention or two scam phrases classify the text as fraud. Results
+    are marked ``degraded`` and carry low confidence, and are never cached.
+    """
+    lowered = text.lower()
+    hits = sum(1 for pattern in SCAM_PATTERNS if pattern.search(lowered))
+    if check_for_otp(text):
+        hits += 2
+    if hits >= 2:
+        return {"classification": "FRAUD", "confidence": min(0.5 + 0.05 * hits, 0.7), "degraded": True}
+    return {"classification": "LEGITIMATE", "confidence": 0.5, "degraded": True}
@@ -1,13 +1,81 @@
 import google.generativeai as genai
-from typing import Dict
+from typing import AsyncIterator, Dict, List, Optional
+from pydantic import ValidationError
+import asyncio
 import os
+import time
 from dotenv import load_dotenv
 import json
 import re
 import logging
+from . import metrics, resilience
+from .fraud_heuristics import heuristic_fraud_analysis
+from .llm_batcher import LLM_BATCH_ENABLED, MicroBatcher
+from .llm_cache import ResponseCache, create_shared_tier
+from .resilience import DependencyUnavailable
+from ..models import FraudAnalysis, FraudAnalysisItem
 
 logger = logging.getLogger(__name__)
 
+GEMINI_MODEL = os.getenv('GEMINI_MODEL', 'gemini-2.0-flash-exp')
+# Bump whenever the fraud prompt changes so cached answers are not reused
+FRAUD_PROMPT_VERSION = "fraud-v3"
+# Gemini calls per text before a reply that fails validation is given up on
+FRAUD_REPLY_ATTEMPTS = 2
+
+# Response schemas for Gemini's structured output mode. The API schema has
+# no numeric bounds, so the confidence range is enforced by FraudAnalysis.
+_FRAUD_PROPERTIES = {
+    "classification": {"type": "string", "enum": ["FRAUD", "LEGITIMATE"]},
+    "confidence": {"type": "number", "description": "Confidence between 0 and 1"}
+}
+FRAUD_ANALYSIS_SCHEMA = {
+    "type": "object",
+    "properties": _FRAUD_PROPERTIES,
+    "required": ["classification", "confidence"]
+}
+FRAUD_BATCH_SCHEMA = {
+    "type": "array",
+    "items": {
+        "type": "object",
+        "properties": {"id": {"type": "string"}, **_FRAUD_PROPERTIES},
+        "required": ["id", "classification", "confidence"]
+    }
+}
+
+# Matches the verdict in a partially streamed JSON reply
+_VERDICT_PATTERN = re.compile(r'"classification"\s*:\s*"(FRAUD|LEGITIMATE)"')
+_JSON_FENCE = re.compile(r'```(?:json)?\s*|\s*```')
+
+class FraudAnalysisError(Exception):
+    pass
+
+def fraud_prompt(text: str) -> str:
+    return f"""Analyze the following text for potential fraud. Return only a JSON object with two fields:
+            - "classification": either "FRAUD" or "LEGITIMATE"
+            - "confidence": a float between 0 and 1 indicating confidence level
+            
+            Text to analyze: {text}
+            
+            Respond only with valid JSON."""
+
+def _generation_config(schema: Dict) -> genai.GenerationConfig:
+    return genai.GenerationConfig(response_mime_type="application/json", response_schema=schema)
+
+def parse_fraud_analysis(response_text: str) -> FraudAnalysis:
+    """
+    Validates a reply against ``FraudAnalysis``. Structured output makes
+    the strict parse succeed almost always; replies wrapped in markdown
+    fences are still accepted.
+    """
+    try:
+        return FraudAnalysis.model_validate_json(response_text)
+    except ValidationError:
+        try:
+            return FraudAnalysis.model_validate_json(_JSON_FENCE.sub('', response_text))
+        except ValidationError as e:
+            raise FraudAnalysisError(f"Invalid fraud analysis reply: {e.errors()[0]['msg']}")
+
 class GeminiService:
     def __init__(self):
         # Load environment variables
@@ -18,11 +86,18 @@ class GeminiService:
         
         # Configure Gemini
         genai.configure(api_key=self.api_key)
-        self.model = genai.GenerativeModel('gemini-2.0-flash-exp')
+        self.model = genai.GenerativeModel(GEMINI_MODEL)
+        self.cache = ResponseCache(GEMINI_MODEL, FRAUD_PROMPT_VERSION, shared=create_shared_tier())
+        self.batcher = MicroBatcher(self._analyze_fraud_batch) if LLM_BATCH_ENABLED else None
 
     async def analyze_fraud(self, text: str) -> Dict:
         """
-        Analyzes text for potential fraud using Gemini AI.
+        Analyzes text for potential fraud using Gemini AI. Answers are
+        cached by normalized text, model and prompt version, and cache
+        misses that arrive together are classified in one batched call.
+        While Gemini is unavailable, or keeps sending replies that do not
+        validate, a keyword heuristic answers instead and the result is
+        marked ``degraded``.
         
         Args:
             text (str): The text to analyze
@@ -34,26 +109,158 @@ class GeminiService:
             Exception: If analysis fails
         """
         try:
-            prompt = f"""Analyze the following text for potential fraud. Return only a JSON object with two fields:
+            return await self.cache.get_or_compute(text, lambda: self._classify(text))
+        except (DependencyUnavailable, FraudAnalysisError) as e:
+            logger.warning(f"{str(e)}, falling back to heuristic fraud analysis")
+            return heuristic_fraud_analysis(text)
+
+    async def _classify(self, text: str) -> Dict:
+        if self.batcher is None:
+            return await self._analyze_fraud_uncached(text)
+        return await self.batcher.submit(text)
+
+    async def _analyze_fraud_uncached(self, text: str) -> Dict:
+        """
+        Classifies one text. A reply that does not validate is asked for
+        again once; if the second one is no better ``FraudAnalysisError``
+        is raised, which ``analyze_fraud`` answers with the heuristic.
+        """
+        prompt = fraud_prompt(text)
+        for attempt in range(FRAUD_REPLY_ATTEMPTS):
+            try:
+                with metrics.timed(metrics.LLM_REQUEST_SECONDS, "gemini"):
+                    response = await resilience.gemini.call(
+                        self.model.generate_content_async,
+                        prompt,
+                        generation_config=_generation_config(FRAUD_ANALYSIS_SCHEMA)
+                    )
+            except DependencyUnavailable:
+                raise
+            except Exception as e:
+                logger.error(f"Gemini analysis failed: {str(e)}")
+                raise Exception(f"Failed to analyze text: {str(e)}")
+
+            try:
+                return parse_fraud_analysis(response.text).model_dump(mode="json")
+            except FraudAnalysisError as e:
+                logger.warning(f"Unusable Gemini reply (attempt {attempt + 1} of {FRAUD_REPLY_ATTEMPTS}): {str(e)}")
+                error = e
+        raise error
+
+    async def _analyze_fraud_batch(self, texts: List[str]) -> List:
+        """
+        Classifies several texts with one prompt. Each text gets an id and
+        the model answers with a JSON array keyed by those ids. Texts the
+        reply does not cover are retried one by one.
+        """
+        if len(texts) == 1:
+            return [await self._analyze_fraud_uncached(texts[0])]
+
+        items = json.dumps([{"id": str(i), "text": text} for i, text in enumerate(texts)], ensure_ascii=False)
+        prompt = f"""Analyze each of the following texts for potential fraud. Return only a JSON array with one object per text, each with three fields:
+            - "id": the id of the text
             - "classification": either "FRAUD" or "LEGITIMATE"
             - "confidence": a float between 0 and 1 indicating confidence level
             
-            Text to analyze: {text}
+            Texts to analyze, as a JSON array of objects with "id" and "text": {items}
             
             Respond only with valid JSON."""
 
-            response = self.model.generate_content(prompt)
-            
-            # Clean and parse the response
-            response_text = response.text
-            # Remove markdown code blocks if present
-            response_text = re.sub(r'```json\s*|\s*```', '', response_text)
-            # Parse the cleaned JSON string
-            return json.loads(response_text)
-            
+        try:
+            with metrics.timed(metrics.LLM_REQUEST_SECONDS, "gemini"):
+                response = await resilience.gemini.call(
+                    self.model.generate_content_async,
+                    prompt,
+                    generation_config=_generation_config(FRAUD_BATCH_SCHEMA)
+                )
+        except DependencyUnavailable:
+            raise
         except Exception as e:
-            logger.error(f"Gemini analysis failed: {str(e)}")
+            logger.error(f"Gemini batch analysis failed: {str(e)}")
             raise Exception(f"Failed to analyze text: {str(e)}")
 
+        verdicts = {}
+        try:
+            items = json.loads(_JSON_FENCE.sub('', response.text))
+        except ValueError as e:
+            logger.warning(f"Could not parse batched reply for {len(texts)} texts: {str(e)}")
+            items = []
+        # Items are validated one by one so a single bad entry only costs a retry of that text
+        for item in items if isinstance(items, list) else []:
+            try:
+                analysis = FraudAnalysisItem.model_validate(item)
+            except ValidationError:
+                continue
+            verdicts[analysis.id] = analysis.model_dump(mode="json", exclude={"id"})
+
+        missing = [i for i in range(len(texts)) if str(i) not in verdicts]
+        if missing:
+            logger.warning(f"Batched reply missed {len(missing)} of {len(texts)} texts, retrying them singly")
+            retried = await asyncio.gather(
+                *(self._analyze_fraud_uncached(texts[i]) for i in missing),
+                return_exceptions=True
+            )
+            verdicts.update({str(i): result for i, result in zip(missing, retried)})
+        return [verdicts[str(i)] for i in range(len(texts))]
+
+    async def analyze_fraud_stream(self, text: str) -> AsyncIterator[Dict]:
+        """
+        Streams a fraud analysis. Yields ``{"type": "verdict",
+        "classification": ...}`` as soon as the classification appears in
+        the streamed reply, then ``{"type": "result", ...}`` with the
+        validated analysis once the reply is complete. Cached answers are
+        yielded immediately and complete answers are cached. While Gemini
+        is unavailable the heuristic answer is yielded, marked ``degraded``.
+        """
+        cached = await self.cache.lookup(text)
+        if cached is not None:
+            yield {"type": "verdict", "classification": cached["classification"]}
+            yield {"type": "result", **cached}
+            return
+
+        started = time.perf_counter()
+        try:
+            response = await resilience.gemini.call(
+                self.model.generate_content_async,
+                fraud_prompt(text),
+                generation_config=_generation_config(FRAUD_ANALYSIS_SCHEMA),
+                stream=True
+            )
+        except DependencyUnavailable as e:
+            logger.warning(f"{str(e)}, falling back to heuristic fraud analysis")
+            analysis = heuristic_fraud_analysis(text)
+            yield {"type": "verdict", "classification": analysis["classification"]}
+            yield {"type": "result", **analysis}
+            return
+
+        reply = ""
+        verdict: Optional[str] = None
+        try:
+            async for chunk in response:
+                reply += chunk.text
+                if verdict is None and (match := _VERDICT_PATTERN.search(reply)):
+                    verdict = match.group(1)
+                    yield {"type": "verdict", "classification": verdict}
+        except Exception as e:
+            resilience.gemini.record_failure(e)
+            raise
+        finally:
+            metrics.observe(metrics.LLM_REQUEST_SECONDS, time.perf_counter() - started, "gemini")
+
+        try:
+            analysis = parse_fraud_analysis(reply).model_dump(mode="json")
+        except FraudAnalysisError as e:
+            # Asks once more without streaming, falling back to the heuristic
+            logger.warning(f"Unusable streamed Gemini reply, retrying: {str(e)}")
+            analysis = await self.analyze_fraud(text)
+            if verdict is None or analysis["classification"] != verdict:
+                yield {"type": "verdict", "classification": analysis["classification"]}
+            yield {"type": "result", **analysis}
+            return
+        await self.cache.store(text, analysis)
+        if verdict is None:
+            yield {"type": "verdict", "classification": analysis["classification"]}
+        yield {"type": "result", **analysis}
+
 # Create a singleton instance
 gemini_service = GeminiService()
\ No newline at end of file
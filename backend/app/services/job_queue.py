@@ -0,0 +1,348 @@
+import asyncio
+import json
+import logging
+import os
+import random
+import socket
+import uuid
+from datetime import datetime, timedelta, timezone
+from typing import Awaitable, Callable, Dict, List, Optional
+
+from sqlalchemy import and_, func, or_
+from sqlalchemy.orm import Session
+
+from . import tracing
+from .resilience import DependencyUnavailable
+from ..database import SessionLocal
+from ..models import Job
+
+logger = logging.getLogger(__name__)
+
+JOB_MAX_ATTEMPTS = int(os.getenv('JOB_MAX_ATTEMPTS', '5'))
+# A running job whose worker has not reported progress for this long is
+# assumed dead and handed to another worker
+JOB_LEASE_SECONDS = float(os.getenv('JOB_LEASE_SECONDS', '300'))
+# How often a worker renews the lease of each job it is running
+JOB_HEARTBEAT_SECONDS = float(os.getenv('JOB_HEARTBEAT_SECONDS', str(JOB_LEASE_SECONDS / 3)))
+JOB_POLL_SECONDS = float(os.getenv('JOB_POLL_SECONDS', '1'))
+JOB_RETRY_BASE_SECONDS = float(os.getenv('JOB_RETRY_BASE_SECONDS', '5'))
+JOB_RETRY_MAX_SECONDS = float(os.getenv('JOB_RETRY_MAX_SECONDS', '600'))
+JOB_WORKER_CONCURRENCY = int(os.getenv('JOB_WORKER_CONCURRENCY', '4'))
+
+QUEUED = 'queued'
+RUNNING = 'running'
+SUCCEEDED = 'succeeded'
+FAILED = 'failed'
+
+JobHandler = Callable[["JobRun"], Awaitable[None]]
+
+_handlers: Dict[str, JobHandler] = {}
+
+
+class PermanentJobError(Exception):
+    """Fails the job without further attempts, e.g. for audio that cannot be decoded."""
+
+
+class LeaseLost(Exception):
+    """The job was handed to another worker after this one stopped reporting progress."""
+
+
+def _utcnow() -> datetime:
+    return datetime.now(timezone.utc).replace(tzinfo=None)
+
+
+def handler(kind: str):
+    """Registers the coroutine function that runs jobs of ``kind``."""
+    def decorator(func: JobHandler) -> JobHandler:
+        _handlers[kind] = func
+        return func
+    return decorator
+
+
+def enqueue(
+    db: Session,
+    kind: str,
+    payload: dict,
+    idempotency_key: Optional[str] = None,
+    max_attempts: int = JOB_MAX_ATTEMPTS
+) -> Job:
+    """
+    Adds a job to ``db`` without committing, so it is stored in the same
+    transaction as the rows it refers to. If a job with the same
+    ``idempotency_key`` exists, whatever its status, it is returned instead.
+    """
+    if idempotency_key:
+        existing = find_job(db, idempotency_key)
+        if existing is not None:
+            return existing
+    job = Job(
+        kind=kind,
+        payload=json.dumps(payload),
+        idempotency_key=idempotency_key,
+        status=QUEUED,
+        max_attempts=max_attempts,
+        run_after=_utcnow()
+    )
+    db.add(job)
+    db.flush()
+    return job
+
+
+def find_job(db: Session, idempotency_key: str) -> Optional[Job]:
+    return db.query(Job).filter(Job.idempotency_key == idempotency_key).first()
+
+
+def queue_stats(db: Session) -> Dict[str, int]:
+    counts = dict(db.query(Job.status, func.count(Job.id)).group_by(Job.status).all())
+    return {status: counts.get(status, 0) for status in (QUEUED, RUNNING, SUCCEEDED, FAILED)}
+
+
+def job_to_dict(job: Job) -> dict:
+    return {
+        "id": job.id,
+        "kind": job.kind,
+        "status": job.status,
+        "stage": job.stage,
+        "attempts": job.attempts,
+        "max_attempts": job.max_attempts,
+        "payload": json.loads(job.payload),
+        "result": json.loads(job.result) if job.result else {},
+        "error": job.error,
+        "run_after": job.run_after,
+        "created_at": job.created_at,
+        "finished_at": job.finished_at
+    }
+
+
+def retry_delay(attempts: int, minimum: float = 0.0) -> float:
+    """Exponential backoff with full jitter, never below ``minimum``."""
+    ceiling = min(JOB_RETRY_BASE_SECONDS * 2 ** max(attempts - 1, 0), JOB_RETRY_MAX_SECONDS)
+    return max(random.uniform(ceiling / 2, ceiling), minimum)
+
+
+class JobRun:
+    """
+    One attempt at a job. Handlers split their work into named stages with
+    ``stage``; each finished stage is saved with the job, so a retry picks
+    up after the last stage that completed instead of starting over.
+    """
+
+    def __init__(self, job: Job, worker_id: str):
+        self.id = job.id
+        self.kind = job.kind
+        self.payload = json.loads(job.payload)
+        self.results = json.loads(job.result) if job.result else {}
+        self.attempts = job.attempts
+        self.max_attempts = job.max_attempts
+        self.worker_id = worker_id
+        self.lease_lost = False
+
+    async def stage(
+        self,
+        name: str,
+        compute: Callable[[], Awaitable[dict]],
+        persist: Optional[Callable[[Session, dict], None]] = None
+    ) -> dict:
+        """
+        Runs ``compute`` unless stage ``name`` already finished in an
+        earlier attempt, and returns its JSON-serializable result.
+        ``persist`` can add rows derived from the result; they are
+        committed together with the stage's progress, so a stage's side
+        effects happen exactly once even if the worker dies mid-job.
+        """
+        if name in self.results:
+            return self.results[name]
+        with tracing.span(f"job.{name}", **{"job.id": self.id, "job.kind": self.kind}):
+            value = await compute()
+            await asyncio.to_thread(self._save_stage, name, value, persist)
+        self.results[name] = value
+        return value
+
+    def _save_stage(self, name: str, value: dict, persist):
+        db = SessionLocal()
+        try:
+            job = self._owned_job(db)
+            if persist is not None:
+                persist(db, value)
+            job.stage = name
+            job.result = json.dumps({**self.results, name: value})
+            job.locked_until = _utcnow() + timedelta(seconds=JOB_LEASE_SECONDS)
+            db.commit()
+        except Exception:
+            db.rollback()
+            raise
+        finally:
+            db.close()
+
+    def _renew_lease(self) -> bool:
+        """Pushes ``locked_until`` back; False if another worker has taken the job."""
+        db = SessionLocal()
+        try:
+            renewed = db.query(Job).filter(
+                Job.id == self.id,
+                Job.status == RUNNING,
+                Job.locked_by == self.worker_id
+            ).update({
+                Job.locked_until: _utcnow() + timedelta(seconds=JOB_LEASE_SECONDS)
+            }, synchronize_session=False)
+            db.commit()
+            return bool(renewed)
+        finally:
+            db.close()
+
+    def _owned_job(self, db: Session) -> Job:
+        job = db.query(Job).filter(Job.id == self.id).first()
+        if job is None or job.status != RUNNING or job.locked_by != self.worker_id:
+            raise LeaseLost(f"Job {self.id} is no longer held by {self.worker_id}")
+        return job
+
+
+class JobWorker:
+    """
+    Claims due jobs from the ``jobs`` table and runs up to ``concurrency``
+    of them at once. Any number of workers, in any number of processes,
+    can share one database: a job is claimed with a conditional update, so
+    only one worker gets it, and its lease is renewed every
+    ``JOB_HEARTBEAT_SECONDS`` while it runs. A job whose lease was taken
+    over is cancelled.
+
+    Failed attempts are retried with exponential backoff until
+    ``max_attempts``; ``PermanentJobError`` fails the job at once.
+    """
+
+    def __init__(self, concurrency: int = JOB_WORKER_CONCURRENCY, poll_seconds: float = JOB_POLL_SECONDS):
+        self.concurrency = max(concurrency, 1)
+        self.poll_seconds = poll_seconds
+        self.worker_id = f"{socket.gethostname()}:{os.getpid()}:{uuid.uuid4().hex[:6]}"
+        self._running: Dict[int, asyncio.Task] = {}
+        self._stopping = asyncio.Event()
+
+    def stop(self):
+        self._stopping.set()
+
+    async def run(self):
+        logger.info(f"Job worker {self.worker_id} started with {self.concurrency} slot(s) for {', '.join(_handlers)}")
+        while not self._stopping.is_set():
+            free = self.concurrency - len(self._running)
+            claimed = await asyncio.to_thread(self._claim, free) if free else []
+            for job_id in claimed:
+                task = asyncio.create_task(self._execute(job_id))
+                self._running[job_id] = task
+                task.add_done_callback(lambda _, job_id=job_id: self._running.pop(job_id, None))
+            if len(claimed) < free or not free:
+                try:
+                    await asyncio.wait_for(self._stopping.wait(), self.poll_seconds)
+                except asyncio.TimeoutError:
+                    pass
+        if self._running:
+            logger.info(f"Waiting for {len(self._running)} running job(s) to finish")
+            await asyncio.gather(*self._running.values(), return_exceptions=True)
+
+    def _claim(self, limit: int) -> List[int]:
+        now = _utcnow()
+        due = or_(
+            and_(Job.status == QUEUED, Job.run_after <= now),
+            and_(Job.status == RUNNING, Job.locked_until < now)
+        )
+        db = SessionLocal()
+        try:
+            candidates = [
+                job_id for job_id, in db.query(Job.id).filter(
+                    due, Job.kind.in_(list(_handlers))
+                ).order_by(Job.run_after, Job.id).limit(limit).all()
+            ]
+            claimed = []
+            for job_id in candidates:
+                updated = db.query(Job).filter(Job.id == job_id, due).update({
+                    Job.status: RUNNING,
+                    Job.locked_by: self.worker_id,
+                    Job.locked_until: now + timedelta(seconds=JOB_LEASE_SECONDS),
+                    Job.attempts: Job.attempts + 1
+                }, synchronize_session=False)
+                db.commit()
+                if updated:
+                    claimed.append(job_id)
+            return claimed
+        finally:
+            db.close()
+
+    async def _execute(self, job_id: int):
+        db = SessionLocal()
+        try:
+            run = JobRun(db.query(Job).filter(Job.id == job_id).one(), self.worker_id)
+        finally:
+            db.close()
+
+        error = None
+        delay = None
+        with tracing.span("job.run", **{"job.id": run.id, "job.kind": run.kind, "job.attempt": run.attempts}):
+            try:
+                if run.attempts > run.max_attempts:
+                    raise PermanentJobError(f"Gave up after {run.max_attempts} attempts")
+                await self._run_with_heartbeat(run)
+            except LeaseLost as e:
+                logger.warning(str(e))
+                return
+            except PermanentJobError as e:
+                error = e
+            except DependencyUnavailable as e:
+                error = e
+                delay = retry_delay(run.attempts, e.retry_after)
+            except Exception as e:
+                logger.exception(f"Job {run.id} ({run.kind}) attempt {run.attempts} failed")
+                error = e
+                delay = retry_delay(run.attempts)
+        await asyncio.to_thread(self._finish, run, error, delay)
+
+    async def _run_with_heartbeat(self, run: JobRun):
+        task = asyncio.create_task(_handlers[run.kind](run))
+        heartbeat = asyncio.create_task(self._heartbeat(run, task))
+        try:
+            await task
+        except asyncio.CancelledError:
+            if run.lease_lost:
+                raise LeaseLost(f"Job {run.id} is no longer held by {self.worker_id}")
+            raise
+        finally:
+            heartbeat.cancel()
+
+    async def _heartbeat(self, run: JobRun, task: asyncio.Task):
+        while True:
+            await asyncio.sleep(JOB_HEARTBEAT_SECONDS)
+            try:
+                renewed = await asyncio.to_thread(run._renew_lease)
+            except Exception as e:
+                # The lease only lapses if this keeps failing until it expires
+                logger.warning(f"Could not renew the lease of job {run.id}: {str(e)}")
+                continue
+            if not renewed:
+                run.lease_lost = True
+                task.cancel()
+                return
+
+    def _finish(self, run: JobRun, error: Optional[Exception], delay: Optional[float]):
+        db = SessionLocal()
+        try:
+            job = run._owned_job(db)
+            job.locked_by = None
+            job.locked_until = None
+            if error is None:
+                job.status = SUCCEEDED
+                job.error = None
+                job.finished_at = _utcnow()
+                logger.info(f"Job {run.id} ({run.kind}) succeeded after {run.attempts} attempt(s)")
+            elif delay is not None and run.attempts < run.max_attempts:
+                job.status = QUEUED
+                job.error = str(error)
+                job.run_after = _utcnow() + timedelta(seconds=delay)
+                logger.warning(f"Job {run.id} ({run.kind}) will retry in {delay:.0f}s: {str(error)}")
+            else:
+                job.status = FAILED
+                job.error = str(error)
+                job.finished_at = _utcnow()
+                logger.error(f"Job {run.id} ({run.kind}) failed: {str(error)}")
+            db.commit()
+        except LeaseLost as e:
+            logger.warning(str(e))
+        finally:
+            db.close()
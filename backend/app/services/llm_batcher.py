@@ -0,0 +1,105 @@
+import asyncio
+import logging
+import os
+from typing import Any, Awaitable, Callable, List, Optional, Tuple
+
+from . import tracing
+
+logger = logging.getLogger(__name__)
+
+LLM_BATCH_ENABLED = os.getenv('LLM_BATCH_ENABLED', 'true').lower() == 'true'
+LLM_BATCH_MAX_SIZE = int(os.getenv('LLM_BATCH_MAX_SIZE', '16'))
+# How long the first request of a batch waits for others to join it
+LLM_BATCH_MAX_WAIT_MS = float(os.getenv('LLM_BATCH_MAX_WAIT_MS', '10'))
+
+
+class MicroBatcher:
+    """
+    Groups calls that arrive within ``max_wait_ms`` of each other into one
+    call to ``handler``.
+
+    ``handler`` receives a list of items and returns a list of the same
+    length with a result, or an exception instance, for each item. A batch
+    is sent as soon as it holds ``max_batch_size`` items or the first item
+    has waited ``max_wait_ms``. If ``handler`` raises, every caller in the
+    batch gets the error. Callers that are cancelled before their batch is
+    sent are dropped from it. Each batch runs in an ``llm.batch`` span
+    linked to the spans of all the callers it serves.
+    """
+
+    def __init__(
+        self,
+        handler: Callable[[List[Any]], Awaitable[List[Any]]],
+        max_batch_size: int = LLM_BATCH_MAX_SIZE,
+        max_wait_ms: float = LLM_BATCH_MAX_WAIT_MS
+    ):
+        self.handler = handler
+        self.max_batch_size = max(max_batch_size, 1)
+        self.max_wait = max_wait_ms / 1000
+        self._pending: List[Tuple[Any, asyncio.Future, Any]] = []
+        self._timer: Optional[asyncio.TimerHandle] = None
+        self._running = set()
+        self._batches = 0
+        self._items = 0
+        self._largest_batch = 0
+
+    async def submit(self, item: Any) -> Any:
+        loop = asyncio.get_running_loop()
+        future = loop.create_future()
+        self._pending.append((item, future, tracing.current_link()))
+        if len(self._pending) >= self.max_batch_size:
+            self._flush()
+        elif self._timer is None:
+            self._timer = loop.call_later(self.max_wait, self._flush)
+        return await future
+
+    def _flush(self):
+        if self._timer is not None:
+            self._timer.cancel()
+            self._timer = None
+
+        batch = [entry for entry in self._pending[:self.max_batch_size] if not entry[1].cancelled()]
+        self._pending = self._pending[self.max_batch_size:]
+        if self._pending:
+            self._timer = asyncio.get_running_loop().call_later(self.max_wait, self._flush)
+        if not batch:
+            return
+
+        self._batches += 1
+        self._items += len(batch)
+        self._largest_batch = max(self._largest_batch, len(batch))
+        task = asyncio.create_task(self._run(batch))
+        self._running.add(task)
+        task.add_done_callback(self._running.discard)
+
+    async def _run(self, batch: List[Tuple[Any, asyncio.Future, Any]]):
+        links = [link for _, _, link in batch if link is not None]
+        batch_span = tracing.start_span("llm.batch", links=links, **{"llm.batch_size": len(batch)})
+        try:
+            with tracing.use_span(batch_span):
+                results = await self.handler([item for item, _, _ in batch])
+        except Exception as e:
+            logger.error(f"Batch of {len(batch)} failed: {str(e)}")
+            results = [e] * len(batch)
+            tracing.end_span(batch_span, e)
+        else:
+            tracing.end_span(batch_span)
+
+        for (_, future, _), result in zip(batch, results):
+            if future.done():
+                continue
+            if isinstance(result, BaseException):
+                future.set_exception(result)
+            else:
+                future.set_result(result)
+
+    def stats(self) -> dict:
+        return {
+            "max_batch_size": self.max_batch_size,
+            "max_wait_ms": self.max_wait * 1000,
+            "batches": self._batches,
+            "items": self._items,
+            "mean_batch_size": round(self._items / self._batches, 2) if self._batches else 0.0,
+            "largest_batch": self._largest_batch,
+            "in_flight_batches": len(self._running)
+        }
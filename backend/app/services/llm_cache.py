@@ -0,0 +1,274 @@
+import asyncio
+import hashlib
+import json
+import logging
+import os
+import re
+import sqlite3
+import time
+import unicodedata
+from collections import OrderedDict
+from typing import Awaitable, Callable, Dict, Optional
+
+try:
+    import redis.asyncio as redis
+except ImportError:  # optional dependency
+    redis = None
+
+logger = logging.getLogger(__name__)
+
+LLM_CACHE_ENABLED = os.getenv('LLM_CACHE_ENABLED', 'true').lower() == 'true'
+LLM_CACHE_TTL_SECONDS = int(os.getenv('LLM_CACHE_TTL_SECONDS', str(24 * 3600)))
+LLM_CACHE_MAX_ENTRIES = int(os.getenv('LLM_CACHE_MAX_ENTRIES', '10000'))
+# Optional shared tier: "sqlite:///path/to/cache.db" or "redis://host:6379/0"
+LLM_CACHE_URL = os.getenv('LLM_CACHE_URL', '')
+
+_PUNCTUATION = re.compile(r'[^\w\s]')
+_DIGITS = re.compile(r'\d')
+_WHITESPACE = re.compile(r'\s+')
+# Bump whenever normalize_text changes, so entries stored under the old
+# normalization are not matched against texts it would now tell apart
+NORMALIZATION_VERSION = "n2"
+
+
+def normalize_text(text: str) -> str:
+    """
+    Folds texts that only differ in case, punctuation, spacing or the
+    actual digits of codes and amounts onto the same string, so replayed
+    transcripts and common scam scripts share a cache entry. Each digit
+    becomes ``0``, so numbers of different lengths stay distinct.
+    """
+    text = unicodedata.normalize('NFKC', text).casefold()
+    text = _PUNCTUATION.sub(' ', text)
+    text = _DIGITS.sub('0', text)
+    return _WHITESPACE.sub(' ', text).strip()
+
+
+def cache_key(text: str, model: str, prompt_version: str) -> str:
+    payload = f"{model}\0{prompt_version}\0{NORMALIZATION_VERSION}\0{normalize_text(text)}"
+    return hashlib.sha256(payload.encode('utf-8')).hexdigest()
+
+
+class MemoryTier:
+    """In-process LRU with a per-entry expiry."""
+
+    def __init__(self, max_entries: int = LLM_CACHE_MAX_ENTRIES):
+        self.max_entries = max_entries
+        self._entries: OrderedDict = OrderedDict()
+
+    def get(self, key: str) -> Optional[Dict]:
+        entry = self._entries.get(key)
+        if entry is None:
+            return None
+        value, expires_at = entry
+        if expires_at < time.time():
+            del self._entries[key]
+            return None
+        self._entries.move_to_end(key)
+        return value
+
+    def set(self, key: str, value: Dict, ttl: int):
+        self._entries[key] = (value, time.time() + ttl)
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+
+class SqliteTier:
+    """
+    Shared tier in a SQLite file, for several workers on one host. Calls
+    run in a thread so they never block the event loop.
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        self._connection = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+        self._connection.execute("PRAGMA journal_mode=WAL")
+        self._connection.execute(
+            "CREATE TABLE IF NOT EXISTS llm_cache "
+            "(key TEXT PRIMARY KEY, value TEXT NOT NULL, expires_at REAL NOT NULL)"
+        )
+        self._lock = asyncio.Lock()
+
+    def _get(self, key: str) -> Optional[str]:
+        row = self._connection.execute(
+            "SELECT value FROM llm_cache WHERE key = ? AND expires_at >= ?", (key, time.time())
+        ).fetchone()
+        return row[0] if row else None
+
+    def _set(self, key: str, value: str, ttl: int):
+        now = time.time()
+        self._connection.execute(
+            "INSERT OR REPLACE INTO llm_cache (key, value, expires_at) VALUES (?, ?, ?)",
+            (key, value, now + ttl)
+        )
+        self._connection.execute("DELETE FROM llm_cache WHERE expires_at < ?", (now,))
+
+    async def get(self, key: str) -> Optional[Dict]:
+        async with self._lock:
+            value = await asyncio.to_thread(self._get, key)
+        return json.loads(value) if value else None
+
+    async def set(self, key: str, value: Dict, ttl: int):
+        async with self._lock:
+            await asyncio.to_thread(self._set, key, json.dumps(value), ttl)
+
+
+class RedisTier:
+    """Shared tier in Redis or any server speaking its protocol."""
+
+    def __init__(self, url: str):
+        self._client = redis.from_url(url)
+
+    async def get(self, key: str) -> Optional[Dict]:
+        value = await self._client.get(f"llm_cache:{key}")
+        return json.loads(value) if value else None
+
+    async def set(self, key: str, value: Dict, ttl: int):
+        await self._client.set(f"llm_cache:{key}", json.dumps(value), ex=ttl)
+
+
+def create_shared_tier(url: str = LLM_CACHE_URL):
+    if not url:
+        return None
+    if url.startswith('sqlite:///'):
+        return SqliteTier(url[len('sqlite:///'):])
+    if url.startswith(('redis://', 'rediss://')):
+        if redis is None:
+            logger.warning("redis is not installed, LLM cache runs without a shared tier")
+            return None
+        return RedisTier(url)
+    logger.warning(f"Unsupported LLM_CACHE_URL {url}, LLM cache runs without a shared tier")
+    return None
+
+
+class ResponseCache:
+    """
+    Two-tier cache for LLM responses keyed by normalized text, model and
+    prompt version.
+
+    Lookups check the in-process LRU, then the optional shared tier, and
+    only then call the model. Concurrent misses for the same key share one
+    in-flight call. Failures are never cached. A shared tier that errors is
+    logged and skipped, so the cache can only make a call cheaper.
+    """
+
+    def __init__(
+        self,
+        model: str,
+        prompt_version: str,
+        ttl: int = LLM_CACHE_TTL_SECONDS,
+        memory: Optional[MemoryTier] = None,
+        shared=None,
+        enabled: bool = LLM_CACHE_ENABLED
+    ):
+        self.model = model
+        self.prompt_version = prompt_version
+        self.ttl = ttl
+        self.memory = memory or MemoryTier()
+        self.shared = shared
+        self.enabled = enabled
+        self._in_flight: Dict[str, asyncio.Future] = {}
+        self._counts = dict.fromkeys(("memory_hits", "shared_hits", "coalesced", "misses", "errors"), 0)
+
+    async def get_or_compute(self, text: str, compute: Callable[[], Awaitable[Dict]]) -> Dict:
+        if not self.enabled:
+            return await compute()
+
+        key = cache_key(text, self.model, self.prompt_version)
+        value = self.memory.get(key)
+        if value is not None:
+            self._counts["memory_hits"] += 1
+            return dict(value)
+
+        while (in_flight := self._in_flight.get(key)) is not None:
+            try:
+                value = await asyncio.shield(in_flight)
+            except asyncio.CancelledError:
+                # Retry as the leader if the call we joined was cancelled
+                if not in_flight.cancelled():
+                    raise
+                continue
+            self._counts["coalesced"] += 1
+            return dict(value)
+
+        future = asyncio.get_running_loop().create_future()
+        self._in_flight[key] = future
+        try:
+            value = await self._lookup_shared(key)
+            if value is None:
+                self._counts["misses"] += 1
+                value = await compute()
+                await self._store_shared(key, value)
+            self.memory.set(key, value, self.ttl)
+            future.set_result(value)
+            return dict(value)
+        except asyncio.CancelledError:
+            future.cancel()
+            raise
+        except Exception as e:
+            future.set_exception(e)
+            # Waiters re-raise it; mark it retrieved in case there are none
+            future.exception()
+            raise
+        finally:
+            del self._in_flight[key]
+
+    async def lookup(self, text: str) -> Optional[Dict]:
+        """Returns the cached answer for ``text`` from either tier, or None."""
+        if not self.enabled:
+            return None
+        key = cache_key(text, self.model, self.prompt_version)
+        value = self.memory.get(key)
+        if value is not None:
+            self._counts["memory_hits"] += 1
+            return dict(value)
+        value = await self._lookup_shared(key)
+        if value is None:
+            self._counts["misses"] += 1
+            return None
+        self.memory.set(key, value, self.ttl)
+        return dict(value)
+
+    async def store(self, text: str, value: Dict):
+        if not self.enabled:
+            return
+        key = cache_key(text, self.model, self.prompt_version)
+        self.memory.set(key, value, self.ttl)
+        await self._store_shared(key, value)
+
+    async def _lookup_shared(self, key: str) -> Optional[Dict]:
+        if self.shared is None:
+            return None
+        try:
+            value = await self.shared.get(key)
+        except Exception as e:
+            self._counts["errors"] += 1
+            logger.warning(f"LLM cache shared tier read failed: {str(e)}")
+            return None
+        if value is not None:
+            self._counts["shared_hits"] += 1
+        return value
+
+    async def _store_shared(self, key: str, value: Dict):
+        if self.shared is None:
+            return
+        try:
+            await self.shared.set(key, value, self.ttl)
+        except Exception as e:
+            self._counts["errors"] += 1
+            logger.warning(f"LLM cache shared tier write failed: {str(e)}")
+
+    def stats(self) -> dict:
+        hits = self._counts["memory_hits"] + self._counts["shared_hits"] + self._counts["coalesced"]
+        lookups = hits + self._counts["misses"]
+        return {
+            "enabled": self.enabled,
+            "entries": len(self.memory),
+            "shared_tier": type(self.shared).__name__ if self.shared else None,
+            **self._counts,
+            "hit_rate": round(hits / lookups, 4) if lookups else 0.0
+        }
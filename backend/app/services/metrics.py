@@ -0,0 +1,146 @@
+import contextvars
+import os
+import time
+from contextlib import contextmanager
+
+from prometheus_client import CONTENT_TYPE_LATEST, CollectorRegistry, Histogram, generate_latest
+from prometheus_client import REGISTRY, multiprocess
+from sqlalchemy import event
+from sqlalchemy.orm import Session
+
+# Set when the app runs under several worker processes; every worker then
+# writes its samples there and /metrics aggregates them
+PROMETHEUS_MULTIPROC_DIR = os.getenv('PROMETHEUS_MULTIPROC_DIR')
+
+LABELS = ('route', 'provider')
+
+_request_scope: contextvars.ContextVar = contextvars.ContextVar('metrics_request_scope', default=None)
+
+HTTP_REQUEST_SECONDS = Histogram(
+    'http_request_duration_seconds',
+    'Time to fully serve an HTTP request, including streamed bodies',
+    ('route', 'method', 'status'),
+    buckets=(0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 300)
+)
+AUDIO_DECODE_SECONDS = Histogram(
+    'audio_decode_seconds',
+    'Time to decode an upload or stored recording to PCM',
+    LABELS,
+    buckets=(0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120)
+)
+ASR_FIRST_PARTIAL_SECONDS = Histogram(
+    'asr_time_to_first_partial_seconds',
+    'Time from opening an ASR stream to its first result',
+    LABELS,
+    buckets=(0.1, 0.25, 0.5, 0.75, 1, 1.5, 2, 3, 5, 10)
+)
+ASR_STREAM_SECONDS = Histogram(
+    'asr_stream_duration_seconds',
+    'Lifetime of an ASR stream, from opening to closing',
+    LABELS,
+    buckets=(1, 5, 10, 30, 60, 120, 300, 600, 1800)
+)
+LLM_REQUEST_SECONDS = Histogram(
+    'llm_request_seconds',
+    'Latency of LLM calls, single, batched or streamed to completion',
+    LABELS,
+    buckets=(0.1, 0.25, 0.5, 1, 2, 3, 5, 10, 20, 30)
+)
+DB_COMMIT_SECONDS = Histogram(
+    'db_commit_seconds',
+    'Time to flush and commit a database session',
+    LABELS,
+    buckets=(0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1)
+)
+UPLOAD_BYTES = Histogram(
+    'upload_bytes',
+    'Size of uploaded audio and video, by where it was sent',
+    LABELS,
+    buckets=tuple(float(2 ** exponent) for exponent in range(14, 30, 2))
+)
+
+
+def current_route() -> str:
+    """
+    The route template of the request being handled, such as
+    ``/audio/{audio_id}/stream``, so labels stay low-cardinality. Work done
+    outside a request is labelled ``background``.
+    """
+    scope = _request_scope.get()
+    if scope is None:
+        return "background"
+    route = scope.get("route")
+    return getattr(route, "path", None) or "unmatched"
+
+
+def observe(histogram: Histogram, value: float, provider: str):
+    histogram.labels(route=current_route(), provider=provider or "none").observe(value)
+
+
+@contextmanager
+def timed(histogram: Histogram, provider: str):
+    """Observes the duration of the block, whether it succeeds or raises."""
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        observe(histogram, time.perf_counter() - started, provider)
+
+
+class MetricsMiddleware:
+    """
+    Makes the request scope available to ``current_route`` and records
+    ``http_request_duration_seconds``. The route is read from the scope
+    after routing, so it is known by the time anything is observed.
+    """
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        status = 500
+        started = time.perf_counter()
+        token = _request_scope.set(scope)
+
+        async def send_with_status(message):
+            nonlocal status
+            if message["type"] == "http.response.start":
+                status = message["status"]
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_with_status)
+        finally:
+            HTTP_REQUEST_SECONDS.labels(
+                route=current_route(),
+                method=scope["method"],
+                status=str(status)
+            ).observe(time.perf_counter() - started)
+            _request_scope.reset(token)
+
+
+@event.listens_for(Session, "before_commit")
+def _commit_started(session: Session):
+    session.info["commit_started"] = time.perf_counter()
+
+
+@event.listens_for(Session, "after_commit")
+def _commit_finished(session: Session):
+    started = session.info.pop("commit_started", None)
+    if started is not None:
+        dialect = session.bind.dialect.name if session.bind is not None else "none"
+        observe(DB_COMMIT_SECONDS, time.perf_counter() - started, dialect)
+
+
+def render_metrics():
+    """Returns the exposition body and its content type."""
+    if PROMETHEUS_MULTIPROC_DIR:
+        registry = CollectorRegistry()
+        multiprocess.MultiProcessCollector(registry)
+    else:
+        registry = REGISTRY
+    return generate_latest(registry), CONTENT_TYPE_LATEST
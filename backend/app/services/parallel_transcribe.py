@@ -0,0 +1,250 @@
+import asyncio
+import logging
+import os
+import time
+from dataclasses import dataclass, replace
+from typing import Dict, List, Optional
+
+import numpy as np
+
+from .asr import AsrProvider
+from .audio_feeder import AUDIO_FEED_PACE, PacingMode, PcmFeeder
+from .resilience import deadline
+from .transcript_stream import TranscribeStreamSession, TranscriptUpdate
+
+logger = logging.getLogger(__name__)
+
+PARALLEL_SEGMENT_SECONDS = float(os.getenv('PARALLEL_SEGMENT_SECONDS', '120'))
+PARALLEL_OVERLAP_SECONDS = float(os.getenv('PARALLEL_OVERLAP_SECONDS', '2'))
+# How far before each target cut to look for the quietest point
+PARALLEL_CUT_SEARCH_SECONDS = float(os.getenv('PARALLEL_CUT_SEARCH_SECONDS', '10'))
+# Upper bound on concurrent ASR streams across all requests
+PARALLEL_MAX_STREAMS = int(os.getenv('PARALLEL_MAX_STREAMS', '8'))
+
+CUT_FRAME_MS = 30
+
+_stream_slots = asyncio.Semaphore(PARALLEL_MAX_STREAMS)
+
+
+@dataclass
+class PcmSegment:
+    """
+    One piece of a recording, in samples. ``start``/``end`` is the audio
+    sent to Transcribe, including the overlap; ``core_start``/``core_end``
+    is the part of the timeline this segment is responsible for.
+    """
+    index: int
+    start: int
+    end: int
+    core_start: int
+    core_end: int
+
+
+def find_cut_points(
+    samples: np.ndarray,
+    sample_rate: int,
+    segment_seconds: float = PARALLEL_SEGMENT_SECONDS,
+    search_seconds: float = PARALLEL_CUT_SEARCH_SECONDS
+) -> List[int]:
+    """
+    Returns sample offsets at which to split ``samples`` into pieces of at
+    most ``segment_seconds``. Each cut is placed at the quietest
+    ``CUT_FRAME_MS`` frame in the ``search_seconds`` before the target, so
+    cuts land in pauses between words. Only the search windows are
+    analysed, never the whole recording.
+    """
+    segment = int(segment_seconds * sample_rate)
+    search = int(min(search_seconds, segment_seconds / 2) * sample_rate)
+    frame = sample_rate * CUT_FRAME_MS // 1000
+
+    cuts = []
+    position = 0
+    while len(samples) - position > segment:
+        target = position + segment
+        window_start = max(target - search, position + frame)
+        frames = len(samples[window_start:target]) // frame
+        if frames == 0:
+            cut = target
+        else:
+            window = samples[window_start:window_start + frames * frame].reshape(frames, frame)
+            energy = np.square(window.astype(np.float32)).mean(axis=1)
+            cut = window_start + int(np.argmin(energy)) * frame + frame // 2
+        cuts.append(cut)
+        position = cut
+    return cuts
+
+
+def plan_segments(
+    samples: np.ndarray,
+    sample_rate: int,
+    segment_seconds: float = PARALLEL_SEGMENT_SECONDS,
+    overlap_seconds: float = PARALLEL_OVERLAP_SECONDS
+) -> List[PcmSegment]:
+    bounds = [0, *find_cut_points(samples, sample_rate, segment_seconds), len(samples)]
+    overlap = int(overlap_seconds * sample_rate)
+    return [
+        PcmSegment(
+            index=index,
+            start=max(core_start - overlap, 0),
+            end=min(core_end + overlap, len(samples)),
+            core_start=core_start,
+            core_end=core_end
+        )
+        for index, (core_start, core_end) in enumerate(zip(bounds, bounds[1:]))
+    ]
+
+
+async def _transcribe_segment(
+    pcm: memoryview,
+    segment: PcmSegment,
+    sample_rate: int,
+    language_code: str,
+    pace: PacingMode,
+    provider: Optional[AsrProvider]
+) -> List[TranscriptUpdate]:
+    # VAD is off so Transcribe timestamps map straight onto the recording
+    feeder = PcmFeeder(sample_rate=sample_rate, pace=pace, vad=None)
+    offset = segment.start / sample_rate
+    finals = []
+    async with _stream_slots:
+        started = time.monotonic()
+        async with TranscribeStreamSession(
+            pcm[segment.start * 2:segment.end * 2],
+            sample_rate=sample_rate,
+            language_code=language_code,
+            feeder=feeder,
+            provider=provider
+        ) as session:
+            async for update in session.updates(coalesce_ms=0):
+                if not update.is_partial:
+                    finals.append(replace(
+                        update,
+                        start_time=update.start_time + offset,
+                        end_time=update.end_time + offset,
+                        words=tuple(
+                            replace(word, start_time=word.start_time + offset, end_time=word.end_time + offset)
+                            for word in update.words
+                        )
+                    ))
+    logger.info(
+        f"Segment {segment.index} ({(segment.end - segment.start) / sample_rate:.1f}s) "
+        f"transcribed in {time.monotonic() - started:.1f}s"
+    )
+    return finals
+
+
+def _trim_to_core(update: TranscriptUpdate, in_core) -> Optional[TranscriptUpdate]:
+    """
+    Keeps the part of ``update`` that falls in a segment's core range.
+    With word timings each word is kept or dropped by its midpoint, so a
+    result spanning a cut is split between the segments on either side;
+    without them the whole result goes by its own midpoint.
+    """
+    if not update.words:
+        return update if in_core((update.start_time + update.end_time) / 2) else None
+    words = tuple(word for word in update.words if in_core((word.start_time + word.end_time) / 2))
+    if not words:
+        return None
+    if len(words) == len(update.words):
+        return update
+    return replace(
+        update,
+        text=" ".join(word.text for word in words),
+        start_time=words[0].start_time,
+        end_time=words[-1].end_time,
+        words=words
+    )
+
+
+def stitch_segments(
+    segments: List[PcmSegment],
+    results: List[List[TranscriptUpdate]],
+    sample_rate: int
+) -> List[TranscriptUpdate]:
+    """
+    Merges per-segment results into one timeline. Neighbouring segments
+    both transcribe their shared overlap, so each segment only keeps what
+    falls in its core range; the overlap is split at its middle, which is
+    the cut point, and every word appears once.
+    """
+    timeline = []
+    last = len(segments) - 1
+    for segment, updates in zip(segments, results):
+        core_start = segment.core_start / sample_rate
+        core_end = segment.core_end / sample_rate
+
+        def in_core(seconds: float) -> bool:
+            return (segment.index == 0 or seconds >= core_start) and (segment.index == last or seconds < core_end)
+
+        for update in updates:
+            trimmed = _trim_to_core(update, in_core)
+            if trimmed is not None:
+                timeline.append(trimmed)
+    timeline.sort(key=lambda update: update.start_time)
+    return timeline
+
+
+async def transcribe_parallel(
+    pcm,
+    sample_rate: int = 16000,
+    language_code: str = "en-US",
+    segment_seconds: float = PARALLEL_SEGMENT_SECONDS,
+    overlap_seconds: float = PARALLEL_OVERLAP_SECONDS,
+    pace: PacingMode = AUDIO_FEED_PACE,
+    provider: Optional[AsrProvider] = None
+) -> Dict:
+    """
+    Transcribes a long 16-bit mono PCM buffer by splitting it at pauses into
+    overlapping segments and streaming them to the ASR provider concurrently, at
+    most ``PARALLEL_MAX_STREAMS`` at a time. Segments are views over
+    ``pcm``; nothing is copied. If any segment fails the others are
+    cancelled and the error is raised.
+
+    Returns the stitched text and its timeline: one entry per result with
+    its word timings. With real-time pacing the wall time is about one
+    segment's length while there are at most ``PARALLEL_MAX_STREAMS``
+    segments; beyond that, segments queue for a stream slot and it grows
+    with ``segments / PARALLEL_MAX_STREAMS``.
+    """
+    view = memoryview(pcm).cast('B')
+    samples = np.frombuffer(view[:len(view) - len(view) % 2], dtype=np.int16)
+    segments = plan_segments(samples, sample_rate, segment_seconds, overlap_seconds)
+    logger.info(f"Transcribing {len(samples) / sample_rate:.1f}s of audio in {len(segments)} segments")
+
+    started = time.monotonic()
+    # Later segments wait for a stream slot, possibly past the request
+    # deadline, so the per-call timeouts bound their stream starts instead
+    with deadline(None):
+        tasks = [
+            asyncio.create_task(_transcribe_segment(view, segment, sample_rate, language_code, pace, provider))
+            for segment in segments
+        ]
+    try:
+        results = await asyncio.gather(*tasks)
+    except BaseException:
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+        raise
+
+    timeline = stitch_segments(segments, results, sample_rate)
+    return {
+        "transcription": " ".join(update.text for update in timeline).strip(),
+        "segments": [
+            {
+                "start": round(update.start_time, 2),
+                "end": round(update.end_time, 2),
+                "text": update.text,
+                "words": [
+                    {"text": word.text, "start": round(word.start_time, 2), "end": round(word.end_time, 2)}
+                    for word in update.words
+                ]
+            }
+            for update in timeline
+        ],
+        "stats": {
+            "segments": len(segments),
+            "audio_seconds": round(len(samples) / sample_rate, 2),
+            "wall_seconds": round(time.monotonic() - started, 2)
+        }
+    }
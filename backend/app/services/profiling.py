@@ -0,0 +1,104 @@
+import cProfile
+import logging
+import os
+import re
+import time
+import uuid
+from urllib.parse import parse_qs
+
+try:
+    from pyinstrument import Profiler
+    from pyinstrument.renderers import HTMLRenderer, SpeedscopeRenderer
+except ImportError:  # optional dependency
+    Profiler = None
+
+logger = logging.getLogger(__name__)
+
+# "off", "param" to profile requests sent with ?profile=1, or "all"
+PROFILING = os.getenv('PROFILING', 'off')
+PROFILE_DIR = os.getenv('PROFILE_DIR', 'profiles')
+# pyinstrument output: "html", or "speedscope" for a flamegraph in speedscope.app
+PROFILE_FORMAT = os.getenv('PROFILE_FORMAT', 'html')
+
+PROFILE_HEADER = b'x-profile'
+
+_UNSAFE_CHARACTERS = re.compile(r'[^A-Za-z0-9]+')
+
+
+class ProfilingMiddleware:
+    """
+    Profiles whole requests, streamed responses included, and writes one
+    file per request to ``PROFILE_DIR``, named in the ``X-Profile``
+    response header.
+
+    pyinstrument is used when installed; it follows the request's own
+    coroutines across awaits. Otherwise cProfile writes a ``.prof`` dump,
+    which covers everything the event loop ran meanwhile. Either way only
+    one request is profiled at a time and others pass through, so this is
+    meant for investigating single requests, not for production traffic.
+    """
+
+    def __init__(self, app, mode: str = PROFILING, directory: str = PROFILE_DIR, fmt: str = PROFILE_FORMAT):
+        self.app = app
+        self.mode = mode
+        self.directory = directory
+        self.fmt = fmt
+        self._active = False
+
+    def _wanted(self, scope) -> bool:
+        if self.mode == 'all':
+            return True
+        if self.mode != 'param':
+            return False
+        values = parse_qs(scope.get("query_string", b"").decode('latin-1')).get('profile', [])
+        return any(value.lower() in ('1', 'true') for value in values)
+
+    def _path(self, scope) -> str:
+        slug = _UNSAFE_CHARACTERS.sub('-', scope["path"]).strip('-') or 'root'
+        if Profiler is None:
+            extension = 'prof'
+        else:
+            extension = 'speedscope.json' if self.fmt == 'speedscope' else 'html'
+        name = f"{time.strftime('%Y%m%d-%H%M%S')}-{scope['method']}-{slug}-{uuid.uuid4().hex[:8]}.{extension}"
+        return os.path.join(self.directory, name)
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or self._active or not self._wanted(scope):
+            await self.app(scope, receive, send)
+            return
+
+        self._active = True
+        path = self._path(scope)
+
+        async def send_with_profile(message):
+            if message["type"] == "http.response.start":
+                message["headers"] = [*message.get("headers", []), (PROFILE_HEADER, os.path.basename(path).encode())]
+            await send(message)
+
+        if Profiler is not None:
+            profiler = Profiler(async_mode='enabled')
+            profiler.start()
+        else:
+            profiler = cProfile.Profile()
+            profiler.enable()
+        try:
+            await self.app(scope, receive, send_with_profile)
+        finally:
+            try:
+                self._write(profiler, path)
+                logger.info(f"Profiled {scope['method']} {scope['path']} to {path}")
+            except Exception as e:
+                logger.error(f"Failed to write profile {path}: {str(e)}")
+            finally:
+                self._active = False
+
+    def _write(self, profiler, path: str):
+        os.makedirs(self.directory, exist_ok=True)
+        if Profiler is None:
+            profiler.disable()
+            profiler.dump_stats(path)
+            return
+        profiler.stop()
+        renderer = SpeedscopeRenderer() if self.fmt == 'speedscope' else HTMLRenderer()
+        with open(path, 'w') as out:
+            out.write(profiler.output(renderer))
@@ -0,0 +1,367 @@
+import asyncio
+import contextvars
+import logging
+import os
+import time
+from contextlib import contextmanager
+from typing import Awaitable, Callable, Dict, Optional
+
+from botocore.exceptions import ClientError, ParamValidationError
+
+from . import tracing
+
+logger = logging.getLogger(__name__)
+
+# Consecutive failures that open a breaker, and how long it stays open
+BREAKER_FAILURE_THRESHOLD = int(os.getenv('BREAKER_FAILURE_THRESHOLD', '5'))
+BREAKER_RESET_SECONDS = float(os.getenv('BREAKER_RESET_SECONDS', '30'))
+# How long a call waits for a free bulkhead slot before it is rejected
+BULKHEAD_MAX_WAIT_SECONDS = float(os.getenv('BULKHEAD_MAX_WAIT_SECONDS', '1'))
+# Deadline for requests that do not send X-Request-Timeout; 0 disables it
+REQUEST_DEADLINE_SECONDS = float(os.getenv('REQUEST_DEADLINE_SECONDS', '120'))
+REQUEST_DEADLINE_HEADER = b'x-request-timeout'
+
+_THROTTLING_CODES = {'ThrottlingException', 'Throttling', 'TooManyRequestsException', 'ProvisionedThroughputExceededException'}
+
+_deadline: contextvars.ContextVar[Optional[float]] = contextvars.ContextVar('request_deadline', default=None)
+
+
+class DependencyUnavailable(Exception):
+    """An external dependency was not called, or gave up, to protect the service."""
+
+    def __init__(self, dependency: str, message: str, retry_after: float = 0.0):
+        super().__init__(message)
+        self.dependency = dependency
+        self.retry_after = retry_after
+
+
+class CircuitOpen(DependencyUnavailable):
+    pass
+
+
+class BulkheadFull(DependencyUnavailable):
+    pass
+
+
+class DeadlineExceeded(DependencyUnavailable):
+    pass
+
+
+@contextmanager
+def deadline(seconds: Optional[float]):
+    """
+    Sets the deadline for dependency calls made in this block, including
+    tasks created inside it. ``None`` clears it, for background work that
+    outlives the request.
+    """
+    token = _deadline.set(time.monotonic() + seconds if seconds else None)
+    try:
+        yield
+    finally:
+        _deadline.reset(token)
+
+
+def remaining_time() -> Optional[float]:
+    """Seconds left before the current request's deadline, or None."""
+    expires_at = _deadline.get()
+    return None if expires_at is None else expires_at - time.monotonic()
+
+
+class DeadlineMiddleware:
+    """
+    Gives every HTTP request a deadline, taken from the ``X-Request-Timeout``
+    header in seconds or ``REQUEST_DEADLINE_SECONDS``. ``route_seconds``
+    replaces the default for paths whose work legitimately runs longer.
+    Dependency calls made while handling the request, SSE generators
+    included, never wait past it.
+    """
+
+    def __init__(
+        self,
+        app,
+        default_seconds: float = REQUEST_DEADLINE_SECONDS,
+        route_seconds: Optional[Dict[str, float]] = None
+    ):
+        self.app = app
+        self.default_seconds = default_seconds
+        self.route_seconds = route_seconds or {}
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        seconds = self.route_seconds.get(scope.get("path"), self.default_seconds)
+        header = dict(scope.get("headers") or []).get(REQUEST_DEADLINE_HEADER)
+        if header:
+            try:
+                seconds = max(float(header), 0.001)
+            except ValueError:
+                pass
+        with deadline(seconds):
+            await self.app(scope, receive, send)
+
+
+def is_dependency_fault(exc: BaseException) -> bool:
+    """
+    Whether ``exc`` says the dependency is unhealthy. Client errors such as
+    a bad request, a missing session or parameters botocore rejects before
+    sending are the caller's fault and do not count against the breaker;
+    throttling and server errors do.
+    """
+    if isinstance(exc, ParamValidationError):
+        return False
+    if isinstance(exc, ClientError):
+        error = exc.response.get('Error', {})
+        status = exc.response.get('ResponseMetadata', {}).get('HTTPStatusCode') or 500
+        return status >= 500 or error.get('Code') in _THROTTLING_CODES
+    code = getattr(exc, 'code', None)
+    if isinstance(code, int) and 400 <= code < 500:
+        return code == 429
+    return True
+
+
+class CircuitBreaker:
+    """
+    Consecutive-failure breaker. After ``failure_threshold`` failures in a
+    row it opens and rejects calls for ``reset_seconds``, then lets a single
+    probe through; the probe's outcome closes it or opens it again.
+    """
+
+    CLOSED = "closed"
+    OPEN = "open"
+    HALF_OPEN = "half_open"
+
+    def __init__(
+        self,
+        name: str,
+        failure_threshold: int = BREAKER_FAILURE_THRESHOLD,
+        reset_seconds: float = BREAKER_RESET_SECONDS
+    ):
+        self.name = name
+        self.failure_threshold = max(failure_threshold, 1)
+        self.reset_seconds = reset_seconds
+        self.state = self.CLOSED
+        self._failures = 0
+        self._opened_at = 0.0
+        self._probing = False
+
+    def allow(self) -> bool:
+        if self.state == self.CLOSED:
+            return True
+        if self.state == self.OPEN:
+            if self.retry_after() > 0:
+                return False
+            self.state = self.HALF_OPEN
+            self._probing = False
+        if self._probing:
+            return False
+        self._probing = True
+        return True
+
+    def retry_after(self) -> float:
+        if self.state != self.OPEN:
+            return 0.0
+        return max(self.reset_seconds - (time.monotonic() - self._opened_at), 0.0)
+
+    def record_success(self):
+        if self.state != self.CLOSED:
+            logger.info(f"Circuit for {self.name} closed")
+        self.state = self.CLOSED
+        self._failures = 0
+        self._probing = False
+
+    def record_failure(self):
+        self._failures += 1
+        self._probing = False
+        if self.state == self.HALF_OPEN or (self.state == self.CLOSED and self._failures >= self.failure_threshold):
+            logger.warning(f"Circuit for {self.name} opened after {self._failures} failure(s)")
+            self.state = self.OPEN
+            self._opened_at = time.monotonic()
+
+    def release_probe(self):
+        """Lets another probe through when one was cancelled without an outcome."""
+        self._probing = False
+
+
+class Bulkhead:
+    """Caps concurrent calls to one dependency; excess calls wait briefly, then fail."""
+
+    def __init__(self, name: str, max_concurrency: int, max_wait: float = BULKHEAD_MAX_WAIT_SECONDS):
+        self.name = name
+        self.max_concurrency = max(max_concurrency, 1)
+        self.max_wait = max_wait
+        self._slots = asyncio.Semaphore(self.max_concurrency)
+        self.active = 0
+
+    async def acquire(self, timeout: float):
+        wait = min(self.max_wait, timeout)
+        if self._slots.locked() and wait <= 0:
+            raise BulkheadFull(self.name, f"{self.name} is at its limit of {self.max_concurrency} concurrent calls")
+        try:
+            await asyncio.wait_for(self._slots.acquire(), wait)
+        except asyncio.TimeoutError:
+            raise BulkheadFull(self.name, f"{self.name} is at its limit of {self.max_concurrency} concurrent calls")
+        self.active += 1
+
+    def release(self):
+        self.active -= 1
+        self._slots.release()
+
+
+class Dependency:
+    """
+    Guards calls to one external service with a circuit breaker, a
+    bulkhead and a per-call timeout that never outlives the request
+    deadline.
+
+    ``call`` awaits a coroutine function. ``call_blocking`` runs a blocking
+    SDK call in a thread; a thread that times out keeps its bulkhead slot
+    until it actually returns, so slow calls cannot pile up threads beyond
+    ``max_concurrency``. Both raise a ``DependencyUnavailable`` subclass
+    when the call is short-circuited, rejected or timed out, and re-raise
+    the dependency's own errors otherwise.
+    """
+
+    def __init__(
+        self,
+        name: str,
+        max_concurrency: int,
+        timeout: float,
+        failure_threshold: int = BREAKER_FAILURE_THRESHOLD,
+        reset_seconds: float = BREAKER_RESET_SECONDS,
+        max_wait: float = BULKHEAD_MAX_WAIT_SECONDS
+    ):
+        self.name = name
+        self.timeout = timeout
+        self.breaker = CircuitBreaker(name, failure_threshold, reset_seconds)
+        self.bulkhead = Bulkhead(name, max_concurrency, max_wait)
+        self._counts = dict.fromkeys(
+            ("calls", "succeeded", "failed", "timed_out", "short_circuited", "rejected"), 0
+        )
+
+    def _call_timeout(self) -> float:
+        remaining = remaining_time()
+        if remaining is None:
+            return self.timeout
+        if remaining <= 0:
+            self._counts["timed_out"] += 1
+            raise DeadlineExceeded(self.name, f"Request deadline passed before calling {self.name}")
+        return min(self.timeout, remaining)
+
+    async def _admit(self) -> float:
+        self._counts["calls"] += 1
+        timeout = self._call_timeout()
+        if not self.breaker.allow():
+            self._counts["short_circuited"] += 1
+            raise CircuitOpen(
+                self.name,
+                f"{self.name} is unavailable (circuit open)",
+                retry_after=self.breaker.retry_after()
+            )
+        started = time.monotonic()
+        try:
+            await self.bulkhead.acquire(timeout)
+        except BulkheadFull:
+            self._counts["rejected"] += 1
+            self.breaker.release_probe()
+            raise
+        return timeout - (time.monotonic() - started)
+
+    def record_success(self):
+        self._counts["succeeded"] += 1
+        self.breaker.record_success()
+
+    def record_failure(self, exc: BaseException):
+        """Records the outcome of work the dependency failed outside ``call``, such as a dropped stream."""
+        if isinstance(exc, asyncio.TimeoutError):
+            self._counts["timed_out"] += 1
+            self.breaker.record_failure()
+        elif is_dependency_fault(exc):
+            self._counts["failed"] += 1
+            self.breaker.record_failure()
+        else:
+            self.record_success()
+
+    async def _guard(self, future: asyncio.Future, timeout: float):
+        try:
+            result = await asyncio.wait_for(asyncio.shield(future), timeout)
+        except asyncio.TimeoutError as e:
+            self.record_failure(e)
+            raise DeadlineExceeded(self.name, f"{self.name} did not answer within {timeout:.1f}s")
+        except asyncio.CancelledError:
+            self.breaker.release_probe()
+            raise
+        except Exception as e:
+            self.record_failure(e)
+            raise
+        self.record_success()
+        return result
+
+    async def call(self, func: Callable[..., Awaitable], *args, **kwargs):
+        with tracing.span(f"{self.name}.{func.__name__}", **{"dependency.name": self.name}):
+            return await self._call(func, *args, **kwargs)
+
+    async def call_blocking(self, func: Callable, *args, **kwargs):
+        with tracing.span(f"{self.name}.{func.__name__}", **{"dependency.name": self.name}):
+            return await self._call_blocking(func, *args, **kwargs)
+
+    async def _call(self, func: Callable[..., Awaitable], *args, **kwargs):
+        timeout = await self._admit()
+        future = asyncio.ensure_future(func(*args, **kwargs))
+        try:
+            return await self._guard(future, timeout)
+        finally:
+            future.cancel()
+            self.bulkhead.release()
+
+    async def _call_blocking(self, func: Callable, *args, **kwargs):
+        timeout = await self._admit()
+        future = asyncio.ensure_future(asyncio.to_thread(func, *args, **kwargs))
+        try:
+            return await self._guard(future, timeout)
+        finally:
+            if future.done():
+                self.bulkhead.release()
+            else:
+                future.add_done_callback(self._release_abandoned)
+
+    def _release_abandoned(self, future: asyncio.Future):
+        if not future.cancelled():
+            future.exception()
+        self.bulkhead.release()
+
+    def stats(self) -> dict:
+        return {
+            "state": self.breaker.state,
+            "retry_after_seconds": round(self.breaker.retry_after(), 1),
+            "active": self.bulkhead.active,
+            "max_concurrency": self.bulkhead.max_concurrency,
+            "timeout_seconds": self.timeout,
+            **self._counts
+        }
+
+
+def _dependency(name: str, max_concurrency: int, timeout: float) -> Dependency:
+    """Builds a ``Dependency`` whose limits can be overridden with ``<NAME>_MAX_CONCURRENCY`` and ``<NAME>_TIMEOUT_SECONDS``."""
+    prefix = name.upper()
+    return Dependency(
+        name,
+        max_concurrency=int(os.getenv(f'{prefix}_MAX_CONCURRENCY', str(max_concurrency))),
+        timeout=float(os.getenv(f'{prefix}_TIMEOUT_SECONDS', str(timeout)))
+    )
+
+
+gemini = _dependency('gemini', max_concurrency=16, timeout=20)
+# Guards opening streams and submitting batch jobs, not the stream itself
+transcribe = _dependency('transcribe', max_concurrency=25, timeout=10)
+rekognition = _dependency('rekognition', max_concurrency=10, timeout=10)
+frauddetector = _dependency('frauddetector', max_concurrency=20, timeout=5)
+
+_dependencies: Dict[str, Dependency] = {
+    dependency.name: dependency for dependency in (gemini, transcribe, rekognition, frauddetector)
+}
+
+
+def dependency_stats() -> Dict[str, dict]:
+    return {name: dependency.stats() for name, dependency in _dependencies.items()}
@@ -0,0 +1,469 @@
+import asyncio
+import fcntl
+import hashlib
+import json
+import logging
+import os
+import uuid
+from collections import OrderedDict
+from datetime import datetime, timedelta, timezone
+from typing import AsyncIterator, Optional
+
+from sqlalchemy.orm import Session
+
+from . import metrics, tracing
+from .aws_clients import get_client
+from .s3_service import S3_DELETE_BATCH_SIZE, S3MultipartUploader
+from .uploads import store_audio_file, store_demo_file
+from ..database import SessionLocal
+from ..models import ResumableUpload
+
+logger = logging.getLogger(__name__)
+
+# Staging files for uploads in progress. Like the SQLite file, it must be
+# shared by every API process that serves the same uploads.
+UPLOAD_DIR = os.getenv('UPLOAD_DIR', 'uploads')
+UPLOAD_MAX_BYTES = int(float(os.getenv('UPLOAD_MAX_MB', '500')) * 1024 * 1024)
+# An upload that receives no data for this long is deleted by the temp reaper
+UPLOAD_EXPIRY_HOURS = float(os.getenv('UPLOAD_EXPIRY_HOURS', '24'))
+# Received bytes are buffered up to this size before each staging write
+UPLOAD_WRITE_SIZE = int(os.getenv('UPLOAD_WRITE_SIZE', str(1024 * 1024)))
+# Hash states kept in memory so appends do not re-read what was received
+UPLOAD_HASHER_CACHE_SIZE = int(os.getenv('UPLOAD_HASHER_CACHE_SIZE', '256'))
+
+TARGETS = ('audio', 'temp_audio', 'demo', 'video')
+OPEN = 'open'
+FINALIZING = 'finalizing'
+COMPLETE = 'complete'
+
+_hashers: "OrderedDict[str, tuple]" = OrderedDict()
+
+
+class UploadError(Exception):
+    status_code = 400
+
+    def __init__(self, message: str, offset: Optional[int] = None):
+        super().__init__(message)
+        self.offset = offset
+
+
+class UploadNotFound(UploadError):
+    status_code = 404
+
+
+class UploadConflict(UploadError):
+    """The client's offset is not the server's, or the upload is busy or finished."""
+    status_code = 409
+
+
+class UploadTooLarge(UploadError):
+    status_code = 413
+
+
+class ChecksumMismatch(UploadError):
+    status_code = 422
+
+
+def _utcnow() -> datetime:
+    return datetime.now(timezone.utc).replace(tzinfo=None)
+
+
+def staging_path(upload_id: str) -> str:
+    return os.path.join(UPLOAD_DIR, f"{upload_id}.part")
+
+
+def upload_to_dict(upload: ResumableUpload) -> dict:
+    return {
+        "id": upload.id,
+        "target": upload.target,
+        "filename": upload.filename,
+        "length": upload.length,
+        "offset": upload.offset,
+        "status": upload.status,
+        "sha256": upload.sha256,
+        "result": json.loads(upload.result) if upload.result else None,
+        "expires_at": upload.expires_at
+    }
+
+
+def create_upload(
+    db: Session,
+    target: str,
+    filename: str,
+    content_type: str,
+    length: int,
+    fields: dict
+) -> ResumableUpload:
+    """
+    Starts an upload of ``length`` bytes with an empty staging file.
+    ``fields`` are the form fields of the matching one-shot endpoint, e.g.
+    ``category`` and ``description`` for recordings.
+    """
+    if target not in TARGETS:
+        raise UploadError(f"Unknown upload target: {target}")
+    if length > UPLOAD_MAX_BYTES:
+        raise UploadTooLarge(f"Uploads are limited to {UPLOAD_MAX_BYTES} bytes")
+    if target == 'demo' and not (fields.get("title") and fields.get("category")):
+        raise UploadError("Demo uploads need a title and a category")
+
+    upload = ResumableUpload(
+        id=uuid.uuid4().hex,
+        target=target,
+        filename=os.path.basename(filename) or 'upload',
+        content_type=content_type,
+        length=length,
+        offset=0,
+        fields=json.dumps(fields),
+        status=OPEN,
+        expires_at=_utcnow() + timedelta(hours=UPLOAD_EXPIRY_HOURS)
+    )
+    os.makedirs(UPLOAD_DIR, exist_ok=True)
+    open(staging_path(upload.id), 'wb').close()
+    db.add(upload)
+    db.commit()
+    return upload
+
+
+def get_upload(db: Session, upload_id: str) -> ResumableUpload:
+    upload = db.query(ResumableUpload).filter(ResumableUpload.id == upload_id).first()
+    if upload is None or upload.expires_at < _utcnow():
+        raise UploadNotFound("Upload not found")
+    return upload
+
+
+def _hasher_at(upload_id: str, offset: int):
+    """
+    The SHA-256 state after the first ``offset`` bytes. It is cached after
+    every append; after a restart, or if another process took the previous
+    append, it is rebuilt by reading the staging file once.
+    """
+    cached = _hashers.get(upload_id)
+    if cached is not None and cached[0] == offset:
+        return cached[1].copy()
+    hasher = hashlib.sha256()
+    remaining = offset
+    with open(staging_path(upload_id), 'rb') as f:
+        while remaining:
+            chunk = f.read(min(UPLOAD_WRITE_SIZE, remaining))
+            if not chunk:
+                raise UploadConflict(f"Staging file of upload {upload_id} is shorter than {offset} bytes", offset=0)
+            hasher.update(chunk)
+            remaining -= len(chunk)
+    return hasher
+
+
+def _remember_hasher(upload_id: str, offset: int, hasher):
+    _hashers[upload_id] = (offset, hasher.copy())
+    _hashers.move_to_end(upload_id)
+    while len(_hashers) > UPLOAD_HASHER_CACHE_SIZE:
+        _hashers.popitem(last=False)
+
+
+def _lock_staging(upload_id: str, offset: int):
+    """
+    Opens the staging file with an exclusive ``flock``, which every API
+    process sharing ``UPLOAD_DIR`` respects. The lock is released when the
+    file is closed.
+    """
+    try:
+        f = open(staging_path(upload_id), 'r+b')
+    except FileNotFoundError:
+        raise UploadNotFound("Upload not found")
+    try:
+        fcntl.flock(f.fileno(), fcntl.LOCK_EX | fcntl.LOCK_NB)
+    except BlockingIOError:
+        f.close()
+        raise UploadConflict("Another request is writing to this upload", offset=offset)
+    return f
+
+
+def _seek_to(f, offset: int):
+    # Bytes after the acknowledged offset are from an append that died
+    # before it was recorded, so they are dropped
+    f.truncate(offset)
+    f.seek(offset)
+
+
+def _sync(f):
+    f.flush()
+    os.fsync(f.fileno())
+
+
+def _load(upload_id: str) -> ResumableUpload:
+    db = SessionLocal()
+    try:
+        upload = get_upload(db, upload_id)
+        db.expunge(upload)
+        return upload
+    finally:
+        db.close()
+
+
+def _check_appendable(upload: ResumableUpload, offset: int):
+    if upload.status != OPEN:
+        raise UploadConflict("Upload is already finalized", offset=upload.offset)
+    if offset != upload.offset:
+        raise UploadConflict(f"Upload is at offset {upload.offset}, not {offset}", offset=upload.offset)
+
+
+def _save_offset(upload_id: str, old_offset: int, new_offset: int) -> bool:
+    db = SessionLocal()
+    try:
+        updated = db.query(ResumableUpload).filter(
+            ResumableUpload.id == upload_id,
+            ResumableUpload.status == OPEN,
+            ResumableUpload.offset == old_offset
+        ).update({
+            ResumableUpload.offset: new_offset,
+            ResumableUpload.expires_at: _utcnow() + timedelta(hours=UPLOAD_EXPIRY_HOURS)
+        }, synchronize_session=False)
+        db.commit()
+        return bool(updated)
+    finally:
+        db.close()
+
+
+async def append(upload_id: str, offset: int, chunks: AsyncIterator[bytes]) -> int:
+    """
+    Appends a request body at ``offset``, which must be the upload's
+    current offset, and returns the new offset.
+
+    Everything received is written to the staging file and acknowledged
+    even if the client disconnects halfway, so a retry resumes from the
+    last byte that arrived. Memory use is bounded by ``UPLOAD_WRITE_SIZE``
+    whatever the size of the body. The staging file stays locked until
+    the new offset is saved, so concurrent appends, in this process or
+    another, get a conflict instead of overwriting each other.
+    """
+    upload = await asyncio.to_thread(_load, upload_id)
+    _check_appendable(upload, offset)
+
+    f = await asyncio.to_thread(_lock_staging, upload_id, upload.offset)
+    try:
+        # Checked again under the lock: another process may have appended
+        # or started finalizing since the upload was loaded
+        upload = await asyncio.to_thread(_load, upload_id)
+        _check_appendable(upload, offset)
+        with tracing.span("upload.append", **{"upload.id": upload_id, "upload.offset": offset}):
+            hasher = await asyncio.to_thread(_hasher_at, upload_id, offset)
+            await asyncio.to_thread(_seek_to, f, offset)
+            written = offset
+            buffer = bytearray()
+
+            async def flush():
+                nonlocal written
+                await asyncio.to_thread(f.write, buffer)
+                hasher.update(buffer)
+                written += len(buffer)
+                buffer.clear()
+
+            try:
+                async for chunk in chunks:
+                    if written + len(buffer) + len(chunk) > upload.length:
+                        buffer += chunk[:upload.length - written - len(buffer)]
+                        raise UploadTooLarge(f"Upload is {upload.length} bytes long")
+                    buffer += chunk
+                    if len(buffer) >= UPLOAD_WRITE_SIZE:
+                        await flush()
+            finally:
+                if buffer:
+                    await flush()
+                await asyncio.to_thread(_sync, f)
+                if not await asyncio.to_thread(_save_offset, upload_id, offset, written):
+                    raise UploadConflict("Upload was changed by another request")
+                _remember_hasher(upload_id, written, hasher)
+                metrics.observe(metrics.UPLOAD_BYTES, written - offset, "resumable")
+                logger.info(f"Upload {upload_id}: {written - offset} bytes appended, {written}/{upload.length}")
+        return written
+    finally:
+        await asyncio.to_thread(f.close)
+
+
+def _store(db: Session, upload: ResumableUpload, sha256: str) -> dict:
+    fields = json.loads(upload.fields)
+    with open(staging_path(upload.id), 'rb') as f:
+        if upload.target == 'demo':
+            demo_audio = store_demo_file(
+                db, f, upload.length, upload.filename, upload.content_type,
+                fields["title"], fields["category"], fields.get("description", ""), fields.get("duration", 0)
+            )
+            return {"id": demo_audio.id}
+        is_temporary = upload.target == 'temp_audio'
+        audio_id, job = store_audio_file(
+            db, f, upload.length, upload.filename, upload.content_type,
+            fields.get("category") or ('temp_recording' if is_temporary else 'spam'),
+            fields.get("description", ""), fields.get("duration", 0), is_temporary,
+            idempotency_key=f"resumable:{upload.id}", sha256=sha256
+        )
+        return {"id": audio_id, "job_id": job.id if job else None}
+
+
+async def _store_video(upload: ResumableUpload, bucket: str) -> dict:
+    # The key is derived from the upload, so a retried finalize overwrites
+    # the object instead of leaving a copy behind
+    key = f"videos/{upload.id}{os.path.splitext(upload.filename)[1]}"
+    uploader = S3MultipartUploader(get_client('s3'), bucket, key, content_type=upload.content_type)
+    try:
+        with open(staging_path(upload.id), 'rb') as f:
+            while chunk := await asyncio.to_thread(f.read, uploader.part_size):
+                await uploader.write(chunk)
+        result = await uploader.complete()
+    except Exception:
+        await uploader.abort()
+        raise
+    return {"bucket": bucket, "key": key, "size": result["size"]}
+
+
+async def finalize(db: Session, upload: ResumableUpload, sha256: Optional[str] = None) -> dict:
+    """
+    Moves a fully received upload to its target and returns what the
+    one-shot endpoint would have: the new row's id for recordings and
+    demos, the S3 key for videos. ``sha256``, if given, must match the
+    received bytes. Finalizing again returns the same result.
+
+    The upload is claimed with a conditional update from ``open`` to
+    ``finalizing`` first, so of concurrent finalizes, in any process, only
+    one stores the upload; the others get a conflict. A failed finalize
+    puts the upload back to ``open``.
+    """
+    if upload.status == COMPLETE:
+        return json.loads(upload.result)
+    if upload.status == FINALIZING:
+        raise UploadConflict("Upload is being finalized", offset=upload.offset)
+    if upload.offset != upload.length:
+        raise UploadConflict(f"Upload has {upload.offset} of {upload.length} bytes", offset=upload.offset)
+
+    claimed = db.query(ResumableUpload).filter(
+        ResumableUpload.id == upload.id,
+        ResumableUpload.status == OPEN,
+        ResumableUpload.offset == upload.length
+    ).update({ResumableUpload.status: FINALIZING}, synchronize_session=False)
+    db.commit()
+    if not claimed:
+        db.refresh(upload)
+        if upload.status == COMPLETE:
+            return json.loads(upload.result)
+        raise UploadConflict("Upload is being finalized", offset=upload.offset)
+
+    try:
+        with tracing.span("upload.finalize", **{"upload.id": upload.id, "upload.target": upload.target}):
+            digest = (await asyncio.to_thread(_hasher_at, upload.id, upload.length)).hexdigest()
+            if sha256 and sha256.lower() != digest:
+                raise ChecksumMismatch(f"Received bytes have SHA-256 {digest}")
+
+            if upload.target == 'video':
+                result = await _store_video(upload, os.getenv('S3_BUCKET'))
+            else:
+                result = await asyncio.to_thread(_store, db, upload, digest)
+            upload.status = COMPLETE
+            upload.sha256 = digest
+            upload.result = json.dumps(result)
+            db.commit()
+    except BaseException:
+        db.rollback()
+        db.query(ResumableUpload).filter(
+            ResumableUpload.id == upload.id,
+            ResumableUpload.status == FINALIZING
+        ).update({ResumableUpload.status: OPEN}, synchronize_session=False)
+        db.commit()
+        raise
+
+    _hashers.pop(upload.id, None)
+    remove_staging_file(upload.id)
+    logger.info(f"Upload {upload.id} finalized to {upload.target}: {result}")
+    return result
+
+
+def remove_staging_file(upload_id: str):
+    try:
+        os.remove(staging_path(upload_id))
+    except FileNotFoundError:
+        pass
+
+
+def _finalized_video(upload: ResumableUpload) -> Optional[tuple]:
+    if upload.target != 'video' or upload.status != COMPLETE or not upload.result:
+        return None
+    result = json.loads(upload.result)
+    return result["bucket"], result["key"]
+
+
+def _delete_videos(videos) -> None:
+    """
+    Deletes finalized videos, given as ``(bucket, key)`` pairs, from S3.
+    Failures are only logged: the objects are under ``videos/``, which the
+    artifact janitor sweeps.
+    """
+    by_bucket = {}
+    for bucket, key in videos:
+        by_bucket.setdefault(bucket, []).append({'Key': key})
+    for bucket, objects in by_bucket.items():
+        for start in range(0, len(objects), S3_DELETE_BATCH_SIZE):
+            batch = objects[start:start + S3_DELETE_BATCH_SIZE]
+            try:
+                get_client('s3').delete_objects(Bucket=bucket, Delete={'Objects': batch, 'Quiet': True})
+            except Exception as e:
+                logger.warning(f"Failed to delete {len(batch)} finalized video(s) from {bucket}: {str(e)}")
+
+
+async def delete_upload(db: Session, upload: ResumableUpload):
+    """Deletes an upload with its staging file and, for a finalized video, the S3 object."""
+    if upload.status == FINALIZING:
+        raise UploadConflict("Upload is being finalized", offset=upload.offset)
+    video = _finalized_video(upload)
+    f = None
+    if upload.status == OPEN:
+        try:
+            f = await asyncio.to_thread(_lock_staging, upload.id, upload.offset)
+        except UploadNotFound:
+            pass
+    try:
+        db.delete(upload)
+        db.commit()
+    finally:
+        if f is not None:
+            f.close()
+    _hashers.pop(upload.id, None)
+    remove_staging_file(upload.id)
+    if video:
+        await asyncio.to_thread(_delete_videos, [video])
+
+
+def delete_expired_uploads(batch_size: int) -> int:
+    """
+    Deletes uploads, finished or not, that expired, with their staging
+    files and the S3 objects of finalized videos.
+    """
+    deleted = 0
+    db = SessionLocal()
+    try:
+        while True:
+            uploads = db.query(ResumableUpload).filter(
+                ResumableUpload.expires_at < _utcnow()
+            ).limit(batch_size).all()
+            if not uploads:
+                return deleted
+            ids = [upload.id for upload in uploads]
+            _delete_videos([video for video in map(_finalized_video, uploads) if video])
+            deleted += db.query(ResumableUpload).filter(
+                ResumableUpload.id.in_(ids)
+            ).delete(synchronize_session=False)
+            db.commit()
+            for upload_id in ids:
+                _hashers.pop(upload_id, None)
+                remove_staging_file(upload_id)
+    except Exception:
+        db.rollback()
+        raise
+    finally:
+        db.close()
+
+
+def finalized_video_key(db: Session, upload_id: str) -> str:
+    """S3 key of a finalized video upload, for endpoints that analyse it."""
+    upload = get_upload(db, upload_id)
+    if upload.target != 'video':
+        raise UploadError("Upload is not a video")
+    if upload.status != COMPLETE:
+        raise UploadConflict("Upload is not finalized", offset=upload.offset)
+    return json.loads(upload.result)["key"]
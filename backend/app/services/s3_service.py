@@ -0,0 +1,443 @@
+import asyncio
+import contextvars
+import logging
+import math
+import os
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta, timezone
+from typing import Any, Dict, Optional
+
+from fastapi import Request
+
+try:
+    from python_multipart.multipart import MultipartParser, parse_options_header
+except ImportError:  # python-multipart < 0.0.13
+    from multipart.multipart import MultipartParser, parse_options_header
+
+logger = logging.getLogger(__name__)
+
+MIN_PART_SIZE = 5 * 1024 * 1024  # S3 rejects non-final parts smaller than 5 MiB
+
+# Tunables, overridable from the environment
+S3_UPLOAD_PART_SIZE = max(
+    MIN_PART_SIZE,
+    int(float(os.getenv('S3_UPLOAD_PART_SIZE_MB', '8')) * 1024 * 1024)
+)
+S3_UPLOAD_CONCURRENCY = int(os.getenv('S3_UPLOAD_CONCURRENCY', '8'))
+
+# Dedicated pool so blocking boto3 calls never run on the event loop
+_executor = ThreadPoolExecutor(
+    max_workers=max(S3_UPLOAD_CONCURRENCY * 2, 4),
+    thread_name_prefix="s3-upload"
+)
+
+
+async def _run(func, *args, **kwargs):
+    loop = asyncio.get_running_loop()
+    # Carry the caller's context so trace spans and deadlines follow the call
+    context = contextvars.copy_context()
+    return await loop.run_in_executor(_executor, lambda: context.run(func, *args, **kwargs))
+
+
+class S3MultipartUploader:
+    """
+    Streams bytes into an S3 object using a multipart upload.
+
+    Data passed to ``write`` is buffered until a full part is available, then
+    the part is uploaded on a worker thread. At most ``max_concurrency`` parts
+    are in flight; ``write`` waits when that limit is reached so a fast client
+    cannot buffer more than ``part_size * max_concurrency`` bytes in memory.
+    Objects smaller than one part are sent with a single ``put_object``.
+    """
+
+    def __init__(
+        self,
+        client,
+        bucket: str,
+        key: str,
+        content_type: Optional[str] = None,
+        part_size: int = S3_UPLOAD_PART_SIZE,
+        max_concurrency: int = S3_UPLOAD_CONCURRENCY
+    ):
+        self.client = client
+        self.bucket = bucket
+        self.key = key
+        self.content_type = content_type or 'application/octet-stream'
+        self.part_size = max(part_size, MIN_PART_SIZE)
+        self.max_concurrency = max(max_concurrency, 1)
+
+        self.upload_id: Optional[str] = None
+        self.bytes_written = 0
+        self._buffer = bytearray()
+        self._parts: Dict[int, str] = {}
+        self._next_part_number = 1
+        self._tasks = set()
+        self._slots = asyncio.Semaphore(self.max_concurrency)
+        self._error: Optional[BaseException] = None
+
+    async def write(self, data: bytes):
+        if self._error:
+            raise self._error
+        self._buffer.extend(data)
+        self.bytes_written += len(data)
+        while len(self._buffer) >= self.part_size:
+            part = bytes(self._buffer[:self.part_size])
+            del self._buffer[:self.part_size]
+            await self._submit_part(part)
+
+    async def _submit_part(self, body: bytes):
+        if self.upload_id is None:
+            response = await _run(
+                self.client.create_multipart_upload,
+                Bucket=self.bucket,
+                Key=self.key,
+                ContentType=self.content_type
+            )
+            self.upload_id = response['UploadId']
+            logger.debug(f"Started multipart upload {self.upload_id} for {self.key}")
+
+        await self._slots.acquire()
+        part_number = self._next_part_number
+        self._next_part_number += 1
+        task = asyncio.create_task(self._upload_part(part_number, body))
+        self._tasks.add(task)
+        task.add_done_callback(self._tasks.discard)
+
+    async def _upload_part(self, part_number: int, body: bytes):
+        try:
+            response = await _run(
+                self.client.upload_part,
+                Bucket=self.bucket,
+                Key=self.key,
+                UploadId=self.upload_id,
+                PartNumber=part_number,
+                Body=body
+            )
+            self._parts[part_number] = response['ETag']
+        except Exception as e:
+            self._error = self._error or e
+        finally:
+            self._slots.release()
+
+    async def complete(self) -> Dict[str, Any]:
+        if self.upload_id is None:
+            # Everything fit in one part, skip the multipart round trips
+            await _run(
+                self.client.put_object,
+                Bucket=self.bucket,
+                Key=self.key,
+                Body=bytes(self._buffer),
+                ContentType=self.content_type
+            )
+            self._buffer.clear()
+            return {"key": self.key, "size": self.bytes_written, "parts": 1}
+
+        if self._buffer:
+            final_part = bytes(self._buffer)
+            self._buffer.clear()
+            await self._submit_part(final_part)
+
+        if self._tasks:
+            await asyncio.gather(*self._tasks)
+        if self._error:
+            raise self._error
+
+        await _run(
+            self.client.complete_multipart_upload,
+            Bucket=self.bucket,
+            Key=self.key,
+            UploadId=self.upload_id,
+            MultipartUpload={
+                'Parts': [
+                    {'PartNumber': number, 'ETag': etag}
+                    for number, etag in sorted(self._parts.items())
+                ]
+            }
+        )
+        logger.debug(f"Completed multipart upload {self.upload_id} ({len(self._parts)} parts)")
+        return {"key": self.key, "size": self.bytes_written, "parts": len(self._parts)}
+
+    async def abort(self):
+        for task in list(self._tasks):
+            task.cancel()
+        if self._tasks:
+            await asyncio.gather(*self._tasks, return_exceptions=True)
+        if self.upload_id is not None:
+            try:
+                await _run(
+                    self.client.abort_multipart_upload,
+                    Bucket=self.bucket,
+                    Key=self.key,
+                    UploadId=self.upload_id
+                )
+            except Exception as e:
+                logger.error(f"Failed to abort multipart upload {self.upload_id}: {str(e)}")
+
+
+class UploadFieldMissing(Exception):
+    pass
+
+
+def _parse_part_headers(raw_headers: Dict[bytes, bytes]):
+    disposition, params = parse_options_header(raw_headers.get(b'content-disposition', b''))
+    name = params.get(b'name', b'').decode('utf-8', 'replace')
+    filename = params.get(b'filename')
+    filename = filename.decode('utf-8', 'replace') if filename is not None else None
+    content_type = raw_headers.get(b'content-type', b'').decode('latin-1') or None
+    return name, filename, content_type
+
+
+async def stream_upload_to_s3(
+    request: Request,
+    client,
+    bucket: str,
+    key_factory,
+    field_name: str = "file",
+    part_size: int = S3_UPLOAD_PART_SIZE,
+    max_concurrency: int = S3_UPLOAD_CONCURRENCY
+) -> Dict[str, Any]:
+    """
+    Streams the ``field_name`` file of a multipart/form-data request body
+    directly into S3 without spooling it to disk first.
+
+    ``key_factory`` is called with the part's filename and must return the S3
+    key to write to. Returns the key, filename, content type, size and number
+    of parts uploaded. Raises ``UploadFieldMissing`` if the field is absent.
+    """
+    content_type_header = request.headers.get('content-type', '')
+    content_type, params = parse_options_header(content_type_header)
+    boundary = params.get(b'boundary')
+    if content_type != b'multipart/form-data' or not boundary:
+        raise UploadFieldMissing("Expected a multipart/form-data body")
+
+    state = {
+        "headers": {},
+        "header_field": b"",
+        "header_value": b"",
+        "in_target": False,
+        "done": False,
+    }
+    pending = []
+    result: Dict[str, Any] = {}
+    uploader: Optional[S3MultipartUploader] = None
+
+    def on_part_begin():
+        state["headers"] = {}
+
+    def on_header_field(data, start, end):
+        state["header_field"] += data[start:end]
+
+    def on_header_value(data, start, end):
+        state["header_value"] += data[start:end]
+
+    def on_header_end():
+        state["headers"][state["header_field"].lower()] = state["header_value"]
+        state["header_field"] = b""
+        state["header_value"] = b""
+
+    def on_headers_finished():
+        name, filename, part_type = _parse_part_headers(state["headers"])
+        state["in_target"] = name == field_name and filename is not None and not state["done"]
+        if state["in_target"]:
+            pending.append(("begin", filename, part_type))
+
+    def on_part_data(data, start, end):
+        if state["in_target"]:
+            pending.append(("data", bytes(data[start:end])))
+
+    def on_part_end():
+        if state["in_target"]:
+            state["in_target"] = False
+            state["done"] = True
+            pending.append(("end",))
+
+    parser = MultipartParser(boundary, {
+        'on_part_begin': on_part_begin,
+        'on_header_field': on_header_field,
+        'on_header_value': on_header_value,
+        'on_header_end': on_header_end,
+        'on_headers_finished': on_headers_finished,
+        'on_part_data': on_part_data,
+        'on_part_end': on_part_end,
+    })
+
+    try:
+        async for chunk in request.stream():
+            parser.write(chunk)
+            for event in pending:
+                if event[0] == "begin":
+                    _, filename, part_type = event
+                    uploader = S3MultipartUploader(
+                        client,
+                        bucket,
+                        key_factory(filename),
+                        content_type=part_type,
+                        part_size=part_size,
+                        max_concurrency=max_concurrency
+                    )
+                    result.update(filename=filename, content_type=part_type)
+                elif event[0] == "data":
+                    await uploader.write(event[1])
+                else:
+                    result.update(await uploader.complete())
+            pending.clear()
+        parser.finalize()
+    except BaseException:
+        if uploader is not None and "key" not in result:
+            await uploader.abort()
+        raise
+
+    if "key" not in result:
+        if uploader is not None:
+            await uploader.abort()
+        raise UploadFieldMissing(f"Missing file field '{field_name}'")
+    return result
+
+
+async def delete_object(client, bucket: str, key: str):
+    await _run(client.delete_object, Bucket=bucket, Key=key)
+
+
+S3_DELETE_BATCH_SIZE = 1000  # delete_objects hard limit
+S3_DELETE_CONCURRENCY = int(os.getenv('S3_DELETE_CONCURRENCY', '8'))
+
+
+async def _delete_batch(client, bucket: str, keys, slots: asyncio.Semaphore) -> int:
+    async with slots:
+        response = await _run(
+            client.delete_objects,
+            Bucket=bucket,
+            Delete={'Objects': [{'Key': key} for key in keys], 'Quiet': True}
+        )
+    errors = response.get('Errors', [])
+    for error in errors:
+        logger.error(f"Failed to delete s3://{bucket}/{error.get('Key')}: {error.get('Message')}")
+    return len(keys) - len(errors)
+
+
+async def delete_prefix(
+    client,
+    bucket: str,
+    prefix: str,
+    older_than: Optional[datetime] = None,
+    max_concurrency: int = S3_DELETE_CONCURRENCY
+) -> int:
+    """
+    Deletes every object under ``prefix``, optionally only those last
+    modified before ``older_than``.
+
+    Listing is paginated so prefixes with more than 1000 objects are fully
+    covered, and each page is removed with a single ``delete_objects`` call.
+    Batches are deleted concurrently while the next page is being listed.
+    Returns the number of objects deleted.
+    """
+    slots = asyncio.Semaphore(max(max_concurrency, 1))
+    pages = iter(client.get_paginator('list_objects_v2').paginate(
+        Bucket=bucket,
+        Prefix=prefix,
+        PaginationConfig={'PageSize': S3_DELETE_BATCH_SIZE}
+    ))
+    tasks = []
+    while True:
+        page = await _run(next, pages, None)
+        if page is None:
+            break
+        keys = [
+            obj['Key'] for obj in page.get('Contents', [])
+            if older_than is None or obj['LastModified'] < older_than
+        ]
+        for start in range(0, len(keys), S3_DELETE_BATCH_SIZE):
+            batch = keys[start:start + S3_DELETE_BATCH_SIZE]
+            tasks.append(asyncio.create_task(_delete_batch(client, bucket, batch, slots)))
+
+    deleted = sum(await asyncio.gather(*tasks)) if tasks else 0
+    logger.debug(f"Deleted {deleted} object(s) under s3://{bucket}/{prefix}")
+    return deleted
+
+
+# Prefixes written by the video router and by resumable video uploads
+# that only hold short-lived artifacts
+ARTIFACT_PREFIXES = ("liveness-videos/", "liveness-output/", "output/", "liveness-sessions/", "videos/")
+S3_ARTIFACT_TTL_HOURS = float(os.getenv('S3_ARTIFACT_TTL_HOURS', '24'))
+S3_JANITOR_INTERVAL_SECONDS = float(os.getenv('S3_JANITOR_INTERVAL_SECONDS', '3600'))
+
+
+async def sweep_expired_artifacts(
+    client,
+    bucket: str,
+    prefixes=ARTIFACT_PREFIXES,
+    ttl_hours: float = S3_ARTIFACT_TTL_HOURS
+) -> Dict[str, int]:
+    cutoff = datetime.now(timezone.utc) - timedelta(hours=ttl_hours)
+    counts = await asyncio.gather(*[
+        delete_prefix(client, bucket, prefix, older_than=cutoff)
+        for prefix in prefixes
+    ])
+    return dict(zip(prefixes, counts))
+
+
+def apply_lifecycle_rules(
+    client,
+    bucket: str,
+    prefixes=ARTIFACT_PREFIXES,
+    ttl_hours: float = S3_ARTIFACT_TTL_HOURS
+):
+    """
+    Installs S3 lifecycle expiration rules for the artifact prefixes so the
+    bucket cleans itself up even when no API process is running. Existing
+    rules for other prefixes are preserved.
+    """
+    days = max(1, math.ceil(ttl_hours / 24))
+    try:
+        existing = client.get_bucket_lifecycle_configuration(Bucket=bucket).get('Rules', [])
+    except client.exceptions.ClientError as e:
+        if e.response.get('Error', {}).get('Code') != 'NoSuchLifecycleConfiguration':
+            raise
+        existing = []
+
+    rule_ids = {f"expire-{prefix.rstrip('/')}" for prefix in prefixes}
+    rules = [rule for rule in existing if rule.get('ID') not in rule_ids]
+    rules.extend({
+        'ID': f"expire-{prefix.rstrip('/')}",
+        'Filter': {'Prefix': prefix},
+        'Status': 'Enabled',
+        'Expiration': {'Days': days},
+        'AbortIncompleteMultipartUpload': {'DaysAfterInitiation': 1}
+    } for prefix in prefixes)
+
+    client.put_bucket_lifecycle_configuration(
+        Bucket=bucket,
+        LifecycleConfiguration={'Rules': rules}
+    )
+    logger.info(f"Applied {days}-day lifecycle expiration to {', '.join(prefixes)} in {bucket}")
+
+
+class ArtifactJanitor:
+    """
+    Background task that periodically deletes expired video artifacts.
+    """
+
+    def __init__(self, client, bucket: str, interval_seconds: float = S3_JANITOR_INTERVAL_SECONDS):
+        self.client = client
+        self.bucket = bucket
+        self.interval_seconds = interval_seconds
+        self._task: Optional[asyncio.Task] = None
+
+    def start(self):
+        if self._task is None:
+            self._task = asyncio.create_task(self._run_forever())
+
+    async def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            await asyncio.gather(self._task, return_exceptions=True)
+            self._task = None
+
+    async def _run_forever(self):
+        while True:
+            try:
+                counts = await sweep_expired_artifacts(self.client, self.bucket)
+                logger.info(f"S3 janitor removed expired artifacts: {counts}")
+            except Exception as e:
+                logger.error(f"S3 janitor sweep failed: {str(e)}")
+            await asyncio.sleep(self.interval_seconds)
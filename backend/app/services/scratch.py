@@ -0,0 +1,72 @@
+import logging
+import os
+import re
+import time
+import uuid
+from typing import Optional
+
+logger = logging.getLogger(__name__)
+
+# Temp files written while audio is converted or transcribed. Anything
+# older than SCRATCH_MAX_AGE_SECONDS is assumed abandoned, so it must be
+# longer than the longest transcription.
+SCRATCH_DIR = os.getenv('SCRATCH_DIR', 'scratch')
+SCRATCH_MAX_AGE_SECONDS = float(os.getenv('SCRATCH_MAX_AGE_SECONDS', '3600'))
+
+# Files left in the working directory by releases that wrote them there
+_LEGACY_TEMP_FILE = re.compile(r'^temp_[0-9a-f]{8}-[0-9a-f]{4}-[0-9a-f]{4}-[0-9a-f]{4}-[0-9a-f]{12}')
+
+
+def scratch_path(filename: Optional[str] = None, suffix: str = '') -> str:
+    """Returns a unique path in ``SCRATCH_DIR``, keeping ``filename``'s name for ffmpeg's format probing."""
+    os.makedirs(SCRATCH_DIR, exist_ok=True)
+    name = f"temp_{uuid.uuid4()}"
+    if filename:
+        name += f"_{os.path.basename(filename)}"
+    return os.path.join(SCRATCH_DIR, name + suffix)
+
+
+def remove_scratch_file(path: Optional[str]):
+    """
+    Removes a temp file if it exists. Failures are only logged: the file is
+    swept up later by ``sweep_scratch``.
+    """
+    if not path:
+        return
+    try:
+        os.remove(path)
+        logger.info(f"Cleaned up temp file: {path}")
+    except FileNotFoundError:
+        pass
+    except OSError as e:
+        logger.warning(f"Failed to cleanup temp file {path}: {str(e)}")
+
+
+def _remove_older_than(directory: str, cutoff: float, legacy_only: bool = False) -> int:
+    removed = 0
+    try:
+        entries = list(os.scandir(directory))
+    except FileNotFoundError:
+        return 0
+    for entry in entries:
+        if legacy_only and not _LEGACY_TEMP_FILE.match(entry.name):
+            continue
+        try:
+            if entry.is_file(follow_symlinks=False) and entry.stat(follow_symlinks=False).st_mtime < cutoff:
+                os.remove(entry.path)
+                removed += 1
+        except FileNotFoundError:
+            pass
+        except OSError as e:
+            logger.warning(f"Failed to sweep temp file {entry.path}: {str(e)}")
+    return removed
+
+
+def sweep_scratch(max_age_seconds: float = SCRATCH_MAX_AGE_SECONDS) -> int:
+    """
+    Deletes files in ``SCRATCH_DIR``, and ``temp_<uuid>`` files in the
+    working directory, that were last modified more than
+    ``max_age_seconds`` ago. Returns how many were deleted.
+    """
+    cutoff = time.time() - max_age_seconds
+    return _remove_older_than(SCRATCH_DIR, cutoff) + _remove_older_than('.', cutoff, legacy_only=True)
@@ -0,0 +1,176 @@
+import asyncio
+import logging
+import os
+from datetime import datetime, timedelta, timezone
+from typing import Dict, Optional
+
+from . import tracing
+from .audio_pipeline import delete_transcriptions
+from .job_queue import FAILED, SUCCEEDED
+from .resumable_uploads import delete_expired_uploads
+from .scratch import SCRATCH_MAX_AGE_SECONDS, sweep_scratch
+from ..database import SessionLocal, engine
+from ..models import AudioFile, Job
+
+logger = logging.getLogger(__name__)
+
+# Temporary recordings the client never deleted are removed after this long
+TEMP_RECORDING_TTL_HOURS = float(os.getenv('TEMP_RECORDING_TTL_HOURS', '24'))
+# Finished background jobs are kept this long for GET /jobs/{id}
+JOB_RETENTION_HOURS = float(os.getenv('JOB_RETENTION_HOURS', '168'))
+TEMP_REAPER_ENABLED = os.getenv('TEMP_REAPER_ENABLED', 'true').lower() == 'true'
+TEMP_REAPER_INTERVAL_SECONDS = float(os.getenv('TEMP_REAPER_INTERVAL_SECONDS', '600'))
+# Rows deleted per transaction, so the write lock is only held briefly
+TEMP_REAPER_BATCH_SIZE = int(os.getenv('TEMP_REAPER_BATCH_SIZE', '500'))
+# Free pages returned to the file system per sweep by incremental vacuum
+SQLITE_VACUUM_PAGES = int(os.getenv('SQLITE_VACUUM_PAGES', '2000'))
+
+SQLITE_AUTO_VACUUM_INCREMENTAL = 2
+
+_conversion_warned = False
+
+
+def _utcnow() -> datetime:
+    return datetime.now(timezone.utc).replace(tzinfo=None)
+
+
+def delete_expired_recordings(ttl_hours: float = TEMP_RECORDING_TTL_HOURS, batch_size: int = TEMP_REAPER_BATCH_SIZE) -> int:
+    """Deletes temporary ``AudioFile`` rows older than ``ttl_hours``, with their transcriptions and timelines."""
+    cutoff = _utcnow() - timedelta(hours=ttl_hours)
+    deleted = 0
+    db = SessionLocal()
+    try:
+        while True:
+            ids = [audio_id for audio_id, in db.query(AudioFile.id).filter(
+                AudioFile.is_temporary == True,
+                AudioFile.created_at < cutoff
+            ).limit(batch_size).all()]
+            if not ids:
+                return deleted
+            delete_transcriptions(db, ids)
+            deleted += db.query(AudioFile).filter(AudioFile.id.in_(ids)).delete(synchronize_session=False)
+            db.commit()
+    except Exception:
+        db.rollback()
+        raise
+    finally:
+        db.close()
+
+
+def delete_finished_jobs(retention_hours: float = JOB_RETENTION_HOURS, batch_size: int = TEMP_REAPER_BATCH_SIZE) -> int:
+    cutoff = _utcnow() - timedelta(hours=retention_hours)
+    deleted = 0
+    db = SessionLocal()
+    try:
+        while True:
+            ids = [job_id for job_id, in db.query(Job.id).filter(
+                Job.status.in_([SUCCEEDED, FAILED]),
+                Job.finished_at < cutoff
+            ).limit(batch_size).all()]
+            if not ids:
+                return deleted
+            deleted += db.query(Job).filter(Job.id.in_(ids)).delete(synchronize_session=False)
+            db.commit()
+    except Exception:
+        db.rollback()
+        raise
+    finally:
+        db.close()
+
+
+def convert_to_incremental_vacuum() -> bool:
+    """
+    Switches a database created before auto_vacuum was enabled to
+    incremental auto_vacuum. This takes a full ``VACUUM``, which rewrites
+    the file and locks it for the duration, so it is only run on request
+    with ``python -m app.worker --convert-auto-vacuum``. Returns whether a
+    conversion was needed.
+    """
+    with engine.connect().execution_options(isolation_level="AUTOCOMMIT") as conn:
+        if conn.exec_driver_sql("PRAGMA auto_vacuum").scalar() == SQLITE_AUTO_VACUUM_INCREMENTAL:
+            return False
+        logger.info("Switching the database to incremental auto_vacuum with a full VACUUM")
+        conn.exec_driver_sql("PRAGMA auto_vacuum=INCREMENTAL")
+        conn.exec_driver_sql("VACUUM")
+        conn.exec_driver_sql("PRAGMA wal_checkpoint(TRUNCATE)")
+        return True
+
+
+def reclaim_free_pages(max_pages: int = SQLITE_VACUUM_PAGES) -> int:
+    """
+    Returns up to ``max_pages`` free pages to the file system with
+    ``PRAGMA incremental_vacuum``, then checkpoints and truncates the
+    write-ahead log so the database file actually shrinks. Databases not
+    yet converted with ``convert_to_incremental_vacuum`` are left alone.
+    Returns the number of pages reclaimed.
+    """
+    global _conversion_warned
+    with engine.connect().execution_options(isolation_level="AUTOCOMMIT") as conn:
+        if conn.exec_driver_sql("PRAGMA auto_vacuum").scalar() != SQLITE_AUTO_VACUUM_INCREMENTAL:
+            if not _conversion_warned:
+                logger.warning(
+                    "The database does not use incremental auto_vacuum, so deleted rows do not "
+                    "shrink it; run python -m app.worker --convert-auto-vacuum once to convert it"
+                )
+                _conversion_warned = True
+            return 0
+        free_pages = conn.exec_driver_sql("PRAGMA freelist_count").scalar()
+        if not free_pages:
+            return 0
+        # Each step of the pragma frees one page and the driver's execute()
+        # only takes one, so it is run as a script, which steps to the end
+        conn.connection.driver_connection.executescript(f"PRAGMA incremental_vacuum({int(max_pages)});")
+        reclaimed = free_pages - conn.exec_driver_sql("PRAGMA freelist_count").scalar()
+        # In WAL mode the file is only truncated once the pages are checkpointed
+        conn.exec_driver_sql("PRAGMA wal_checkpoint(TRUNCATE)")
+        return reclaimed
+
+
+def reap() -> Dict[str, int]:
+    with tracing.span("temp_reaper.sweep"):
+        counts = {
+            "recordings": delete_expired_recordings(),
+            "jobs": delete_finished_jobs(),
+            "uploads": delete_expired_uploads(TEMP_REAPER_BATCH_SIZE),
+            "scratch_files": sweep_scratch(SCRATCH_MAX_AGE_SECONDS)
+        }
+        counts["pages_reclaimed"] = reclaim_free_pages()
+    return counts
+
+
+class TempReaper:
+    """
+    Background task that periodically deletes expired temporary
+    recordings, old finished jobs, expired resumable uploads and abandoned
+    scratch files, and shrinks the SQLite file afterwards.
+    """
+
+    def __init__(self, interval_seconds: float = TEMP_REAPER_INTERVAL_SECONDS):
+        self.interval_seconds = interval_seconds
+        self.last_sweep: Optional[Dict[str, int]] = None
+        self._task: Optional[asyncio.Task] = None
+
+    def start(self):
+        if self._task is None:
+            self._task = asyncio.create_task(self._run_forever())
+
+    async def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            await asyncio.gather(self._task, return_exceptions=True)
+            self._task = None
+
+    def stats(self) -> Dict:
+        return {"running": self._task is not None, "last_sweep": self.last_sweep}
+
+    async def _run_forever(self):
+        while True:
+            try:
+                self.last_sweep = await asyncio.to_thread(reap)
+                logger.info(f"Temp reaper sweep: {self.last_sweep}")
+            except Exception as e:
+                logger.error(f"Temp reaper sweep failed: {str(e)}")
+            await asyncio.sleep(self.interval_seconds)
+
+
+temp_reaper = TempReaper()
@@ -0,0 +1,248 @@
+import functools
+import logging
+import os
+from contextlib import contextmanager
+from typing import Optional
+
+from sqlalchemy import event
+from sqlalchemy.orm import Session
+
+try:
+    from opentelemetry import propagate, trace
+    from opentelemetry.trace import Link, SpanKind, Status, StatusCode
+except ImportError:  # optional dependency
+    trace = None
+
+try:
+    from opentelemetry.sdk.resources import Resource
+    from opentelemetry.sdk.trace import TracerProvider
+    from opentelemetry.sdk.trace.export import BatchSpanProcessor, ConsoleSpanExporter
+except ImportError:  # optional dependency
+    TracerProvider = None
+
+logger = logging.getLogger(__name__)
+
+# "otlp" sends to OTEL_EXPORTER_OTLP_ENDPOINT (a local collector by
+# default), "file" appends JSON lines to OTEL_TRACES_FILE, "console" prints
+# spans and "none" only propagates context
+OTEL_TRACES_EXPORTER = os.getenv('OTEL_TRACES_EXPORTER', 'none')
+OTEL_TRACES_FILE = os.getenv('OTEL_TRACES_FILE', 'traces.jsonl')
+OTEL_SERVICE_NAME = os.getenv('OTEL_SERVICE_NAME', 'spam-call-api')
+
+TRACE_ID_HEADER = b'x-trace-id'
+
+_provider = None
+
+
+def _create_exporter(name: str):
+    if name == 'otlp':
+        try:
+            from opentelemetry.exporter.otlp.proto.http.trace_exporter import OTLPSpanExporter
+        except ImportError:
+            logger.warning("opentelemetry-exporter-otlp-proto-http is not installed, traces are not exported")
+            return None
+        return OTLPSpanExporter()
+    if name == 'file':
+        out = open(OTEL_TRACES_FILE, 'a', buffering=1)
+        return ConsoleSpanExporter(out=out, formatter=lambda span: span.to_json(indent=None) + "\n")
+    if name == 'console':
+        return ConsoleSpanExporter()
+    return None
+
+
+def _instrument_clients():
+    """Traces botocore and httpx requests too, when their instrumentations are installed."""
+    try:
+        from opentelemetry.instrumentation.botocore import BotocoreInstrumentor
+        BotocoreInstrumentor().instrument()
+    except ImportError:
+        pass
+    try:
+        from opentelemetry.instrumentation.httpx import HTTPXClientInstrumentor
+        HTTPXClientInstrumentor().instrument()
+    except ImportError:
+        pass
+
+
+def setup_tracing(exporter: str = OTEL_TRACES_EXPORTER):
+    """
+    Installs the tracer provider and exporter picked by
+    ``OTEL_TRACES_EXPORTER``. Without the OpenTelemetry SDK, or with the
+    exporter set to ``none``, spans are no-ops but incoming trace context is
+    still passed on.
+    """
+    global _provider
+    if _provider is not None or exporter == 'none':
+        return
+    if trace is None or TracerProvider is None:
+        logger.warning(f"OTEL_TRACES_EXPORTER={exporter} but the OpenTelemetry SDK is not installed")
+        return
+    span_exporter = _create_exporter(exporter)
+    if span_exporter is None:
+        return
+    _provider = TracerProvider(resource=Resource.create({"service.name": OTEL_SERVICE_NAME}))
+    _provider.add_span_processor(BatchSpanProcessor(span_exporter))
+    trace.set_tracer_provider(_provider)
+    _instrument_clients()
+    logger.info(f"Exporting traces with the {exporter} exporter")
+
+
+def shutdown_tracing():
+    if _provider is not None:
+        _provider.shutdown()
+
+
+def _tracer():
+    return trace.get_tracer("app")
+
+
+@contextmanager
+def span(name: str, **attributes):
+    """
+    Runs the block in a child span of the current one. Exceptions are
+    recorded on the span and re-raised. Do not hold it open across
+    ``yield`` in a generator; use ``start_span`` there.
+    """
+    if trace is None:
+        yield None
+        return
+    with _tracer().start_as_current_span(name, attributes=attributes) as current:
+        yield current
+
+
+def traced(name: str):
+    """Decorator that runs a coroutine function in a ``span`` called ``name``."""
+    def decorator(func):
+        @functools.wraps(func)
+        async def wrapper(*args, **kwargs):
+            with span(name):
+                return await func(*args, **kwargs)
+        return wrapper
+    return decorator
+
+
+def set_attributes(**attributes):
+    """Sets attributes on the current span, such as the one opened by ``traced``."""
+    if trace is not None:
+        trace.get_current_span().set_attributes(attributes)
+
+
+def start_span(name: str, links=None, **attributes):
+    """
+    Starts a child span of the current one without making it current, for
+    work that outlives a ``with`` block. End it with ``end_span``.
+    """
+    if trace is None:
+        return None
+    return _tracer().start_span(name, attributes=attributes, links=links)
+
+
+def end_span(current, error: Optional[BaseException] = None):
+    if current is None:
+        return
+    if error is not None:
+        current.record_exception(error)
+        current.set_status(Status(StatusCode.ERROR, str(error)))
+    current.end()
+
+
+@contextmanager
+def use_span(current):
+    """Makes ``current`` the parent of spans and tasks created in the block."""
+    if current is None:
+        yield
+        return
+    with trace.use_span(current, end_on_exit=False):
+        yield
+
+
+def add_event(name: str, **attributes):
+    if trace is not None:
+        trace.get_current_span().add_event(name, attributes)
+
+
+def current_link():
+    """A link to the current span, for work batched with other requests."""
+    if trace is None:
+        return None
+    context = trace.get_current_span().get_span_context()
+    return Link(context) if context.is_valid else None
+
+
+def current_trace_id() -> Optional[str]:
+    if trace is None:
+        return None
+    context = trace.get_current_span().get_span_context()
+    return format(context.trace_id, '032x') if context.is_valid else None
+
+
+class TracingMiddleware:
+    """
+    Opens a server span per HTTP request, continuing the caller's trace
+    when a ``traceparent`` header is sent. If the server or framework has
+    already opened one, that span is used instead of a second. The span
+    stays current for the whole response, so SSE generators, background
+    tasks and asyncio tasks started while handling the request are part of
+    the same trace. The trace id is returned in ``X-Trace-Id``.
+    """
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or trace is None:
+            await self.app(scope, receive, send)
+            return
+
+        request_span = trace.get_current_span()
+        owned = not request_span.is_recording()
+        if owned:
+            carrier = {key.decode('latin-1'): value.decode('latin-1') for key, value in scope.get("headers") or []}
+            request_span = _tracer().start_span(
+                f"{scope['method']} {scope['path']}",
+                context=propagate.extract(carrier),
+                kind=SpanKind.SERVER,
+                attributes={"http.request.method": scope["method"], "url.path": scope["path"]}
+            )
+        span_context = request_span.get_span_context()
+        trace_id = format(span_context.trace_id, '032x') if span_context.is_valid else None
+
+        async def send_with_trace_id(message):
+            if message["type"] == "http.response.start":
+                if owned:
+                    request_span.set_attribute("http.response.status_code", message["status"])
+                    if message["status"] >= 500:
+                        request_span.set_status(Status(StatusCode.ERROR))
+                if trace_id:
+                    message["headers"] = [*message.get("headers", []), (TRACE_ID_HEADER, trace_id.encode())]
+            await send(message)
+
+        if not owned:
+            await self.app(scope, receive, send_with_trace_id)
+            return
+
+        with trace.use_span(request_span, end_on_exit=False, record_exception=True):
+            try:
+                await self.app(scope, receive, send_with_trace_id)
+            finally:
+                route = getattr(scope.get("route"), "path", None)
+                if route:
+                    request_span.set_attribute("http.route", route)
+                    request_span.update_name(f"{scope['method']} {route}")
+                request_span.end()
+
+
+@event.listens_for(Session, "before_commit")
+def _commit_started(session: Session):
+    if trace is not None:
+        session.info["commit_span"] = start_span("db.commit")
+
+
+@event.listens_for(Session, "after_commit")
+def _commit_finished(session: Session):
+    end_span(session.info.pop("commit_span", None))
+
+
+@event.listens_for(Session, "after_rollback")
+def _commit_rolled_back(session: Session):
+    end_span(session.info.pop("commit_span", None), RuntimeError("transaction rolled back"))
@@ -1,27 +1,32 @@
-import boto3
 from botocore.exceptions import ClientError
 import asyncio
-import aiofile
-from amazon_transcribe.client import TranscribeStreamingClient
 from amazon_transcribe.handlers import TranscriptResultStreamHandler
 from amazon_transcribe.model import TranscriptEvent
 from dotenv import load_dotenv
+import logging
 import os
 import time
 import uuid
-import requests
 import json
-import re
+from .aws_clients import get_client, get_transcribe_streaming_client
+from .transcription_jobs import TranscriptionJob, transcription_jobs
+from .asr import AsrProvider
+from .fraud_heuristics import check_for_otp
+from .audio_feeder import PacingMode, PcmFeeder, PcmSource
+from .transcript_stream import TranscribeStreamSession, read_file_chunks
+from .vad import create_vad
+from .logging_config import RateLimitedLogger
+from typing import Dict, Optional
 load_dotenv()
 
+logger = logging.getLogger(__name__)
+partial_logger = RateLimitedLogger(logger, per_second=2)
+
+TRANSCRIBE_BUCKET = os.getenv('TRANSCRIBE_BUCKET', 'spam-detection-audio-files')
+
 class TranscriptionHandler(TranscriptResultStreamHandler):
     def __init__(self):
-        session = boto3.Session(
-            aws_access_key_id=os.getenv('AWS_ACCESS_KEY_ID'),
-            aws_secret_access_key=os.getenv('AWS_SECRET_ACCESS_KEY'),
-            region_name=os.getenv('AWS_REGION')
-        )
-        self.client = TranscribeStreamingClient(region=session.region_name)
+        self.client = get_transcribe_streaming_client()
         super().__init__(self.client)
         self.transcription = ""
         self.partial_results = []
@@ -31,137 +36,83 @@ class TranscriptionHandler(TranscriptResultStreamHandler):
         for result in results:
             for alt in result.alternatives:
                 if result.is_partial:
-                    print(f"\n[LIVE Transcription]: {alt.transcript}")
+                    partial_logger.debug("Partial transcript: %s", alt.transcript)
                     self.partial_results.append(alt.transcript)
                 else:
-                    print(f"\n[FINAL Transcription]: {alt.transcript}")
+                    logger.debug("Final transcript: %s", alt.transcript)
                     self.transcription += alt.transcript + " "
 
     def check_for_otp(self, text):
-        otp_patterns = [
-            r'\b\d{4,6}\b',
-            r'(?i)verification code',
-            r'(?i)security code',
-            r'(?i)one.?time.?password',
-            r'(?i)otp'
-        ]
-        return any(re.search(pattern, text.lower()) for pattern in otp_patterns)
-
-async def process_audio_file(file_path: str):
-    handler = TranscriptionHandler()
-    stream = await handler.client.start_stream_transcription(
-        language_code="en-US",
-        media_sample_rate_hz=16000,
-        media_encoding="pcm",
-        enable_partial_results_stabilization=True,
-        partial_results_stability="high"
-    )
-
+        return check_for_otp(text)
+
+async def transcribe_pcm(
+    pcm_chunks: PcmSource,
+    pace: PacingMode = PacingMode.FAST,
+    provider: Optional[AsrProvider] = None
+) -> Dict:
+    """
+    Streams PCM through Transcribe with a paced feeder and returns the final
+    transcription, the partial results seen along the way and feed stats.
+    """
+    feeder = PcmFeeder(pace=pace, vad=create_vad())
+    transcription = []
+    partial_results = []
+    async with TranscribeStreamSession(
+        pcm_chunks,
+        feeder=feeder,
+        partial_results_stability="high",
+        provider=provider
+    ) as session:
+        async for update in session.updates(coalesce_ms=0):
+            if update.is_partial:
+                partial_results.append(update.text)
+            else:
+                transcription.append(update.text)
+        stats = session.stats()
+
+    return {
+        "transcription": " ".join(transcription).strip(),
+        "partial_results": partial_results,
+        **stats
+    }
+
+async def process_audio_file(
+    file_path: str,
+    pace: PacingMode = PacingMode.FAST,
+    provider: Optional[AsrProvider] = None
+):
     try:
-        async def write_chunks():
-            async with aiofile.AIOFile(file_path, 'rb') as afp:
-                reader = aiofile.Reader(afp, chunk_size=1024 * 16)
-                async for chunk in reader:
-                    await stream.input_stream.send_audio_event(audio_chunk=chunk)
-                    print(f"[Streaming] Sent chunk of size: {len(chunk)} bytes")
-                await stream.input_stream.end_stream()
-
-        print("\n[Started] Beginning transcription...")
-        await asyncio.gather(write_chunks(), handler.handle_events())
-        
-        print("\n[Completed] Final transcription:", handler.transcription.strip())
-        return {
-            "transcription": handler.transcription.strip(),
-            "partial_results": handler.partial_results
-        }
+        logger.info(f"Transcribing {file_path}")
+        result = await transcribe_pcm(read_file_chunks(file_path), pace, provider)
+        logger.info(f"Transcribed {file_path}: {len(result['transcription'])} characters")
+        return result
     except Exception as e:
-        print(f"Error in process_audio_file: {e}")
+        logger.error(f"Error in process_audio_file: {str(e)}")
         raise
-    finally:
-        # Properly close input and output streams
-        if hasattr(stream, 'input_stream'):
-            await stream.input_stream.end_stream()
-        if hasattr(stream, 'output_stream'):
-            stream.output_stream.close()
-
-async def process_audio_stream(audio_chunk: bytes):
-    handler = TranscriptionHandler()
-    stream = await handler.client.start_stream_transcription(
-        language_code="en-US",
-        media_sample_rate_hz=16000,
-        media_encoding="pcm",
-        enable_partial_results_stabilization=True,
-        partial_results_stability="high"
-    )
-
-    temp_file = None
+
+async def process_audio_stream(
+    audio: PcmSource,
+    pace: PacingMode = PacingMode.FAST,
+    provider: Optional[AsrProvider] = None
+):
+    """
+    Transcribes 16 kHz mono PCM held in memory or produced by an async byte
+    iterator. Buffers are streamed as views over the caller's memory, with
+    no temp file in between.
+    """
     try:
-        # Generate unique temp file name
-        temp_file = f"temp_{uuid.uuid4()}.raw"
-        
-        # Use async file operations for both writing and reading
-        async with aiofile.async_open(temp_file, 'wb') as f:
-            await f.write(audio_chunk)
-
-        async def write_chunks():
-            try:
-                async with aiofile.async_open(temp_file, 'rb') as afp:
-                    reader = aiofile.Reader(afp, chunk_size=1024 * 16)
-                    async for chunk in reader:
-                        await stream.input_stream.send_audio_event(audio_chunk=chunk)
-                        print(f"[Streaming] Sent chunk of size: {len(chunk)} bytes")
-                await stream.input_stream.end_stream()
-            except Exception as e:
-                print(f"Error in write_chunks: {e}")
-                raise
-
-        print("\n[Started] Beginning transcription...")
-        await asyncio.gather(write_chunks(), handler.handle_events())
-        
-        return {
-            "transcription": handler.transcription.strip(),
-            "partial_results": handler.partial_results
-        }
+        return await transcribe_pcm(audio, pace, provider)
     except Exception as e:
-        print(f"Error in process_audio_stream: {e}")
+        logger.error(f"Error in process_audio_stream: {str(e)}")
         raise
-    finally:
-        # Properly close input and output streams
-        if hasattr(stream, 'input_stream'):
-            await stream.input_stream.end_stream()
-        if hasattr(stream, 'output_stream'):
-            stream.output_stream.close()
-            
-        # Clean up temp file
-        if temp_file and os.path.exists(temp_file):
-            try:
-                os.remove(temp_file)
-                print(f"[Cleanup] Removed temporary file: {temp_file}")
-            except Exception as e:
-                print(f"[Warning] Failed to remove temp file: {e}")
 
 class TranscribeService:
     def __init__(self):
-        self.session = boto3.Session(
-            aws_access_key_id=os.getenv('AWS_ACCESS_KEY_ID'),
-            aws_secret_access_key=os.getenv('AWS_SECRET_ACCESS_KEY'),
-            region_name=os.getenv('AWS_REGION')
-        )
-        self.client = self.session.client('transcribe')
+        self.client = get_client('transcribe')
+        self.s3_client = get_client('s3')
 
     def check_for_otp(self, text: str) -> bool:
-        otp_patterns = [
-            r'\b\d{4,6}\b',  # 4-6 digit numbers
-            r'(?i)verification code',
-            r'(?i)security code',
-            r'(?i)one.?time.?password',
-            r'(?i)otp'
-        ]
-        
-        for pattern in otp_patterns:
-            if re.search(pattern, text.lower()):
-                return True
-        return False
+        return check_for_otp(text)
 
     async def transcribe_file(self, file_path: str) -> str:
         # Implementation for file transcription
@@ -170,61 +121,35 @@ class TranscribeService:
 
     async def upload_to_s3(self, audio_data: bytes, file_name: str) -> str:
         try:
-            self.session.client('s3').put_object(
-                Bucket='spam-detection-audio-files',
+            await asyncio.to_thread(
+                self.s3_client.put_object,
+                Bucket=TRANSCRIBE_BUCKET,
                 Key=file_name,
                 Body=audio_data
             )
-            s3_uri = f"s3://spam-detection-audio-files/{file_name}"
+            s3_uri = f"s3://{TRANSCRIBE_BUCKET}/{file_name}"
             return s3_uri
         except Exception as e:
-            print(f"S3 upload error: {e}")
+            logger.error(f"S3 upload error: {str(e)}")
             raise Exception(f"Failed to upload to S3: {str(e)}")
 
-    async def get_transcription_text(self, transcript_uri: str) -> str:
-        try:
-            # Get the transcription JSON file
-            response = requests.get(transcript_uri)
-            if response.status_code == 200:
-                # Parse the JSON and extract the transcription
-                transcript_data = response.json()
-                return transcript_data['results']['transcripts'][0]['transcript']
-            else:
-                raise Exception(f"Failed to fetch transcription: HTTP {response.status_code}")
-        except Exception as e:
-            print(f"Error fetching transcription: {e}")
-            raise Exception(f"Failed to get transcription text: {str(e)}")
+    async def submit_transcription(self, audio_data: bytes, media_format: str = 'mp3') -> TranscriptionJob:
+        file_name = f"audio_{str(uuid.uuid4())}.{media_format}"
+        s3_uri = await self.upload_to_s3(audio_data, file_name)
+        return await transcription_jobs.submit(s3_uri, media_format=media_format)
 
     async def transcribe_audio(self, audio_data: bytes) -> str:
         try:
-            file_name = f"audio_{str(uuid.uuid4())}.mp3"
-            s3_uri = await self.upload_to_s3(audio_data, file_name)
-            job_name = f"transcription_{int(time.time())}"
-            
-            response = self.session.client('transcribe').start_transcription_job(
-                TranscriptionJobName=job_name,
-                Media={'MediaFileUri': s3_uri},
-                MediaFormat='mp3',
-                LanguageCode='en-US'
-            )
-            
-            # Wait for completion
-            while True:
-                status = self.session.client('transcribe').get_transcription_job(TranscriptionJobName=job_name)
-                if status['TranscriptionJob']['TranscriptionJobStatus'] in ['COMPLETED', 'FAILED']:
-                    break
-                await asyncio.sleep(1)
+            job = await self.submit_transcription(audio_data, media_format='mp3')
+            job = await transcription_jobs.wait(job.name)
             
-            if status['TranscriptionJob']['TranscriptionJobStatus'] == 'COMPLETED':
-                transcript_uri = status['TranscriptionJob']['Transcript']['TranscriptFileUri']
-                # Get the actual transcription text
-                transcription_text = await self.get_transcription_text(transcript_uri)
-                return transcription_text
+            if job.status == 'COMPLETED':
+                return job.transcript
             else:
-                raise Exception("Transcription failed")
+                raise Exception(job.error or "Transcription failed")
                 
         except Exception as e:
-            print(f"Transcription error: {e}")
+            logger.error(f"Transcription error: {str(e)}")
             raise Exception(f"Failed to transcribe audio: {str(e)}")
 
 transcribe_service = TranscribeService()
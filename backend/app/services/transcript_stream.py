@@ -0,0 +1,268 @@
+import asyncio
+import logging
+import os
+import time
+from typing import AsyncIterator, List, Optional
+
+import aiofile
+
+from .asr import AsrProvider, TranscriptUpdate, fallback_provider, get_provider
+from . import metrics, tracing
+from .audio_feeder import PcmFeeder, PcmSource
+from .resilience import DependencyUnavailable
+from .vad import VoiceActivityDetector, create_vad
+
+logger = logging.getLogger(__name__)
+
+# Bounded buffering between the Transcribe output stream and the SSE client
+TRANSCRIPT_QUEUE_SIZE = int(os.getenv('TRANSCRIPT_QUEUE_SIZE', '64'))
+# Partial results for the same segment arriving within this window are merged
+SSE_COALESCE_MS = int(os.getenv('SSE_COALESCE_MS', '100'))
+SSE_MAX_COALESCE_MS = 2000
+SSE_PING_SECONDS = int(os.getenv('SSE_PING_SECONDS', '15'))
+# Disconnect clients that cannot accept a single event within this time
+SSE_SEND_TIMEOUT_SECONDS = float(os.getenv('SSE_SEND_TIMEOUT_SECONDS', '30'))
+
+_END = object()
+
+
+async def read_file_chunks(file_path: str, chunk_size: int = 1024 * 16) -> AsyncIterator[bytes]:
+    async with aiofile.AIOFile(file_path, 'rb') as afp:
+        reader = aiofile.Reader(afp, chunk_size=chunk_size)
+        async for chunk in reader:
+            yield chunk
+
+
+def coalesce_updates(updates: List[TranscriptUpdate]) -> List[TranscriptUpdate]:
+    """
+    Collapses a burst of updates so each segment appears once, keeping its
+    most recent text. A final result always wins over partials for the same
+    segment. Segments keep the order in which they first appeared.
+    """
+    latest = {}
+    for update in updates:
+        current = latest.get(update.segment_id)
+        if current is not None and not current.is_partial and update.is_partial:
+            continue
+        latest[update.segment_id] = update
+    return list(latest.values())
+
+
+class DeltaEncoder:
+    """
+    Encodes transcript updates for the ``delta`` SSE protocol.
+
+    Each event carries a compact segment number, the length of the prefix
+    the client already has (``off``) and the text that replaces everything
+    after it. Clients rebuild a segment with ``text[:off] + delta``. Once a
+    segment is final its state is dropped, so memory stays proportional to
+    the number of open segments.
+    """
+
+    def __init__(self):
+        self._segment_numbers = {}
+        self._sent_text = {}
+        self._next_number = 0
+
+    def encode(self, update: TranscriptUpdate) -> dict:
+        number = self._segment_numbers.get(update.segment_id)
+        if number is None:
+            number = self._next_number
+            self._next_number += 1
+            self._segment_numbers[update.segment_id] = number
+
+        previous = self._sent_text.get(update.segment_id, "")
+        offset = len(os.path.commonprefix([previous, update.text]))
+
+        if update.is_partial:
+            self._sent_text[update.segment_id] = update.text
+        else:
+            self._sent_text.pop(update.segment_id, None)
+            self._segment_numbers.pop(update.segment_id, None)
+
+        return {
+            "seg": number,
+            "off": offset,
+            "text": update.text[offset:],
+            "live": update.is_partial
+        }
+
+
+class TranscribeStreamSession:
+    """
+    Owns one ASR stream for the lifetime of an SSE response.
+
+    A feeder task sends PCM from ``pcm_chunks`` (an async iterator of chunks
+    or an in-memory buffer) and a reader task moves results into a bounded
+    queue. When the queue is full the reader stops pulling from Transcribe,
+    so a slow client cannot grow server memory.
+    Leaving the ``async with`` block, whether normally, on error or because
+    the client disconnected and the generator was cancelled, cancels both
+    tasks and ends the upstream stream so it stops being billed.
+
+    Recognition is done by ``provider``, Transcribe streaming or a local
+    engine (see ``asr.py``); ``ASR_PROVIDER`` picks the default. If the
+    provider's circuit is open the local fallback provider is used instead,
+    when one is installed.
+
+    Audio is framed, paced and optionally passed through a
+    ``VoiceActivityDetector`` by ``feeder``; by default a ``PcmFeeder`` with
+    the configured pacing and VAD settings is used.
+    """
+
+    def __init__(
+        self,
+        pcm_chunks: PcmSource,
+        sample_rate: int = 16000,
+        language_code: str = "en-US",
+        queue_size: int = TRANSCRIPT_QUEUE_SIZE,
+        feeder: Optional[PcmFeeder] = None,
+        partial_results_stability: Optional[str] = None,
+        provider: Optional[AsrProvider] = None
+    ):
+        self.pcm_chunks = pcm_chunks
+        self.sample_rate = sample_rate
+        self.language_code = language_code
+        self.partial_results_stability = partial_results_stability
+        self.feeder = feeder or PcmFeeder(sample_rate=sample_rate, vad=create_vad(sample_rate))
+        self.provider = provider or get_provider()
+        self._queue: asyncio.Queue = asyncio.Queue(maxsize=queue_size)
+        self._stream = None
+        self._feeder: Optional[asyncio.Task] = None
+        self._reader: Optional[asyncio.Task] = None
+        self._input_ended = False
+        self._started_at: Optional[float] = None
+        self._span = None
+
+    async def __aenter__(self):
+        await self.start()
+        return self
+
+    async def __aexit__(self, exc_type, exc, tb):
+        await self.close()
+
+    @property
+    def vad(self) -> Optional[VoiceActivityDetector]:
+        return self.feeder.vad
+
+    def stats(self) -> dict:
+        return {
+            "vad": self.vad.stats.to_dict() if self.vad else None,
+            "feeder": self.feeder.stats.to_dict()
+        }
+
+    async def start(self):
+        # The span covers the whole stream; the feeder and reader tasks, and
+        # the provider calls they make, are created as its children
+        self._span = tracing.start_span("asr.stream", **{"asr.sample_rate": self.sample_rate})
+        with tracing.use_span(self._span):
+            try:
+                self._stream = await self._start_with_fallback()
+            except BaseException as e:
+                tracing.end_span(self._span, e)
+                self._span = None
+                raise
+            tracing.set_attributes(**{"asr.provider": self.provider.name})
+            self._started_at = time.perf_counter()
+            self._feeder = asyncio.create_task(self._feed())
+            self._reader = asyncio.create_task(self._read())
+
+    async def _start_with_fallback(self):
+        try:
+            return await self._start_stream()
+        except DependencyUnavailable as e:
+            fallback = fallback_provider(self.provider)
+            if fallback is None:
+                raise
+            logger.warning(f"{str(e)}, transcribing with {fallback.name} instead")
+            self.provider = fallback
+            return await self._start_stream()
+
+    async def _start_stream(self):
+        return await self.provider.start_stream(
+            self.sample_rate,
+            self.language_code,
+            partial_results_stability=self.partial_results_stability
+        )
+
+    async def _end_input(self):
+        if self._stream is not None and not self._input_ended:
+            self._input_ended = True
+            await self._stream.end_input()
+
+    async def _feed(self):
+        try:
+            await self.feeder.feed(self.pcm_chunks, self._stream.send_audio)
+            await self._end_input()
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            logger.error(f"Audio feeder failed: {str(e)}")
+            await self._queue.put(e)
+
+    async def _read(self):
+        try:
+            first = True
+            async for update in self._stream.results():
+                if first:
+                    first = False
+                    tracing.add_event("asr.first_result")
+                    metrics.observe(
+                        metrics.ASR_FIRST_PARTIAL_SECONDS,
+                        time.perf_counter() - self._started_at,
+                        self.provider.name
+                    )
+                await self._queue.put(update)
+            await self._queue.put(_END)
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            await self._queue.put(e)
+
+    async def updates(self, coalesce_ms: int = SSE_COALESCE_MS) -> AsyncIterator[TranscriptUpdate]:
+        loop = asyncio.get_running_loop()
+        window = coalesce_ms / 1000
+        while True:
+            batch = [await self._queue.get()]
+            deadline = loop.time() + window
+            while not self._is_terminal(batch[-1]):
+                if self._queue.empty():
+                    timeout = deadline - loop.time()
+                    if timeout <= 0:
+                        break
+                    try:
+                        batch.append(await asyncio.wait_for(self._queue.get(), timeout))
+                    except asyncio.TimeoutError:
+                        break
+                else:
+                    batch.append(self._queue.get_nowait())
+
+            terminal = batch.pop() if self._is_terminal(batch[-1]) else None
+            for update in coalesce_updates(batch):
+                yield update
+            if isinstance(terminal, BaseException):
+                raise terminal
+            if terminal is _END:
+                return
+
+    @staticmethod
+    def _is_terminal(item) -> bool:
+        return item is _END or isinstance(item, BaseException)
+
+    async def close(self):
+        tasks = [task for task in (self._feeder, self._reader) if task is not None]
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+        try:
+            await self._end_input()
+        except Exception as e:
+            logger.warning(f"Failed to end transcription stream: {str(e)}")
+        if self._started_at is not None:
+            metrics.observe(metrics.ASR_STREAM_SECONDS, time.perf_counter() - self._started_at, self.provider.name)
+            self._started_at = None
+        if self._span is not None:
+            if self.feeder.vad:
+                self._span.set_attributes({f"vad.{key}": value for key, value in self.feeder.vad.stats.to_dict().items()})
+            tracing.end_span(self._span)
+            self._span = None
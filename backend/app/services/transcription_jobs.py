@@ -0,0 +1,298 @@
+import asyncio
+import itertools
+import json
+import logging
+import os
+import time
+import uuid
+from dataclasses import dataclass, field
+from datetime import datetime, timezone
+from typing import Dict, List, Optional
+
+import httpx
+from botocore.exceptions import ClientError
+
+from . import resilience
+from .aws_clients import get_client
+
+logger = logging.getLogger(__name__)
+
+TERMINAL_STATUSES = ('COMPLETED', 'FAILED')
+JOB_GROUP_SECONDS = 600
+DIRECT_POLL_THRESHOLD = 5
+
+
+def _is_not_found(exc: BaseException) -> bool:
+    return isinstance(exc, ClientError) and exc.response.get('Error', {}).get('Code') == 'NotFoundException'
+
+
+@dataclass
+class TranscriptionJob:
+    name: str
+    group: str
+    media_uri: str
+    status: str = 'QUEUED'
+    submitted_at: datetime = field(default_factory=lambda: datetime.now(timezone.utc))
+    completed_at: Optional[datetime] = None
+    transcript_uri: Optional[str] = None
+    transcript: Optional[str] = None
+    error: Optional[str] = None
+    done: asyncio.Event = field(default_factory=asyncio.Event, repr=False)
+
+    def to_dict(self) -> Dict:
+        return {
+            "job_name": self.name,
+            "status": self.status,
+            "media_uri": self.media_uri,
+            "submitted_at": self.submitted_at.isoformat(),
+            "completed_at": self.completed_at.isoformat() if self.completed_at else None,
+            "transcript": self.transcript,
+            "error": self.error,
+        }
+
+
+class TranscriptionJobManager:
+    """
+    Submits batch Transcribe jobs and tracks all of them from one background
+    task.
+
+    Job names embed a ten-minute submission window. When more than a few
+    jobs are pending, each tick lists the finished jobs of each open window
+    instead of calling ``get_transcription_job`` per job, so the number of
+    API calls stays flat no matter how many jobs are in flight. The tick interval starts at ``min_interval`` and backs off
+    towards ``max_interval`` while nothing changes. When
+    ``TRANSCRIBE_EVENTS_QUEUE_URL`` points at an SQS queue receiving
+    EventBridge "Transcribe Job State Change" events, completions are picked
+    up from the queue and polling only runs as a slow safety net. Any
+    SQS-compatible stand-in works through ``AWS_ENDPOINT_URL_SQS``.
+    """
+
+    def __init__(
+        self,
+        min_interval: float = float(os.getenv('TRANSCRIBE_POLL_MIN_SECONDS', '1')),
+        max_interval: float = float(os.getenv('TRANSCRIBE_POLL_MAX_SECONDS', '30')),
+        queue_url: Optional[str] = os.getenv('TRANSCRIBE_EVENTS_QUEUE_URL'),
+        max_finished: int = 1000
+    ):
+        self.min_interval = min_interval
+        self.max_interval = max_interval
+        self.queue_url = queue_url
+        self.max_finished = max_finished
+        self.job_prefix = f"spamcall-{uuid.uuid4().hex[:8]}"
+
+        self._jobs: Dict[str, TranscriptionJob] = {}
+        self._interval = min_interval
+        self._wakeup: Optional[asyncio.Event] = None
+        self._tasks: List[asyncio.Task] = []
+        self._http: Optional[httpx.AsyncClient] = None
+
+    @property
+    def client(self):
+        return get_client('transcribe')
+
+    def _ensure_started(self):
+        if self._tasks:
+            return
+        self._wakeup = asyncio.Event()
+        self._http = httpx.AsyncClient(timeout=30)
+        self._tasks.append(asyncio.create_task(self._poll_loop()))
+        if self.queue_url:
+            self._tasks.append(asyncio.create_task(self._queue_loop()))
+
+    async def stop(self):
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._tasks = []
+        if self._http:
+            await self._http.aclose()
+            self._http = None
+
+    async def submit(
+        self,
+        media_uri: str,
+        media_format: str = 'mp3',
+        language_code: str = 'en-US'
+    ) -> TranscriptionJob:
+        self._ensure_started()
+        # Names are grouped by submission window so polling can list one
+        # window at a time; the uuid suffix keeps jobs started in the same
+        # second apart.
+        group = f"{self.job_prefix}-{int(time.time() // JOB_GROUP_SECONDS)}"
+        job_name = f"{group}-{uuid.uuid4().hex[:12]}"
+        await resilience.transcribe.call_blocking(
+            self.client.start_transcription_job,
+            TranscriptionJobName=job_name,
+            Media={'MediaFileUri': media_uri},
+            MediaFormat=media_format,
+            LanguageCode=language_code
+        )
+        job = TranscriptionJob(name=job_name, group=group, media_uri=media_uri, status='IN_PROGRESS')
+        self._jobs[job_name] = job
+        self._evict_finished()
+        self._interval = self.min_interval
+        self._wakeup.set()
+        logger.info(f"Submitted transcription job {job_name}")
+        return job
+
+    def get(self, job_name: str) -> Optional[TranscriptionJob]:
+        return self._jobs.get(job_name)
+
+    def list(self) -> List[TranscriptionJob]:
+        return sorted(self._jobs.values(), key=lambda job: job.submitted_at, reverse=True)
+
+    async def wait(self, job_name: str, timeout: Optional[float] = None) -> TranscriptionJob:
+        job = self._jobs[job_name]
+        await asyncio.wait_for(job.done.wait(), timeout)
+        return job
+
+    def _pending(self) -> List[TranscriptionJob]:
+        return [job for job in self._jobs.values() if job.status not in TERMINAL_STATUSES]
+
+    def _evict_finished(self):
+        finished = [job for job in self._jobs.values() if job.status in TERMINAL_STATUSES]
+        if len(finished) <= self.max_finished:
+            return
+        finished.sort(key=lambda job: job.completed_at)
+        for job in finished[:len(finished) - self.max_finished]:
+            del self._jobs[job.name]
+
+    async def _poll_loop(self):
+        while True:
+            if not self._pending():
+                # Nothing to track, sleep until the next submit
+                self._wakeup.clear()
+                await self._wakeup.wait()
+
+            await asyncio.sleep(self._interval)
+            try:
+                changed = await self._poll_once()
+            except Exception as e:
+                logger.error(f"Transcription job polling failed: {str(e)}")
+                changed = 0
+
+            # With a notification queue, polling is only a safety net
+            ceiling = self.max_interval * 4 if self.queue_url else self.max_interval
+            self._interval = self.min_interval if changed else min(self._interval * 1.5, ceiling)
+
+    async def _poll_once(self) -> int:
+        pending = {job.name: job for job in self._pending()}
+        if not pending:
+            return 0
+
+        if len(pending) <= DIRECT_POLL_THRESHOLD:
+            # A few direct lookups are cheaper than listing
+            responses = await asyncio.gather(*[
+                asyncio.to_thread(self.client.get_transcription_job, TranscriptionJobName=name)
+                for name in pending
+            ], return_exceptions=True)
+            finished = []
+            for name, response in zip(pending, responses):
+                if isinstance(response, Exception):
+                    # A job deleted or expired on the AWS side can never
+                    # finish; other errors are retried on the next tick
+                    if _is_not_found(response):
+                        finished.append((name, 'FAILED', "Transcription job no longer exists"))
+                    else:
+                        logger.error(f"Failed to poll transcription job {name}: {str(response)}")
+                    continue
+                finished.append((
+                    response['TranscriptionJob']['TranscriptionJobName'],
+                    response['TranscriptionJob']['TranscriptionJobStatus'],
+                    response['TranscriptionJob'].get('FailureReason')
+                ))
+        else:
+            finished = []
+            groups = {job.group for job in pending.values()}
+            for group, status in itertools.product(groups, TERMINAL_STATUSES):
+                next_token = None
+                while True:
+                    kwargs = {
+                        'Status': status,
+                        'JobNameContains': group,
+                        'MaxResults': 100,
+                    }
+                    if next_token:
+                        kwargs['NextToken'] = next_token
+                    response = await asyncio.to_thread(self.client.list_transcription_jobs, **kwargs)
+                    finished.extend(
+                        (summary['TranscriptionJobName'], status, summary.get('FailureReason'))
+                        for summary in response.get('TranscriptionJobSummaries', [])
+                    )
+                    next_token = response.get('NextToken')
+                    if not next_token:
+                        break
+
+        resolutions = [
+            self._resolve(name, status, failure_reason)
+            for name, status, failure_reason in finished
+            if name in pending and status in TERMINAL_STATUSES
+        ]
+        await asyncio.gather(*resolutions)
+        return len(resolutions)
+
+    async def _resolve(self, job_name: str, status: str, failure_reason: Optional[str] = None):
+        job = self._jobs.get(job_name)
+        if job is None or job.status in TERMINAL_STATUSES:
+            return
+        try:
+            if status == 'COMPLETED':
+                details = await asyncio.to_thread(
+                    self.client.get_transcription_job,
+                    TranscriptionJobName=job_name
+                )
+                job.transcript_uri = details['TranscriptionJob']['Transcript']['TranscriptFileUri']
+                job.transcript = await self._fetch_transcript(job.transcript_uri)
+            else:
+                job.error = failure_reason or "Transcription failed"
+            job.status = status
+        except Exception as e:
+            logger.error(f"Failed to resolve transcription job {job_name}: {str(e)}")
+            job.status = 'FAILED'
+            job.error = str(e)
+        job.completed_at = datetime.now(timezone.utc)
+        job.done.set()
+        logger.info(f"Transcription job {job_name} finished with status {job.status}")
+
+    async def _fetch_transcript(self, transcript_uri: str) -> str:
+        response = await self._http.get(transcript_uri)
+        if response.status_code != 200:
+            raise Exception(f"Failed to fetch transcription: HTTP {response.status_code}")
+        return response.json()['results']['transcripts'][0]['transcript']
+
+    async def _queue_loop(self):
+        sqs = get_client('sqs')
+        while True:
+            try:
+                response = await asyncio.to_thread(
+                    sqs.receive_message,
+                    QueueUrl=self.queue_url,
+                    MaxNumberOfMessages=10,
+                    WaitTimeSeconds=20
+                )
+                for message in response.get('Messages', []):
+                    await self._handle_queue_message(message)
+                    await asyncio.to_thread(
+                        sqs.delete_message,
+                        QueueUrl=self.queue_url,
+                        ReceiptHandle=message['ReceiptHandle']
+                    )
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logger.error(f"Transcription event queue receive failed: {str(e)}")
+                await asyncio.sleep(self.min_interval)
+
+    async def _handle_queue_message(self, message: Dict):
+        try:
+            detail = json.loads(message['Body']).get('detail', {})
+        except (ValueError, AttributeError):
+            logger.warning("Ignoring malformed transcription event")
+            return
+        job_name = detail.get('TranscriptionJobName')
+        status = detail.get('TranscriptionJobStatus')
+        if job_name in self._jobs and status in TERMINAL_STATUSES:
+            await self._resolve(job_name, status, detail.get('FailureReason'))
+
+
+transcription_jobs = TranscriptionJobManager()
@@ -0,0 +1,93 @@
+import json
+import logging
+from typing import BinaryIO, Optional, Tuple
+
+from sqlalchemy import func
+from sqlalchemy.orm import Session
+
+from .audio_jobs import enqueue_audio_pipeline
+from .blob_store import import_blob_from_file
+from .job_queue import find_job
+from ..models import AudioFile, DemoAudio, Job
+
+logger = logging.getLogger(__name__)
+
+
+def file_size(fileobj: BinaryIO) -> int:
+    """Size of a seekable file, leaving it positioned at the start."""
+    fileobj.seek(0, 2)
+    size = fileobj.tell()
+    fileobj.seek(0)
+    return size
+
+
+def store_audio_file(
+    db: Session,
+    fileobj: BinaryIO,
+    size: int,
+    filename: str,
+    content_type: str,
+    category: str,
+    description: str,
+    duration: int,
+    is_temporary: bool,
+    idempotency_key: Optional[str] = None,
+    sha256: Optional[str] = None
+) -> Tuple[int, Optional[Job]]:
+    """
+    Adds a recording read from ``fileobj`` and queues its post-processing,
+    without committing. The bytes are copied into the row chunk by chunk,
+    so large files are never held in memory. A request retried with the
+    same ``idempotency_key`` gets the first upload back instead.
+
+    Temporary recordings are transcribed and then deleted by
+    /audio/realtimetranscribe-recording, so they get no job, and no
+    ``idempotency_key`` either since it is kept on the job.
+    """
+    if idempotency_key and not is_temporary:
+        job = find_job(db, idempotency_key)
+        if job is not None:
+            return json.loads(job.payload)["audio_id"], job
+    audio_file = AudioFile(
+        filename=filename,
+        content_type=content_type,
+        category=category,
+        description=description,
+        duration=duration,
+        audio_data=func.zeroblob(size),
+        is_temporary=is_temporary
+    )
+    db.add(audio_file)
+    db.flush()
+    import_blob_from_file(db, AudioFile, audio_file.id, fileobj, size)
+    if is_temporary:
+        return audio_file.id, None
+    job = enqueue_audio_pipeline(db, audio_file.id, idempotency_key=idempotency_key, sha256=sha256)
+    return audio_file.id, job
+
+
+def store_demo_file(
+    db: Session,
+    fileobj: BinaryIO,
+    size: int,
+    filename: str,
+    content_type: str,
+    title: str,
+    category: str,
+    description: str,
+    duration: int
+) -> DemoAudio:
+    """Adds a demo recording read from ``fileobj`` chunk by chunk, without committing."""
+    demo_audio = DemoAudio(
+        title=title,
+        filename=filename,
+        content_type=content_type,
+        category=category,
+        description=description,
+        duration=duration,
+        audio_data=func.zeroblob(size)
+    )
+    db.add(demo_audio)
+    db.flush()
+    import_blob_from_file(db, DemoAudio, demo_audio.id, fileobj, size)
+    return demo_audio
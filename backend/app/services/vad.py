@@ -0,0 +1,200 @@
+import logging
+import os
+from collections import deque
+from dataclasses import dataclass
+from typing import AsyncIterator, List, Optional
+
+import numpy as np
+
+try:
+    import webrtcvad
+except ImportError:  # optional dependency
+    webrtcvad = None
+
+logger = logging.getLogger(__name__)
+
+VAD_ENABLED = os.getenv('VAD_ENABLED', 'true').lower() == 'true'
+VAD_BACKEND = os.getenv('VAD_BACKEND', 'energy')  # "energy" or "webrtc"
+VAD_FRAME_MS = int(os.getenv('VAD_FRAME_MS', '30'))
+VAD_PADDING_MS = int(os.getenv('VAD_PADDING_MS', '300'))
+VAD_ENERGY_THRESHOLD_DB = float(os.getenv('VAD_ENERGY_THRESHOLD_DB', '-45'))
+VAD_WEBRTC_MODE = int(os.getenv('VAD_WEBRTC_MODE', '2'))
+
+# Frames whose zero-crossing rate is above this are treated as noise
+# unless they are also clearly louder than the energy threshold
+MAX_SPEECH_ZCR = 0.35
+LOUD_MARGIN_DB = 10.0
+
+
+@dataclass
+class VadStats:
+    total_frames: int = 0
+    speech_frames: int = 0
+    sent_frames: int = 0
+    frame_ms: int = VAD_FRAME_MS
+
+    @property
+    def skipped_frames(self) -> int:
+        return self.total_frames - self.sent_frames
+
+    @property
+    def percent_skipped(self) -> float:
+        if not self.total_frames:
+            return 0.0
+        return round(100.0 * self.skipped_frames / self.total_frames, 2)
+
+    def to_dict(self) -> dict:
+        return {
+            "total_seconds": round(self.total_frames * self.frame_ms / 1000, 2),
+            "sent_seconds": round(self.sent_frames * self.frame_ms / 1000, 2),
+            "skipped_seconds": round(self.skipped_frames * self.frame_ms / 1000, 2),
+            "percent_skipped": self.percent_skipped
+        }
+
+
+class VoiceActivityDetector:
+    """
+    Drops non-speech audio from a 16-bit mono PCM stream.
+
+    Audio is cut into ``frame_ms`` frames. The default backend classifies all
+    frames of a chunk at once from their RMS energy and zero-crossing rate
+    with NumPy; ``backend="webrtc"`` uses WebRTC VAD when it is installed.
+    ``padding_ms`` of audio is kept on both sides of every speech run so the
+    start and end of words are not clipped. Frames are only ever dropped, so
+    timestamps returned by Transcribe are relative to the audio actually sent.
+    """
+
+    def __init__(
+        self,
+        sample_rate: int = 16000,
+        frame_ms: int = VAD_FRAME_MS,
+        padding_ms: int = VAD_PADDING_MS,
+        threshold_db: float = VAD_ENERGY_THRESHOLD_DB,
+        backend: str = VAD_BACKEND
+    ):
+        self.sample_rate = sample_rate
+        self.frame_ms = frame_ms
+        self.frame_bytes = sample_rate * frame_ms // 1000 * 2
+        self.padding_frames = max(padding_ms // frame_ms, 0)
+        self.threshold_db = threshold_db
+        self.stats = VadStats(frame_ms=frame_ms)
+
+        self._webrtc = None
+        if backend == "webrtc":
+            if webrtcvad is None:
+                logger.warning("webrtcvad is not installed, falling back to energy VAD")
+            else:
+                self._webrtc = webrtcvad.Vad(VAD_WEBRTC_MODE)
+
+        self._remainder = b""
+        self._pre_roll = deque(maxlen=self.padding_frames)
+        self._hangover = 0
+
+    def _classify(self, frames: np.ndarray, raw: memoryview) -> np.ndarray:
+        if self._webrtc is not None:
+            return np.array([
+                self._webrtc.is_speech(bytes(raw[i * self.frame_bytes:(i + 1) * self.frame_bytes]), self.sample_rate)
+                for i in range(len(frames))
+            ], dtype=bool)
+
+        samples = frames.astype(np.float32)
+        rms = np.sqrt(np.mean(samples * samples, axis=1)) + 1e-9
+        energy_db = 20 * np.log10(rms / 32768.0)
+        zcr = np.mean(np.abs(np.diff(np.signbit(frames), axis=1)), axis=1)
+        loud = energy_db > self.threshold_db
+        return loud & ((zcr < MAX_SPEECH_ZCR) | (energy_db > self.threshold_db + LOUD_MARGIN_DB))
+
+    def segments(self, pcm) -> List[memoryview]:
+        """
+        Feeds the next piece of PCM and returns the audio that should be
+        sent on as a list of contiguous runs. Runs from the current call are
+        views over ``pcm`` itself, so kept speech is not copied. Incomplete
+        trailing frames are held until the next call.
+        """
+        data = self._remainder + pcm if self._remainder else pcm
+        raw = memoryview(data).cast('B')
+        usable = len(raw) - len(raw) % self.frame_bytes
+        self._remainder = bytes(raw[usable:])
+        if not usable:
+            return []
+
+        raw = raw[:usable]
+        frames = np.frombuffer(raw, dtype=np.int16).reshape(-1, self.frame_bytes // 2)
+        decisions = self._classify(frames, raw)
+
+        # The pre-roll holds frame indices from this call and byte copies of
+        # frames held back from earlier calls
+        keep = np.zeros(len(decisions), dtype=bool)
+        held = []
+        for index, is_speech in enumerate(decisions):
+            self.stats.total_frames += 1
+            if is_speech:
+                self.stats.speech_frames += 1
+                # Flush the leading padding collected during silence
+                for padded in self._pre_roll:
+                    if isinstance(padded, bytes):
+                        held.append(padded)
+                    else:
+                        keep[padded] = True
+                    self.stats.sent_frames += 1
+                self._pre_roll.clear()
+                keep[index] = True
+                self.stats.sent_frames += 1
+                self._hangover = self.padding_frames
+            elif self._hangover > 0:
+                keep[index] = True
+                self.stats.sent_frames += 1
+                self._hangover -= 1
+            elif self.padding_frames:
+                self._pre_roll.append(index)
+
+        self._pre_roll = deque(
+            (bytes(self._frame(raw, padded)) if isinstance(padded, int) else padded
+             for padded in self._pre_roll),
+            maxlen=self.padding_frames
+        )
+
+        output = [memoryview(b"".join(held))] if held else []
+        edges = np.flatnonzero(np.diff(np.concatenate(([0], keep.view(np.int8), [0]))))
+        for run_start, run_end in zip(edges[::2], edges[1::2]):
+            output.append(raw[run_start * self.frame_bytes:run_end * self.frame_bytes])
+        return output
+
+    def _frame(self, raw: memoryview, index: int) -> memoryview:
+        return raw[index * self.frame_bytes:(index + 1) * self.frame_bytes]
+
+    def process(self, pcm) -> bytes:
+        """
+        Like ``segments`` but returns the kept audio as one ``bytes`` value.
+        """
+        return b"".join(self.segments(pcm))
+
+    def flush(self) -> bytes:
+        remainder, self._remainder = self._remainder, b""
+        return remainder if self._hangover > 0 else b""
+
+
+async def vad_filter(
+    chunks: AsyncIterator[bytes],
+    vad: Optional[VoiceActivityDetector]
+) -> AsyncIterator[bytes]:
+    """
+    Passes PCM chunks through ``vad`` and yields the kept speech runs.
+    With ``vad=None`` the chunks are passed through unchanged.
+    """
+    if vad is None:
+        async for chunk in chunks:
+            yield chunk
+        return
+
+    async for chunk in chunks:
+        for speech in vad.segments(chunk):
+            yield speech
+    tail = vad.flush()
+    if tail:
+        yield tail
+    logger.info(f"VAD skipped {vad.stats.percent_skipped}% of audio")
+
+
+def create_vad(sample_rate: int = 16000) -> Optional[VoiceActivityDetector]:
+    return VoiceActivityDetector(sample_rate=sample_rate) if VAD_ENABLED else None
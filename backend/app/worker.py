@@ -0,0 +1,70 @@
+"""
+Runs background jobs queued by the API, such as the post-processing of
+uploads. Start as many workers as the load needs, on any host that can
+reach the database:
+
+    cd backend
+    python -m app.worker --concurrency 4
+
+A database created before incremental auto_vacuum was enabled is
+converted once, while nothing else is using it, with:
+
+    python -m app.worker --convert-auto-vacuum
+"""
+import argparse
+import asyncio
+import logging
+import signal
+
+from . import models
+from .database import engine
+from .services import audio_jobs  # noqa: F401  registers the audio pipeline
+from .services.asr import shutdown_providers
+from .services.cpu_pool import cpu_pool
+from .services.job_queue import JOB_POLL_SECONDS, JOB_WORKER_CONCURRENCY, JobWorker
+from .services.logging_config import configure_logging
+from .services.temp_reaper import TEMP_REAPER_ENABLED, convert_to_incremental_vacuum, temp_reaper
+from .services.tracing import setup_tracing, shutdown_tracing
+
+logger = logging.getLogger(__name__)
+
+
+async def run_worker(concurrency: int, poll_seconds: float):
+    worker = JobWorker(concurrency=concurrency, poll_seconds=poll_seconds)
+    loop = asyncio.get_running_loop()
+    for signum in (signal.SIGINT, signal.SIGTERM):
+        loop.add_signal_handler(signum, worker.stop)
+    # Workers on other hosts have their own scratch directory to sweep
+    if TEMP_REAPER_ENABLED:
+        temp_reaper.start()
+    try:
+        await worker.run()
+    finally:
+        await temp_reaper.stop()
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--concurrency', type=int, default=JOB_WORKER_CONCURRENCY, help="jobs run at once")
+    parser.add_argument('--poll-seconds', type=float, default=JOB_POLL_SECONDS, help="idle wait between queue checks")
+    parser.add_argument('--convert-auto-vacuum', action='store_true', help="switch the database to incremental auto_vacuum with a full VACUUM, then exit")
+    args = parser.parse_args(argv)
+
+    configure_logging()
+    models.Base.metadata.create_all(bind=engine)
+    if args.convert_auto_vacuum:
+        converted = convert_to_incremental_vacuum()
+        logger.info("Database converted to incremental auto_vacuum" if converted else "Database already uses incremental auto_vacuum")
+        return
+    setup_tracing()
+    try:
+        asyncio.run(run_worker(args.concurrency, args.poll_seconds))
+    finally:
+        shutdown_providers()
+        cpu_pool.shutdown()
+        shutdown_tracing()
+        logger.info("Job worker stopped")
+
+
+if __name__ == '__main__':
+    main()
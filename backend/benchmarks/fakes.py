@@ -0,0 +1,223 @@
+import asyncio
+import json
+import os
+import re
+import tempfile
+import time
+import uuid
+from types import SimpleNamespace
+from typing import List, Optional
+
+BENCHMARK_BUCKET = 'benchmark-bucket'
+
+# Sentences the fake Transcribe stream replays, one word at a time
+SCRIPT = [
+    "hello this is the fraud department of your bank calling about your account",
+    "we noticed a suspicious transaction and your account will be blocked today",
+    "to stop it please read me the verification code we just sent to your phone",
+    "you can also pay the fee with gift cards if that is easier for you",
+    "thank you for your patience we will call you back if we need anything else"
+]
+
+_SINGLE_TEXT = re.compile(r'Text to analyze: (.*)$', re.M)
+_BATCH_TEXTS = re.compile(r'"text": (\[\{.*\}\])\s*$', re.M)
+
+
+class FakeTranscribeInput:
+    def __init__(self, stream: "FakeTranscribeStream"):
+        self._stream = stream
+
+    async def send_audio_event(self, audio_chunk: bytes):
+        self._stream.received_bytes += len(audio_chunk)
+        self._stream.audio_arrived.set()
+
+    async def end_stream(self):
+        self._stream.ended = True
+        self._stream.audio_arrived.set()
+
+
+class FakeTranscribeStream:
+    """
+    Replays ``SCRIPT`` at ``words_per_second`` of received audio: each new
+    word produces a partial result for the current sentence, and the
+    sentence is finalized once complete or when the input ends. Every
+    result is delayed by ``latency`` to stand in for the service's lag.
+    """
+
+    def __init__(self, sample_rate: int, latency: float, words_per_second: float = 2.5, script: List[str] = SCRIPT):
+        self.sample_rate = sample_rate
+        self.latency = latency
+        self.words_per_second = words_per_second
+        self.sentences = [sentence.split() for sentence in script]
+        self.received_bytes = 0
+        self.ended = False
+        self.audio_arrived = asyncio.Event()
+        self.input_stream = FakeTranscribeInput(self)
+
+    def _words_due(self) -> int:
+        return int(self.received_bytes / (self.sample_rate * 2) * self.words_per_second)
+
+    def _event(self, segment: int, words: List[str], is_partial: bool):
+        seconds_per_word = 1 / self.words_per_second
+        result = SimpleNamespace(
+            result_id=f"segment-{segment}",
+            is_partial=is_partial,
+            start_time=0.0,
+            end_time=len(words) * seconds_per_word,
+            alternatives=[SimpleNamespace(transcript=" ".join(words))]
+        )
+        return SimpleNamespace(transcript=SimpleNamespace(results=[result]))
+
+    async def _results(self):
+        segment = 0
+        sent = 0
+        emitted = 0
+        while True:
+            await self.audio_arrived.wait()
+            self.audio_arrived.clear()
+            due = self._words_due()
+            while emitted < due:
+                sentence = self.sentences[segment % len(self.sentences)]
+                sent += 1
+                emitted += 1
+                await asyncio.sleep(self.latency)
+                if sent == len(sentence):
+                    yield self._event(segment, sentence, is_partial=False)
+                    segment += 1
+                    sent = 0
+                else:
+                    yield self._event(segment, sentence[:sent], is_partial=True)
+            if self.ended:
+                if sent:
+                    await asyncio.sleep(self.latency)
+                    yield self._event(segment, self.sentences[segment % len(self.sentences)][:sent], is_partial=False)
+                return
+
+    @property
+    def output_stream(self):
+        return self._results()
+
+
+class FakeTranscribeStreamingClient:
+    """Stands in for ``TranscribeStreamingClient`` with scripted results."""
+
+    def __init__(self, latency: float = 0.05, connect_latency: float = 0.1):
+        self.latency = latency
+        self.connect_latency = connect_latency
+
+    async def start_stream_transcription(self, *, media_sample_rate_hz: int, **options):
+        await asyncio.sleep(self.connect_latency)
+        return FakeTranscribeStream(media_sample_rate_hz, self.latency)
+
+
+class FakeGeminiModel:
+    """
+    Stands in for ``genai.GenerativeModel``. Replies after ``latency``
+    with JSON matching the requested schema, single or batched, and
+    classifies each text with the keyword heuristic. Streamed replies are
+    split into ``stream_chunks`` pieces spread over the same latency.
+    """
+
+    def __init__(self, latency: float = 0.4, stream_chunks: int = 4):
+        self.latency = latency
+        self.stream_chunks = max(stream_chunks, 1)
+        self.calls = 0
+
+    def _verdict(self, text: str) -> dict:
+        from app.services.fraud_heuristics import heuristic_fraud_analysis
+        return {"classification": heuristic_fraud_analysis(text)["classification"], "confidence": 0.9}
+
+    def _reply(self, prompt: str) -> str:
+        batch = _BATCH_TEXTS.search(prompt)
+        if batch:
+            items = json.loads(batch.group(1))
+            return json.dumps([{"id": item["id"], **self._verdict(item["text"])} for item in items])
+        single = _SINGLE_TEXT.search(prompt)
+        return json.dumps(self._verdict(single.group(1) if single else prompt))
+
+    async def generate_content_async(self, prompt: str, generation_config=None, stream: bool = False):
+        self.calls += 1
+        reply = self._reply(prompt)
+        if not stream:
+            await asyncio.sleep(self.latency)
+            return SimpleNamespace(text=reply)
+        return self._stream(reply)
+
+    async def _stream(self, reply: str):
+        size = -(-len(reply) // self.stream_chunks)
+        for start in range(0, len(reply), size):
+            await asyncio.sleep(self.latency / self.stream_chunks)
+            yield SimpleNamespace(text=reply[start:start + size])
+
+
+def fake_rekognition(client, latency: float = 0.2):
+    """
+    Answers Face Liveness calls on ``client`` locally after ``latency``,
+    which moto does not implement. The calls still go through botocore,
+    so parameter validation and the client's thread usage are real.
+    """
+    def respond(parsed: dict):
+        time.sleep(latency)
+        return SimpleNamespace(status_code=200, headers={}), parsed
+
+    def create_session(**kwargs):
+        return respond({"SessionId": str(uuid.uuid4())})
+
+    def get_results(params, **kwargs):
+        return respond({
+            "SessionId": json.loads(params["body"])["SessionId"],
+            "Status": "SUCCEEDED",
+            "Confidence": 97.5,
+            "AuditImages": []
+        })
+
+    client.meta.events.register('before-call.rekognition.CreateFaceLivenessSession', create_session)
+    client.meta.events.register('before-call.rekognition.GetFaceLivenessSessionResults', get_results)
+
+
+def prepare_environment(workdir: Optional[str] = None) -> str:
+    """
+    Points the app at throwaway state before it is imported: a fresh
+    working directory for the SQLite database, fake AWS credentials and a
+    bucket name moto will serve. Existing variables are left alone, so
+    pacing, batching and pool sizes can still be set from the shell.
+    """
+    workdir = workdir or tempfile.mkdtemp(prefix='benchmark-')
+    os.chdir(workdir)
+    for name, value in {
+        'AWS_REGION': 'us-east-1',
+        'AWS_ACCESS_KEY_ID': 'benchmark',
+        'AWS_SECRET_ACCESS_KEY': 'benchmark',
+        'S3_BUCKET': BENCHMARK_BUCKET,
+        'TRANSCRIBE_BUCKET': BENCHMARK_BUCKET,
+        'GOOGLE_API_KEY': 'benchmark',
+        'S3_JANITOR_ENABLED': 'false',
+        'AUDIO_FEED_PACE': 'unthrottled',
+        'LOG_LEVEL': 'WARNING'
+    }.items():
+        os.environ.setdefault(name, value)
+    return workdir
+
+
+def install_fakes(gemini_latency: float = 0.4, transcribe_latency: float = 0.05, rekognition_latency: float = 0.2):
+    """
+    Starts moto for S3, swaps in the fake Transcribe, Gemini and
+    Rekognition and returns the app. Call ``prepare_environment`` first.
+    """
+    import boto3
+    from moto import mock_aws
+
+    mock = mock_aws()
+    mock.start()
+    boto3.client('s3', region_name=os.environ['AWS_REGION']).create_bucket(Bucket=os.environ['S3_BUCKET'])
+
+    from app.services import aws_clients
+    aws_clients._transcribe_streaming_client = FakeTranscribeStreamingClient(latency=transcribe_latency)
+
+    from app.main import app
+    from app.routers import video
+    from app.services.gemini_service import gemini_service
+
+    fake_rekognition(video.rekognition_client, latency=rekognition_latency)
+    gemini_service.model = FakeGeminiModel(latency=gemini_latency)
+    return app
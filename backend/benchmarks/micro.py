@@ -0,0 +1,224 @@
+"""
+Micro-benchmarks for the CPU-heavy primitives behind the audio routes.
+
+    cd backend
+    python -m benchmarks.micro                       # every benchmark
+    python -m benchmarks.micro -k sha256 -k otp      # names containing either
+    python -m benchmarks.micro --json micro.json
+    python -m benchmarks.micro --baseline micro.json # exit 1 on regression
+    python -m benchmarks.micro -k frames --profile profiles/
+
+Like pytest-benchmark, each benchmark is calibrated so a round lasts at
+least ``--min-round-ms``, then timed for ``--rounds`` rounds, and the
+per-call min, median, mean, stddev and ops/s are reported. ``--profile``
+also writes a cProfile dump per benchmark, for snakeviz or flameprof.
+"""
+import argparse
+import asyncio
+import cProfile
+import json
+import os
+import statistics
+import sys
+import tempfile
+import time
+from dataclasses import dataclass
+from typing import Callable, Dict, List, Optional
+
+import numpy as np
+
+os.environ.setdefault('GOOGLE_API_KEY', 'benchmark')
+os.environ.setdefault('AWS_REGION', 'us-east-1')
+
+from app.services.audio_feeder import PcmFeeder  # noqa: E402
+from app.services.audio_pipeline import decode_pcm_stream  # noqa: E402
+from app.services.audio_tasks import sha256_hex  # noqa: E402
+from app.services.fraud_heuristics import check_for_otp  # noqa: E402
+from app.services.llm_cache import normalize_text  # noqa: E402
+from app.services.transcript_stream import DeltaEncoder  # noqa: E402
+from app.services.vad import VoiceActivityDetector  # noqa: E402
+
+from .fakes import SCRIPT  # noqa: E402
+from .scenarios import SAMPLE_RATE, speech_like_wav  # noqa: E402
+
+
+@dataclass
+class Benchmark:
+    name: str
+    func: Callable[[], object]
+    # Bytes processed per call, for a MB/s column
+    size: Optional[int] = None
+
+
+def _pcm(seconds: float) -> bytes:
+    wav = speech_like_wav(seconds)
+    return wav[44:]
+
+
+def _run_async(loop: asyncio.AbstractEventLoop, make_coroutine):
+    return lambda: loop.run_until_complete(make_coroutine())
+
+
+async def _drain(iterator) -> int:
+    total = 0
+    async for chunk in iterator:
+        total += len(chunk)
+    return total
+
+
+async def _source(data: bytes, chunk_size: int):
+    view = memoryview(data)
+    for start in range(0, len(view), chunk_size):
+        yield view[start:start + chunk_size]
+
+
+def collect(workdir: str) -> List[Benchmark]:
+    from app.routers.audio import format_transcript_event
+    from app.services.asr import TranscriptUpdate
+
+    loop = asyncio.new_event_loop()
+    minute = _pcm(60)
+    feeder = PcmFeeder(sample_rate=SAMPLE_RATE, chunk_ms=100)
+
+    wav_path = os.path.join(workdir, 'ten-seconds.wav')
+    with open(wav_path, 'wb') as out:
+        out.write(speech_like_wav(10))
+
+    blobs = {size: np.random.default_rng(size).bytes(size) for size in (64 * 1024, 1024 * 1024, 16 * 1024 * 1024)}
+
+    lines = [f"{sentence} {suffix}" for sentence in SCRIPT for suffix in ("", "the code is 482913", "thanks")]
+    updates = [
+        TranscriptUpdate(segment_id=f"s{index // 8}", text=" ".join(SCRIPT[0].split()[:index % 8 + 1]),
+                         is_partial=index % 8 != 7, start_time=0.0, end_time=1.0)
+        for index in range(64)
+    ]
+
+    def delta_events():
+        encoder = DeltaEncoder()
+        for update in updates:
+            format_transcript_event(update, encoder)
+
+    def vad_segments():
+        vad = VoiceActivityDetector(sample_rate=SAMPLE_RATE)
+        for start in range(0, len(minute), 64 * 1024):
+            for _ in vad.segments(minute[start:start + 64 * 1024]):
+                pass
+        vad.flush()
+
+    return [
+        Benchmark("pcm_frames_unaligned_60s", _run_async(loop, lambda: _drain(feeder.frames(_source(minute, 16000 - 2)))), len(minute)),
+        Benchmark("pcm_frames_buffer_60s", _run_async(loop, lambda: _drain(feeder.frames(feeder.buffer_chunks(minute)))), len(minute)),
+        Benchmark("vad_energy_60s", vad_segments, len(minute)),
+        Benchmark("ffmpeg_decode_wav_10s", _run_async(loop, lambda: _drain(decode_pcm_stream(wav_path)))),
+        *(Benchmark(f"sha256_{size // 1024}k", lambda blob=blob: sha256_hex(blob), size) for size, blob in blobs.items()),
+        Benchmark("check_for_otp_15_lines", lambda: [check_for_otp(line) for line in lines]),
+        Benchmark("normalize_text_15_lines", lambda: [normalize_text(line) for line in lines]),
+        Benchmark("sse_full_events_64", lambda: [format_transcript_event(update, None) for update in updates]),
+        Benchmark("sse_delta_events_64", delta_events)
+    ]
+
+
+def calibrate(func: Callable, min_round: float) -> int:
+    """Iterations per round so that one round takes at least ``min_round`` seconds."""
+    iterations = 1
+    while True:
+        started = time.perf_counter()
+        for _ in range(iterations):
+            func()
+        elapsed = time.perf_counter() - started
+        if elapsed >= min_round:
+            return iterations
+        iterations = max(iterations * 2, int(iterations * min_round / max(elapsed, 1e-9)))
+
+
+def measure(benchmark: Benchmark, rounds: int, min_round: float) -> Dict:
+    benchmark.func()
+    iterations = calibrate(benchmark.func, min_round)
+    timings = []
+    for _ in range(rounds):
+        started = time.perf_counter()
+        for _ in range(iterations):
+            benchmark.func()
+        timings.append((time.perf_counter() - started) / iterations)
+
+    median = statistics.median(timings)
+    result = {
+        "rounds": rounds,
+        "iterations": iterations,
+        "min_us": round(min(timings) * 1e6, 2),
+        "median_us": round(median * 1e6, 2),
+        "mean_us": round(statistics.fmean(timings) * 1e6, 2),
+        "stddev_us": round(statistics.stdev(timings) * 1e6, 2) if rounds > 1 else 0.0,
+        "ops": round(1 / median, 1)
+    }
+    if benchmark.size:
+        result["mb_per_s"] = round(benchmark.size / median / 2 ** 20, 1)
+    return result
+
+
+def profile(benchmark: Benchmark, directory: str, iterations: int):
+    profiler = cProfile.Profile()
+    profiler.enable()
+    for _ in range(iterations):
+        benchmark.func()
+    profiler.disable()
+    path = os.path.join(directory, f"{benchmark.name}.prof")
+    profiler.dump_stats(path)
+    return path
+
+
+def compare(results: Dict[str, Dict], baseline: Dict[str, Dict], tolerance: float) -> List[str]:
+    return [
+        f"{name}: median_us {baseline[name]['median_us']} -> {result['median_us']}"
+        for name, result in results.items()
+        if name in baseline and result["median_us"] > baseline[name]["median_us"] * (1 + tolerance)
+    ]
+
+
+def print_table(results: Dict[str, Dict]):
+    columns = ("min_us", "median_us", "mean_us", "stddev_us", "ops", "mb_per_s")
+    width = max(len(name) for name in results) + 2
+    print("benchmark".ljust(width) + "".join(column.rjust(13) for column in columns))
+    for name, result in results.items():
+        print(name.ljust(width) + "".join(str(result.get(column, "")).rjust(13) for column in columns))
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('-k', dest='patterns', action='append', help="only run benchmarks whose name contains this")
+    parser.add_argument('--rounds', type=int, default=10)
+    parser.add_argument('--min-round-ms', type=float, default=20)
+    parser.add_argument('--json', help="write the results to this file")
+    parser.add_argument('--baseline', help="compare against results written earlier with --json")
+    parser.add_argument('--tolerance', type=float, default=0.2, help="allowed slowdown against the baseline")
+    parser.add_argument('--profile', metavar='DIR', help="also write a cProfile dump per benchmark to DIR")
+    args = parser.parse_args(argv)
+
+    results = {}
+    with tempfile.TemporaryDirectory(prefix='micro-benchmark-') as workdir:
+        for benchmark in collect(workdir):
+            if args.patterns and not any(pattern in benchmark.name for pattern in args.patterns):
+                continue
+            results[benchmark.name] = measure(benchmark, args.rounds, args.min_round_ms / 1000)
+            if args.profile:
+                os.makedirs(args.profile, exist_ok=True)
+                path = profile(benchmark, args.profile, results[benchmark.name]["iterations"] * args.rounds)
+                print(f"{benchmark.name}: profile written to {path}", file=sys.stderr)
+
+    if not results:
+        parser.error("no benchmark matched")
+    print_table(results)
+    if args.json:
+        with open(args.json, 'w') as out:
+            json.dump(results, out, indent=2)
+    if args.baseline:
+        with open(args.baseline) as baseline:
+            regressions = compare(results, json.load(baseline), args.tolerance)
+        for regression in regressions:
+            print(f"REGRESSION {regression}")
+        if regressions:
+            sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,222 @@
+"""
+Load-tests the API against local stand-ins for AWS and Gemini.
+
+    cd backend
+    python -m benchmarks.run                           # every scenario
+    python -m benchmarks.run -s analyze_fraud -n 500 -c 50
+    python -m benchmarks.run --json results.json
+    python -m benchmarks.run --baseline results.json   # exit 1 on regression
+
+By default the app is served in this process by uvicorn on a free port,
+with moto for S3 and the fakes in ``benchmarks.fakes`` for Transcribe,
+Gemini and Rekognition. ``--url`` targets a server started with
+``python -m benchmarks.server`` instead, for example under a profiler.
+Install moto first with ``pip install -r benchmarks/requirements.txt``.
+"""
+import argparse
+import asyncio
+import json
+import os
+import re
+import sys
+import threading
+import time
+from typing import Dict, List, Optional
+
+import httpx
+import numpy as np
+
+from .scenarios import SCENARIOS, Scenario
+
+_RSS_SAMPLE = re.compile(r'^process_resident_memory_bytes (\S+)$', re.M)
+
+
+class BackgroundServer:
+    """Runs the app under uvicorn in a thread, on a free port."""
+
+    def __init__(self, app):
+        import uvicorn
+        self.server = uvicorn.Server(uvicorn.Config(app, host='127.0.0.1', port=0, log_config=None, lifespan='on'))
+        self._thread = threading.Thread(target=self.server.run, daemon=True)
+
+    def start(self) -> str:
+        self._thread.start()
+        while not self.server.started:
+            if not self._thread.is_alive():
+                raise RuntimeError("Benchmark server failed to start")
+            time.sleep(0.05)
+        port = self.server.servers[0].sockets[0].getsockname()[1]
+        return f"http://127.0.0.1:{port}"
+
+    def stop(self):
+        self.server.should_exit = True
+        self._thread.join(timeout=30)
+
+
+async def resident_memory(client: httpx.AsyncClient) -> Optional[float]:
+    """The server's resident memory in MiB, read from its /metrics."""
+    try:
+        response = await client.get("/metrics")
+    except httpx.HTTPError:
+        return None
+    match = _RSS_SAMPLE.search(response.text)
+    return float(match.group(1)) / 2 ** 20 if match else None
+
+
+async def run_scenario(
+    client: httpx.AsyncClient,
+    scenario: Scenario,
+    requests: int,
+    concurrency: int,
+    warmup: int
+) -> Dict:
+    """
+    Sends ``requests`` requests from ``concurrency`` workers, each sending
+    its next request as soon as the previous one completes, and samples
+    the server's memory while they run.
+    """
+    state = await scenario.setup(client) if scenario.setup else None
+    for index in range(warmup):
+        await scenario.request(client, state, index)
+
+    latencies: List[float] = []
+    errors: Dict[str, int] = {}
+    counter = iter(range(warmup, warmup + requests))
+    memory: List[float] = []
+
+    async def worker():
+        for index in counter:
+            started = time.perf_counter()
+            try:
+                response = await scenario.request(client, state, index)
+                status = str(response.status_code)
+            except httpx.HTTPError as e:
+                status = type(e).__name__
+            latencies.append(time.perf_counter() - started)
+            if not status.startswith('2'):
+                errors[status] = errors.get(status, 0) + 1
+
+    async def sample_memory():
+        while True:
+            rss = await resident_memory(client)
+            if rss is not None:
+                memory.append(rss)
+            await asyncio.sleep(0.25)
+
+    rss_start = await resident_memory(client)
+    sampler = asyncio.create_task(sample_memory())
+    started = time.perf_counter()
+    await asyncio.gather(*(worker() for _ in range(concurrency)))
+    elapsed = time.perf_counter() - started
+    sampler.cancel()
+    rss_end = await resident_memory(client)
+
+    p50, p95, p99 = np.percentile(latencies, [50, 95, 99]) * 1000
+    return {
+        "requests": requests,
+        "concurrency": concurrency,
+        "errors": sum(errors.values()),
+        "error_statuses": errors,
+        "throughput_rps": round(requests / elapsed, 2),
+        "p50_ms": round(p50, 1),
+        "p95_ms": round(p95, 1),
+        "p99_ms": round(p99, 1),
+        "max_ms": round(max(latencies) * 1000, 1),
+        "rss_start_mb": round(rss_start, 1) if rss_start else None,
+        "rss_peak_mb": round(max(memory + [rss_end or 0]), 1) if memory or rss_end else None,
+        "rss_end_mb": round(rss_end, 1) if rss_end else None
+    }
+
+
+def compare(results: Dict[str, Dict], baseline: Dict[str, Dict], tolerance: float) -> List[str]:
+    """Regressions of more than ``tolerance`` in latency, throughput, errors or peak memory."""
+    regressions = []
+    for name, result in results.items():
+        base = baseline.get(name)
+        if not base:
+            continue
+        for key in ("p50_ms", "p95_ms", "p99_ms", "rss_peak_mb"):
+            if base.get(key) and result.get(key) and result[key] > base[key] * (1 + tolerance):
+                regressions.append(f"{name}: {key} {base[key]} -> {result[key]}")
+        if result["throughput_rps"] < base["throughput_rps"] * (1 - tolerance):
+            regressions.append(f"{name}: throughput_rps {base['throughput_rps']} -> {result['throughput_rps']}")
+        if result["errors"] > base["errors"]:
+            regressions.append(f"{name}: errors {base['errors']} -> {result['errors']}")
+    return regressions
+
+
+def print_table(results: Dict[str, Dict]):
+    columns = ("throughput_rps", "p50_ms", "p95_ms", "p99_ms", "max_ms", "errors", "rss_peak_mb")
+    width = max(len(name) for name in results) + 2
+    print("scenario".ljust(width) + "".join(column.rjust(15) for column in columns))
+    for name, result in results.items():
+        print(name.ljust(width) + "".join(str(result[column]).rjust(15) for column in columns))
+
+
+async def run(args, base_url: str) -> Dict[str, Dict]:
+    results = {}
+    timeout = httpx.Timeout(args.timeout)
+    limits = httpx.Limits(max_connections=args.concurrency + 1)
+    async with httpx.AsyncClient(base_url=base_url, timeout=timeout, limits=limits) as client:
+        for name in args.scenarios:
+            results[name] = await run_scenario(client, SCENARIOS[name], args.requests, args.concurrency, args.warmup)
+            print(f"{name}: {json.dumps(results[name])}", file=sys.stderr)
+    return results
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(
+        description=__doc__,
+        epilog="scenarios:\n" + "\n".join(f"  {name:<20}{scenario.description}" for name, scenario in SCENARIOS.items()),
+        formatter_class=argparse.RawDescriptionHelpFormatter
+    )
+    parser.add_argument('-s', '--scenarios', type=lambda value: value.split(','), default=list(SCENARIOS),
+                        help="comma-separated subset of the scenarios below")
+    parser.add_argument('-n', '--requests', type=int, default=100, help="timed requests per scenario")
+    parser.add_argument('-c', '--concurrency', type=int, default=10, help="requests in flight at once")
+    parser.add_argument('--warmup', type=int, default=3, help="untimed requests per scenario")
+    parser.add_argument('--timeout', type=float, default=120, help="per-request timeout in seconds")
+    parser.add_argument('--url', help="benchmark a running server instead of starting one")
+    parser.add_argument('--gemini-latency', type=float, default=0.4, help="seconds per fake Gemini reply")
+    parser.add_argument('--transcribe-latency', type=float, default=0.05, help="seconds per fake Transcribe result")
+    parser.add_argument('--rekognition-latency', type=float, default=0.2, help="seconds per fake Rekognition call")
+    parser.add_argument('--json', help="write the results to this file")
+    parser.add_argument('--baseline', help="compare against results written earlier with --json")
+    parser.add_argument('--tolerance', type=float, default=0.2, help="allowed regression against the baseline")
+    args = parser.parse_args(argv)
+
+    unknown = set(args.scenarios) - set(SCENARIOS)
+    if unknown:
+        parser.error(f"unknown scenarios: {', '.join(sorted(unknown))}")
+    # The in-process server runs in a scratch directory
+    args.json = args.json and os.path.abspath(args.json)
+    args.baseline = args.baseline and os.path.abspath(args.baseline)
+
+    server = None
+    base_url = args.url
+    if base_url is None:
+        from .fakes import install_fakes, prepare_environment
+        prepare_environment()
+        server = BackgroundServer(install_fakes(args.gemini_latency, args.transcribe_latency, args.rekognition_latency))
+        base_url = server.start()
+    try:
+        results = asyncio.run(run(args, base_url))
+    finally:
+        if server:
+            server.stop()
+
+    print_table(results)
+    if args.json:
+        with open(args.json, 'w') as out:
+            json.dump(results, out, indent=2)
+    if args.baseline:
+        with open(args.baseline) as baseline:
+            regressions = compare(results, json.load(baseline), args.tolerance)
+        for regression in regressions:
+            print(f"REGRESSION {regression}")
+        if regressions:
+            sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,114 @@
+import io
+import itertools
+import math
+import uuid
+import wave
+from dataclasses import dataclass
+from typing import Any, Awaitable, Callable, Dict, Optional
+
+import httpx
+import numpy as np
+
+from .fakes import SCRIPT
+
+SAMPLE_RATE = 16000
+
+
+def speech_like_wav(seconds: float, sample_rate: int = SAMPLE_RATE, seed: int = 0) -> bytes:
+    """Amplitude-modulated noise, loud enough that the VAD keeps all of it."""
+    rng = np.random.default_rng(seed)
+    t = np.arange(int(seconds * sample_rate)) / sample_rate
+    envelope = 0.6 + 0.4 * np.sin(2 * math.pi * 3 * t)
+    samples = (rng.standard_normal(t.size) * envelope * 4000).clip(-32768, 32767).astype(np.int16)
+    buffer = io.BytesIO()
+    with wave.open(buffer, 'wb') as out:
+        out.setnchannels(1)
+        out.setsampwidth(2)
+        out.setframerate(sample_rate)
+        out.writeframes(samples.tobytes())
+    return buffer.getvalue()
+
+
+@dataclass
+class Scenario:
+    """
+    One endpoint under load. ``setup`` runs once before the timed requests
+    and returns state passed to every ``request`` call along with the
+    request's index.
+    """
+
+    name: str
+    request: Callable[[httpx.AsyncClient, Any, int], Awaitable[httpx.Response]]
+    setup: Optional[Callable[[httpx.AsyncClient], Awaitable[Any]]] = None
+    description: str = ""
+
+
+async def _upload_setup(client: httpx.AsyncClient):
+    return speech_like_wav(5)
+
+
+async def _upload(client: httpx.AsyncClient, audio: bytes, index: int):
+    return await client.post(
+        "/audio/upload",
+        params={"category": "spam", "description": "benchmark"},
+        files={"file": (f"call-{index}.wav", audio, "audio/wav")}
+    )
+
+
+async def _realtime_setup(client: httpx.AsyncClient):
+    response = await client.post(
+        "/audio/upload-demo",
+        data={"title": "benchmark", "category": "demo", "description": "benchmark", "duration": "10"},
+        files={"file": ("demo.wav", speech_like_wav(10), "audio/wav")}
+    )
+    response.raise_for_status()
+    return response.json()["id"]
+
+
+async def _realtime(client: httpx.AsyncClient, demo_id: int, index: int):
+    # The body is read to the end, so latency covers the whole transcription
+    response = await client.get(f"/audio/realtimetranscribe/{demo_id}")
+    if "event: error" in response.text:
+        response.status_code = 599
+    return response
+
+
+async def _analyze_fraud(client: httpx.AsyncClient, state: Any, index: int):
+    # A unique suffix keeps every request a cache miss; digits would be
+    # normalized away, so it is made of letters
+    suffix = uuid.uuid4().hex.translate(str.maketrans('0123456789', 'ghijklmnop'))
+    return await client.post(
+        "/audio/analyze_fraud",
+        json={"text": f"{SCRIPT[index % len(SCRIPT)]} reference {suffix}"}
+    )
+
+
+async def _spam_report(client: httpx.AsyncClient, state: Any, index: int):
+    # Half the reports repeat a number, so inserts and updates are both hit
+    number = index if index % 2 else index % 50
+    return await client.post(
+        "/spam-reports/report",
+        json={"phone_number": f"+1555{number:07d}", "description": "benchmark report"}
+    )
+
+
+async def _check_hash_setup(client: httpx.AsyncClient):
+    stored = speech_like_wav(5, seed=1)
+    response = await client.post("/audio/store-hash", files={"file": ("stored.wav", stored, "audio/wav")})
+    response.raise_for_status()
+    return itertools.cycle([stored, speech_like_wav(5, seed=2)])
+
+
+async def _check_hash(client: httpx.AsyncClient, files, index: int):
+    return await client.post("/audio/check-hash", files={"file": (f"call-{index}.wav", next(files), "audio/wav")})
+
+
+SCENARIOS: Dict[str, Scenario] = {
+    scenario.name: scenario for scenario in (
+        Scenario("upload", _upload, _upload_setup, "POST /audio/upload, 5 s WAV into SQLite"),
+        Scenario("realtimetranscribe", _realtime, _realtime_setup, "GET /audio/realtimetranscribe, 10 s demo over SSE"),
+        Scenario("analyze_fraud", _analyze_fraud, None, "POST /audio/analyze_fraud, cache misses"),
+        Scenario("spam_report", _spam_report, None, "POST /spam-reports/report"),
+        Scenario("check_hash", _check_hash, _check_hash_setup, "POST /audio/check-hash, half of them matching")
+    )
+}
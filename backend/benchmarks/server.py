@@ -0,0 +1,29 @@
+"""
+Serves the app with the benchmark fakes installed, for ``benchmarks.run --url``:
+
+    cd backend
+    python -m benchmarks.server --port 8001
+"""
+import argparse
+
+import uvicorn
+
+from .fakes import install_fakes, prepare_environment
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=8001)
+    parser.add_argument('--gemini-latency', type=float, default=0.4, help="seconds per fake Gemini reply")
+    parser.add_argument('--transcribe-latency', type=float, default=0.05, help="seconds per fake Transcribe result")
+    parser.add_argument('--rekognition-latency', type=float, default=0.2, help="seconds per fake Rekognition call")
+    args = parser.parse_args(argv)
+
+    prepare_environment()
+    app = install_fakes(args.gemini_latency, args.transcribe_latency, args.rekognition_latency)
+    uvicorn.run(app, host=args.host, port=args.port, log_config=None)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,35 @@
+import os
+
+import pytest
+from sqlalchemy import create_engine, event
+from sqlalchemy.orm import sessionmaker
+
+# Module-level clients read these when the app is imported
+os.environ.setdefault('AWS_REGION', 'us-east-1')
+os.environ.setdefault('GOOGLE_API_KEY', 'test')
+
+from app import database  # noqa: E402
+from app.services import job_queue  # noqa: E402
+
+
+@pytest.fixture
+def sessions(tmp_path, monkeypatch):
+    """
+    A session factory for a fresh SQLite file configured like the app's,
+    swapped in for the job queue's.
+    """
+    engine = create_engine(f"sqlite:///{tmp_path / 'test.db'}", connect_args={"check_same_thread": False})
+    event.listen(engine, "connect", database._configure_sqlite)
+    database.Base.metadata.create_all(engine)
+    factory = sessionmaker(autocommit=False, autoflush=False, bind=engine)
+    monkeypatch.setattr(job_queue, "SessionLocal", factory)
+    yield factory
+    engine.dispose()
+
+
+@pytest.fixture
+def handlers(monkeypatch):
+    """The job handler registry, emptied for the test."""
+    registry = {}
+    monkeypatch.setattr(job_queue, "_handlers", registry)
+    return registry
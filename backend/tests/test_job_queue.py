@@ -0,0 +1,253 @@
+import asyncio
+import io
+import threading
+from datetime import timedelta
+
+import pytest
+
+from app.models import AudioFile, Job, Transcription
+from app.services import job_queue
+from app.services.job_queue import (
+    FAILED,
+    QUEUED,
+    RUNNING,
+    SUCCEEDED,
+    JobRun,
+    JobWorker,
+    LeaseLost,
+    PermanentJobError
+)
+from app.services.uploads import store_audio_file
+
+KIND = 'test_job'
+
+
+def add_job(sessions, max_attempts: int = job_queue.JOB_MAX_ATTEMPTS, idempotency_key=None) -> int:
+    db = sessions()
+    try:
+        job = job_queue.enqueue(db, KIND, {"n": 1}, idempotency_key=idempotency_key, max_attempts=max_attempts)
+        db.commit()
+        return job.id
+    finally:
+        db.close()
+
+
+def load_job(sessions, job_id: int) -> Job:
+    db = sessions()
+    try:
+        return db.query(Job).filter(Job.id == job_id).one()
+    finally:
+        db.close()
+
+
+def run_attempt(worker: JobWorker, job_id: int):
+    """Claims ``job_id`` and runs that attempt to completion."""
+    assert worker._claim(1) == [job_id]
+    asyncio.run(worker._execute(job_id))
+
+
+def test_only_one_concurrent_claim_wins(sessions, handlers):
+    handlers[KIND] = None
+    job_id = add_job(sessions)
+    workers = [JobWorker() for _ in range(8)]
+    barrier = threading.Barrier(len(workers))
+    claims = {}
+
+    def claim(worker):
+        barrier.wait()
+        claims[worker.worker_id] = worker._claim(1)
+
+    threads = [threading.Thread(target=claim, args=(worker,)) for worker in workers]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    winners = [worker_id for worker_id, claimed in claims.items() if claimed == [job_id]]
+    assert len(winners) == 1
+    assert sum(len(claimed) for claimed in claims.values()) == 1
+    job = load_job(sessions, job_id)
+    assert job.status == RUNNING
+    assert job.locked_by == winners[0]
+    assert job.attempts == 1
+
+
+def test_lease_takeover_ends_first_attempt(sessions, handlers, monkeypatch):
+    monkeypatch.setattr(job_queue, "JOB_HEARTBEAT_SECONDS", 0.05)
+    started = threading.Event()
+
+    async def slow(run):
+        started.set()
+        await asyncio.sleep(30)
+
+    handlers[KIND] = slow
+    job_id = add_job(sessions)
+    first, second = JobWorker(), JobWorker()
+    assert first._claim(1) == [job_id]
+    db = sessions()
+    try:
+        run = JobRun(db.query(Job).filter(Job.id == job_id).one(), first.worker_id)
+        # The first worker stops reporting progress and its lease runs out
+        db.query(Job).filter(Job.id == job_id).update({
+            Job.locked_until: job_queue._utcnow() - timedelta(seconds=1)
+        })
+        db.commit()
+    finally:
+        db.close()
+    assert second._claim(1) == [job_id]
+
+    with pytest.raises(LeaseLost):
+        asyncio.run(asyncio.wait_for(first._run_with_heartbeat(run), 5))
+    assert started.is_set()
+    # Nor can the first attempt record progress or an outcome any more
+    with pytest.raises(LeaseLost):
+        run._save_stage("decode", {}, None)
+    first._finish(run, None, None)
+
+    job = load_job(sessions, job_id)
+    assert job.status == RUNNING
+    assert job.locked_by == second.worker_id
+    assert job.attempts == 2
+    assert job.stage is None
+
+
+def test_failed_attempt_is_retried_with_backoff(sessions, handlers, monkeypatch):
+    monkeypatch.setattr(job_queue, "JOB_RETRY_BASE_SECONDS", 10)
+
+    async def failing(run):
+        raise RuntimeError("transient")
+
+    handlers[KIND] = failing
+    job_id = add_job(sessions, max_attempts=2)
+    worker = JobWorker()
+
+    before = job_queue._utcnow()
+    run_attempt(worker, job_id)
+    job = load_job(sessions, job_id)
+    assert job.status == QUEUED
+    assert job.error == "transient"
+    assert job.locked_by is None
+    assert timedelta(seconds=5) <= job.run_after - before <= timedelta(seconds=11)
+    # Not due until the backoff has passed
+    assert worker._claim(1) == []
+
+    monkeypatch.setattr(job_queue, "_utcnow", lambda: job.run_after + timedelta(seconds=1))
+    run_attempt(worker, job_id)
+    job = load_job(sessions, job_id)
+    assert job.status == FAILED
+    assert job.attempts == 2
+    assert job.finished_at is not None
+
+
+def test_retry_delay_grows_and_is_capped(monkeypatch):
+    monkeypatch.setattr(job_queue, "JOB_RETRY_BASE_SECONDS", 5)
+    monkeypatch.setattr(job_queue, "JOB_RETRY_MAX_SECONDS", 60)
+    for attempts, ceiling in ((1, 5), (2, 10), (3, 20), (4, 40), (5, 60), (10, 60)):
+        for _ in range(20):
+            assert ceiling / 2 <= job_queue.retry_delay(attempts) <= ceiling
+    assert job_queue.retry_delay(1, minimum=30) == 30
+
+
+def test_permanent_error_fails_without_retrying(sessions, handlers):
+    async def undecodable(run):
+        raise PermanentJobError("cannot decode")
+
+    handlers[KIND] = undecodable
+    job_id = add_job(sessions, max_attempts=5)
+    worker = JobWorker()
+    run_attempt(worker, job_id)
+
+    job = load_job(sessions, job_id)
+    assert job.status == FAILED
+    assert job.error == "cannot decode"
+    assert job.attempts == 1
+    assert worker._claim(1) == []
+
+
+def test_retry_resumes_after_last_finished_stage(sessions, handlers, monkeypatch):
+    monkeypatch.setattr(job_queue, "JOB_RETRY_BASE_SECONDS", 0)
+    db = sessions()
+    try:
+        audio_file = AudioFile(filename="a.wav", content_type="audio/wav", duration=1, category="test")
+        db.add(audio_file)
+        db.commit()
+        audio_id = audio_file.id
+    finally:
+        db.close()
+    calls = {"transcribe": 0, "classify": 0}
+
+    async def pipeline(run):
+        async def transcribe():
+            calls["transcribe"] += 1
+            return {"text": "hello"}
+
+        async def classify():
+            calls["classify"] += 1
+            if calls["classify"] == 1:
+                raise RuntimeError("classifier unavailable")
+            return {"label": "ok"}
+
+        def store(db, value):
+            db.add(Transcription(audio_file_id=audio_id, text=value["text"]))
+
+        await run.stage("transcribe", transcribe, persist=store)
+        await run.stage("classify", classify)
+
+    handlers[KIND] = pipeline
+    job_id = add_job(sessions)
+    worker = JobWorker()
+
+    run_attempt(worker, job_id)
+    job = load_job(sessions, job_id)
+    assert job.status == QUEUED
+    assert job.stage == "transcribe"
+
+    run_attempt(worker, job_id)
+    job = load_job(sessions, job_id)
+    assert job.status == SUCCEEDED
+    assert job.stage == "classify"
+    assert job.attempts == 2
+    assert calls == {"transcribe": 1, "classify": 2}
+    db = sessions()
+    try:
+        assert db.query(Transcription).filter(Transcription.audio_file_id == audio_id).count() == 1
+    finally:
+        db.close()
+
+
+def test_idempotency_key_returns_the_first_job(sessions, handlers):
+    first = add_job(sessions, idempotency_key="upload:abc")
+    assert add_job(sessions, idempotency_key="upload:abc") == first
+    assert add_job(sessions, idempotency_key="upload:def") != first
+
+    # Whatever state the first job has reached
+    handlers[KIND] = lambda run: asyncio.sleep(0)
+    run_attempt(JobWorker(), first)
+    assert add_job(sessions, idempotency_key="upload:abc") == first
+    db = sessions()
+    try:
+        assert db.query(Job).filter(Job.idempotency_key == "upload:abc").count() == 1
+    finally:
+        db.close()
+
+
+def test_replayed_upload_returns_the_first_recording(sessions):
+    def upload():
+        db = sessions()
+        try:
+            audio_id, job = store_audio_file(
+                db, io.BytesIO(b"RIFF" * 256), 1024, "a.wav", "audio/wav",
+                "test", "", 1, is_temporary=False, idempotency_key="upload:abc"
+            )
+            db.commit()
+            return audio_id, job.id
+        finally:
+            db.close()
+
+    assert upload() == upload()
+    db = sessions()
+    try:
+        assert db.query(AudioFile).count() == 1
+        assert db.query(Job).count() == 1
+    finally:
+        db.close()